@@ -1,14 +1,21 @@
 # -*- coding:utf8 -*-
+import io
 import sys
+import time
 from os.path import dirname as d
 
 sys.path.append(d(d(__file__)))
 
 import click
 
+from pyl import tiering, optimize, hashcons
 from pyl.repl import repl
 from pyl.main import Evaluator
-from pyl.parse import parse_sequence
+from pyl.datatype import ProcedureBase
+from pyl.parse import parse, parse_sequence
+
+# --each-line 读写标准输入输出的缓冲区大小
+BUFFER_SIZE = 1 << 16
 
 
 @click.command()
@@ -16,14 +23,77 @@ from pyl.parse import parse_sequence
                 type=click.Path(exists=True, file_okay=True, dir_okay=False, readable=True),
                 required=False)
 @click.option('--analyze/--no-analyze', '-a/-A', 'analyze_or_not', default=True, help='analyze before evaluation or not')
-def pyl(lisp_file, analyze_or_not):
-    if lisp_file is None:
-        repl(bool_analyze=analyze_or_not)
-    else:
+@click.option('-O', '--optimize', 'optimize_or_not', is_flag=True,
+              help='fold constants and drop dead branches before evaluation (analyzer only)')
+@click.option('--inline/--no-inline', 'inline_or_not', default=True,
+              help='inline small global procedures when optimizing, turn off for debugging')
+@click.option('--inline-budget', type=int, default=optimize.config.inline_budget, show_default=True,
+              help='largest procedure body, in analyzer nodes, that may be inlined')
+@click.option('--tier-threshold', type=int, default=tiering.config.threshold, show_default=True,
+              help='calls before a procedure is compiled, 0 to never compile')
+@click.option('--trace-tiering', is_flag=True, help='report procedures as they are compiled')
+@click.option('-e', '--expression', help='evaluate EXPRESSION after LISP_FILE, if given, and print its value')
+@click.option('--each-line', is_flag=True,
+              help='EXPRESSION is a procedure: apply it to every line of stdin and print what it returns, '
+                   'lines returning #f are dropped')
+@click.option('--stats', is_flag=True, help='report lines per second of --each-line and objects shared by --hash-cons on stderr')
+@click.option('--hash-cons', 'hash_cons', is_flag=True,
+              help='share structurally equal atoms and lists while parsing; shared lists become constants')
+def pyl(lisp_file, analyze_or_not, optimize_or_not, inline_or_not, inline_budget, tier_threshold, trace_tiering,
+        expression, each_line, stats, hash_cons):
+    optimize.config.inline = inline_or_not
+    optimize.config.inline_budget = inline_budget
+    tiering.config.threshold = tier_threshold
+    tiering.config.enabled = tier_threshold > 0
+    hashcons.config.enabled = hash_cons
+    if trace_tiering:
+        tiering.listeners.append(lambda proc: click.echo('tier-up: {}'.format(proc), err=True))
+
+    if each_line and expression is None:
+        raise click.UsageError('--each-line needs a procedure given by -e')
+
+    if lisp_file is None and expression is None:
+        repl(bool_analyze=analyze_or_not, bool_optimize=optimize_or_not)
+        return
+
+    evaluator = Evaluator(bool_analyze=analyze_or_not, bool_optimize=optimize_or_not)
+    if lisp_file is not None:
         with open(lisp_file) as fd:
-            Evaluator(bool_analyze=analyze_or_not).eval_seq(
-                parse_sequence(fd.read())
-            )
+            evaluator.eval_seq(parse_sequence(fd.read()))
+
+    if expression is not None:
+        # 和文件共用同一个求值器：-O 时文件里重新绑定过的原始过程、全局过程，这里不会再折叠或内联
+        value = evaluator.eval(parse(expression))
+        if each_line:
+            run_each_line(evaluator, value, stats)
+        else:
+            click.echo(value)
+
+    if optimize_or_not and analyze_or_not:
+        click.echo('optimizer: {} nodes removed, {} calls inlined'.format(
+            optimize.stats['removed'], optimize.stats['inlined']), err=True)
+    if hash_cons and stats:
+        click.echo('hash-cons: {} objects shared'.format(hashcons.stats['shared']), err=True)
+
+
+def run_each_line(evaluator, procedure, stats):
+    if not isinstance(procedure, ProcedureBase):
+        raise click.UsageError('--each-line needs -e to evaluate to a procedure, got {}'.format(procedure))
+
+    # 按块读写，不一次读入整个输入；无法解码的字节原样保留，写回时还原
+    reader = io.open(sys.stdin.fileno(), 'r', buffering=BUFFER_SIZE, errors='surrogateescape', closefd=False)
+    writer = io.open(sys.stdout.fileno(), 'w', buffering=BUFFER_SIZE, errors='surrogateescape', closefd=False)
+
+    start = time.perf_counter()
+    try:
+        n = evaluator.each_line(procedure, reader, writer)
+    finally:
+        writer.flush()
+    elapsed = time.perf_counter() - start
+
+    if stats:
+        click.echo('each-line: {} lines in {:.3f}s, {:.0f} lines/s'.format(
+            n, elapsed, n / elapsed if elapsed else 0), err=True)
 
 
 if __name__ == '__main__':
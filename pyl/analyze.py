@@ -1,21 +1,25 @@
-from typing import Type, List
+import operator
+from typing import Type, List, Optional, Callable, Tuple, Dict
 
 from pyl.datatype import ComputationalObject, Expression, Number, String, Boolean, Symbol, ProcedureBase, Parameter, \
-    is_true, is_false, NIL
+    is_true, is_false, NIL, Vector, Pair
+from pyl.closure import Box, Scope
 from pyl.environment import Environment
 from pyl.helpers import list_to_pylist
-from pyl.lazy import Thunk
-from pyl.primitive import Primitive
+from pyl.lazy import Thunk, Promise
+from pyl.primitive import Primitive, primitives, call_with_escape
+from pyl.record import record_bindings
+from pyl import tiering
 from pyl.structure import SQuoted, SAssignment, SDefinition, SSequence, SIf, SLambda, SAnd, SOr, SCond, SApplication, \
-    SLet
+    SLet, SVariableDefinition, SNamedLet, SLetrec, SDo, SDelay, SConsStream, SRecordTypeDefinition, SLetEc
 
 
 def evaluate(expression: Expression, environment: Environment) -> ComputationalObject:
-    return analyze(expression).eval(environment)
+    return resolve(analyze(expression)).eval(environment)
 
 
 def evaluate_sequence(expression_lst: Expression, environment: Environment) -> ComputationalObject:
-    return analyze_sequence(expression_lst).eval(environment)
+    return resolve(analyze_sequence(expression_lst)).eval(environment)
 
 
 def analyze(expression: Expression) -> 'Analyzer':
@@ -29,6 +33,24 @@ def analyze_sequence(expression_lst: Expression) -> 'Analyzer':
     return analyze(SSequence(sequence=expression_lst).expression)
 
 
+def resolve(code: 'Analyzer') -> 'Analyzer':
+    """对顶层的分析树做闭包分析，顶层不在任何局部作用域里"""
+    code.resolve(None)
+    return code
+
+
+def internal_definitions(code: 'Analyzer') -> List[str]:
+    """在同一个框架里求值的部分中，由内部 define 绑定的名字"""
+    names = []
+    stack = [code]
+    while stack:
+        c = stack.pop()
+        if isinstance(c, (ADefinition, AVariableDefinition)):
+            names.append(c.name)
+        stack.extend(c.frame_children())
+    return names
+
+
 def classify(expression: Expression) -> Type['Analyzer']:
     ess = analyzer_class_lst
 
@@ -37,7 +59,13 @@ def classify(expression: Expression) -> Type['Analyzer']:
             return ac
 
 
+CompiledFunction = Callable[[Environment], ComputationalObject]
+
+
 class Analyzer(object):
+    # 过程体编译后的闭包，热点过程第一次升级时生成，缓存在分析树上供同一过程体的所有闭包共用
+    compiled: Optional[CompiledFunction] = None
+
     @classmethod
     def adapt(cls, expression: Expression) -> bool:
         raise NotImplementedError
@@ -45,9 +73,43 @@ class Analyzer(object):
     def eval(self, environment: Environment) -> ComputationalObject:
         raise NotImplementedError
 
+    def compile(self) -> CompiledFunction:
+        """编译成以环境为参数的 python 闭包，默认直接沿用 eval，常见结构各自生成更快的形式"""
+        return self.eval
+
+    def children(self) -> List['Analyzer']:
+        """直接子节点，供优化等遍历分析树的环节使用"""
+        return []
+
+    def frame_children(self) -> List['Analyzer']:
+        """与自身在同一个环境框架里求值的子节点，不包括新建框架（过程体、let 体）的部分"""
+        return self.children()
+
+    def resolve(self, scope: Optional[Scope]):
+        """闭包分析：在 scope 里解析变量引用，默认逐个分析子节点"""
+        for c in self.children():
+            c.resolve(scope)
+
+    def optimize(self, optimizer) -> 'Analyzer':
+        """返回优化后的节点（可以是自身，也可以是替换它的新节点），默认不做变换"""
+        return self
+
+    def replace_tail(self, replace: Callable[['Analyzer'], 'Analyzer']) -> 'Analyzer':
+        """把处在尾位置的子表达式交给 replace 替换，返回替换后的节点；默认自身就在尾位置"""
+        return replace(self)
+
+
+class CompiledCode(object):
+    """把编译后的闭包包装成与 Analyzer 相同的 eval 接口，以便放进 Thunk"""
+    __slots__ = ('eval',)
+
+    def __init__(self, function: CompiledFunction):
+        self.eval: CompiledFunction = function
+
 
 class Procedure(ProcedureBase):
-    def __init__(self, parameter: Parameter, body: Analyzer, environment: Environment):
+    def __init__(self, parameter: Parameter, body: Analyzer, environment: Environment, name: Optional[str] = None,
+                 box_names: Tuple[str, ...] = ()):
         assert isinstance(body, Analyzer)
         assert isinstance(environment, Environment)
 
@@ -55,6 +117,14 @@ class Procedure(ProcedureBase):
         self.code_lst = list_to_pylist(body)
         self.body: Analyzer = body
         self.environment: Environment = environment
+        self.name: Optional[str] = name
+        # 调用时要装箱的形参和内部 define 的名字
+        self.box_names: Tuple[str, ...] = box_names
+
+        # 同一过程体已经编译过（比如循环里反复创建的 lambda），直接使用编译后的形式
+        self.call_count: int = 0
+        self.tier: int = 1 if body.compiled else 0
+        self.run: CompiledFunction = body.compiled or body.eval
 
     @property
     def parameter(self) -> Parameter:
@@ -64,13 +134,46 @@ class Procedure(ProcedureBase):
         env = self.environment.extend()
         for param, arg in zip(self.parameter.names, arguments):
             env.set(param, arg)
-        return self.body.eval(env)
+        if self.box_names:
+            box_frame(env, self.box_names)
+
+        if not self.tier:
+            self.call_count += 1
+            if self.call_count >= tiering.config.threshold and tiering.config.enabled:
+                self.tier_up()
+
+        return self.run(env)
+
+    def tier_up(self):
+        """把过程体编译成闭包，替换掉之后调用使用的执行形式"""
+        if self.body.compiled is None:
+            self.body.compiled = self.body.compile()
+        self.run = self.body.compiled
+        self.tier = 1
+        tiering.report_tier_up(self)
+
+    def __str__(self):
+        return '#<procedure {}>'.format(self.name or 'anonymous')
+
+
+def box_frame(environment: Environment, names: Tuple[str, ...]):
+    """把当前框架里需要装箱的变量换成 Box，还没有绑定的（内部 define）先放一个空 Box"""
+    data = environment.frame.data
+    for name in names:
+        data[name] = Box(data.get(name))
+
+
+def capture(environment: Environment, free_names) -> Environment:
+    """新建过程时捕获的环境：做过闭包分析的只复制自由变量，否则沿用整个环境"""
+    if free_names is None:
+        return environment
+    return environment.capture(free_names)
 
 
 class ASelfEvaluating(Analyzer):
     @classmethod
     def adapt(cls, expression):
-        return isinstance(expression, (Number, String, Boolean))
+        return isinstance(expression, (Number, String, Boolean, Vector))
 
     def __init__(self, expression: Expression):
         self.value = expression
@@ -78,19 +181,37 @@ class ASelfEvaluating(Analyzer):
     def eval(self, environment):
         return self.value
 
+    def compile(self) -> CompiledFunction:
+        value = self.value
+        return lambda environment: value
+
 
 class AVariable(Analyzer):
     @classmethod
     def adapt(cls, expression):
         return isinstance(expression, Symbol)
 
+    boxed = False
+
     def __init__(self, expression):
         self.name = expression.value
 
     def eval(self, environment: Environment) -> ComputationalObject:
         ret = environment.get(self.name)
+        if self.boxed:
+            ret = ret.value
         return ret
 
+    def compile(self) -> CompiledFunction:
+        name = self.name
+        if self.boxed:
+            return lambda environment: environment.get(name).value
+        return lambda environment: environment.get(name)
+
+    def resolve(self, scope: Optional[Scope]):
+        if scope is not None:
+            scope.lookup(self.name, self)
+
 
 class AQuoted(Analyzer):
     @classmethod
@@ -98,47 +219,225 @@ class AQuoted(Analyzer):
         return SQuoted.adapt(expression)
 
     def __init__(self, expression):
+        # 开启 hash-consing 时这里就是解析器共享的那一份常量
         self.data = SQuoted(expression).quoted
 
     def eval(self, environment: Environment) -> ComputationalObject:
         return self.data
 
 
+class ADelay(Analyzer):
+    """(delay expression)
+
+    和 lambda 一样只捕获用到的自由变量：承诺不会拖住整条环境链，
+    也不受后续循环的影响
+    """
+
+    @classmethod
+    def adapt(cls, expression: Expression) -> bool:
+        return SDelay.adapt(expression)
+
+    def __init__(self, expression):
+        self.code = analyze(SDelay(expression).delayed)
+        self.free_names: Optional[Dict[str, int]] = None
+
+    def eval(self, environment: Environment) -> ComputationalObject:
+        return Promise(Thunk(self.code, capture(environment, self.free_names)))
+
+    def compile(self) -> CompiledFunction:
+        code, free_names = CompiledCode(self.code.compile()), self.free_names
+        return lambda environment: Promise(Thunk(code, capture(environment, free_names)))
+
+    def children(self) -> List[Analyzer]:
+        return [self.code]
+
+    def frame_children(self) -> List[Analyzer]:
+        return []
+
+    def resolve(self, scope: Optional[Scope]):
+        self.free_names = {}
+        inner = Scope([], scope, boundary=self)
+        self.code.resolve(inner)
+
+    def optimize(self, optimizer) -> Analyzer:
+        self.code = optimizer.optimize(self.code)
+        return self
+
+
+class AConsStream(Analyzer):
+    @classmethod
+    def adapt(cls, expression: Expression) -> bool:
+        return SConsStream.adapt(expression)
+
+    def __init__(self, expression):
+        c = SConsStream(expression)
+        self.head = analyze(c.head)
+        self.tail = ADelay(SDelay(delayed=c.tail).expression)
+
+    def eval(self, environment: Environment) -> ComputationalObject:
+        # 和 cons 一样，元素是求过值的；不留下引用当前环境的 thunk
+        return Pair(Thunk.force(self.head.eval(environment)), self.tail.eval(environment))
+
+    def compile(self) -> CompiledFunction:
+        head, tail = self.head.compile(), self.tail.compile()
+        force = Thunk.force
+        return lambda environment: Pair(force(head(environment)), tail(environment))
+
+    def children(self) -> List[Analyzer]:
+        return [self.head, self.tail]
+
+    def optimize(self, optimizer) -> Analyzer:
+        self.head = optimizer.optimize(self.head)
+        self.tail = optimizer.optimize(self.tail)
+        return self
+
+
 class AAssignment(Analyzer):
     @classmethod
     def adapt(cls, expression: Expression) -> bool:
         return SAssignment.adapt(expression)
 
+    boxed = False
+
     def __init__(self, expression):
         s = SAssignment(expression)
         self.name = s.variable_name.value
         self.value_code = analyze(s.assignment_body)
 
     def eval(self, environment: Environment) -> ComputationalObject:
-        environment.set(self.name, self.value_code.eval(environment))
+        value = self.value_code.eval(environment)
+        if self.boxed:
+            environment.get(self.name).value = value
+        else:
+            environment.assign(self.name, value)
         return Symbol('ok')
 
+    def children(self) -> List[Analyzer]:
+        return [self.value_code]
+
+    def resolve(self, scope: Optional[Scope]):
+        self.value_code.resolve(scope)
+        if scope is not None:
+            binding_scope = scope.lookup(self.name, self)
+            if binding_scope is not None:
+                binding_scope.mutated.add(self.name)
+
+    def optimize(self, optimizer) -> Analyzer:
+        self.value_code = optimizer.optimize(self.value_code)
+        return self
+
 
 class ADefinition(Analyzer):
     @classmethod
     def adapt(cls, expression: Expression) -> bool:
         return SDefinition.adapt(expression)
 
+    boxed = False
+
     def __init__(self, expression):
         d = SDefinition(expression)
         self.name = d.name.value
         self.parameter = d.parameter
         self.proc_code = analyze_sequence(d.body)
 
+        # 闭包分析的结果：自由变量及其在闭包元组里的下标，没做过分析时为 None
+        self.free_names: Optional[Dict[str, int]] = None
+        self.box_names: Tuple[str, ...] = ()
+
     def eval(self, environment: Environment) -> ComputationalObject:
         proc = Procedure(
             parameter=self.parameter,
             body=self.proc_code,
-            environment=environment
+            environment=capture(environment, self.free_names),
+            name=self.name,
+            box_names=self.box_names
         )
-        environment.set(self.name, proc)
+        if self.boxed:
+            environment.get(self.name).value = proc
+        else:
+            environment.set(self.name, proc)
+        return Symbol('ok')
+
+    def children(self) -> List[Analyzer]:
+        return [self.proc_code]
+
+    def frame_children(self) -> List[Analyzer]:
+        return []
+
+    def resolve(self, scope: Optional[Scope]):
+        if scope is not None:
+            scope.lookup(self.name, self)
+
+        self.free_names = {}
+        definitions = internal_definitions(self.proc_code)
+        inner = Scope(self.parameter.names + definitions, scope, boundary=self)
+        inner.mutated.update(definitions)
+        self.proc_code.resolve(inner)
+        self.box_names = tuple(inner.finish())
+
+    def optimize(self, optimizer) -> Analyzer:
+        self.proc_code = optimizer.optimize(self.proc_code)
+        return self
+
+
+class AVariableDefinition(Analyzer):
+    @classmethod
+    def adapt(cls, expression: Expression) -> bool:
+        return SVariableDefinition.adapt(expression)
+
+    boxed = False
+
+    def __init__(self, expression):
+        d = SVariableDefinition(expression)
+        self.name = d.name.value
+        self.value_code = analyze(d.value)
+
+    def eval(self, environment: Environment) -> ComputationalObject:
+        value = self.value_code.eval(environment)
+        if self.boxed:
+            environment.get(self.name).value = value
+        else:
+            environment.set(self.name, value)
         return Symbol('ok')
 
+    def children(self) -> List[Analyzer]:
+        return [self.value_code]
+
+    def resolve(self, scope: Optional[Scope]):
+        self.value_code.resolve(scope)
+        if scope is not None:
+            scope.lookup(self.name, self)
+
+    def optimize(self, optimizer) -> Analyzer:
+        self.value_code = optimizer.optimize(self.value_code)
+        return self
+
+
+class ARecordTypeDefinition(Analyzer):
+    """(define-record-type ...)
+
+    记录类型在分析时生成，各字段的槽位在这时就已确定，访问、修改过程直接读写槽位；
+    绑定各个名字的部分就是一组 (define 名字 常量)，内部定义、闭包分析和普通的 define 一样处理
+    同一段代码反复求值时共用同一个记录类型
+    """
+
+    @classmethod
+    def adapt(cls, expression: Expression) -> bool:
+        return SRecordTypeDefinition.adapt(expression)
+
+    def __init__(self, expression):
+        self.definitions: List[AVariableDefinition] = [
+            AVariableDefinition(SVariableDefinition(name=Symbol(name), value=SQuoted(quoted=value).expression).expression)
+            for name, value in record_bindings(SRecordTypeDefinition(expression))]
+
+    def eval(self, environment: Environment) -> ComputationalObject:
+        for d in self.definitions:
+            d.eval(environment)
+        return Symbol('ok')
+
+    def children(self) -> List[Analyzer]:
+        return list(self.definitions)
+
 
 class ASequence(Analyzer):
     @classmethod
@@ -155,6 +454,41 @@ class ASequence(Analyzer):
             o = c.eval(environment)
         return o
 
+    def compile(self) -> CompiledFunction:
+        code_lst = [c.compile() for c in self.sequence]
+        if len(code_lst) == 1:
+            return code_lst[0]
+
+        def run(environment):
+            o = NIL
+            for c in code_lst:
+                o = c(environment)
+            return o
+
+        return run
+
+    def children(self) -> List[Analyzer]:
+        return list(self.sequence)
+
+    def optimize(self, optimizer) -> Analyzer:
+        """展平嵌套的 begin，去掉非末尾的无副作用表达式，只剩一个表达式时不再包一层"""
+        sequence = []
+        for c in map(optimizer.optimize, self.sequence):
+            if isinstance(c, ASequence):
+                sequence.extend(c.sequence)
+            else:
+                sequence.append(c)
+
+        self.sequence = [c for c in sequence[:-1] if not optimizer.is_pure(c)] + sequence[-1:]
+        if len(self.sequence) == 1:
+            return self.sequence[0]
+        return self
+
+    def replace_tail(self, replace) -> Analyzer:
+        if self.sequence:
+            self.sequence[-1] = self.sequence[-1].replace_tail(replace)
+        return self
+
 
 class AIf(Analyzer):
     @classmethod
@@ -168,12 +502,51 @@ class AIf(Analyzer):
         self.alternative = analyze(i.alternative)
 
     def eval(self, environment: Environment) -> ComputationalObject:
-        if is_true(Thunk.force(self.cond.eval(environment))):
+        cond = Thunk.force(self.cond.eval(environment))
+        # 只有 #f 为假，布尔值直接看 value，省去构造 Boolean(False) 再比较
+        if type(cond) is not Boolean or cond.value:
             ret = self.consequence.eval(environment)
         else:
             ret = self.alternative.eval(environment)
         return ret
 
+    def compile(self) -> CompiledFunction:
+        cond = self.cond.compile()
+        consequence = self.consequence.compile()
+        alternative = self.alternative.compile()
+
+        def run(environment):
+            c = cond(environment)
+            if isinstance(c, Thunk):
+                c = c.result
+            if type(c) is not Boolean or c.value:
+                return consequence(environment)
+            return alternative(environment)
+
+        return run
+
+    def children(self) -> List[Analyzer]:
+        return [self.cond, self.consequence, self.alternative]
+
+    def optimize(self, optimizer) -> Analyzer:
+        self.cond = optimizer.optimize(self.cond)
+        if optimizer.is_literal(self.cond):
+            branch = self.consequence if optimizer.literal_is_true(self.cond) else self.alternative
+            return optimizer.optimize(branch)
+
+        self.consequence = optimizer.optimize(self.consequence)
+        self.alternative = optimizer.optimize(self.alternative)
+        if optimizer.is_constant(self.cond):
+            # 条件是折叠出来的常量：守卫成立时只求值选中的分支，否则整个 if 照常求值
+            branch = self.consequence if optimizer.literal_is_true(self.cond) else self.alternative
+            return optimizer.assume([], branch, self, [self.cond])
+        return self
+
+    def replace_tail(self, replace) -> Analyzer:
+        self.consequence = self.consequence.replace_tail(replace)
+        self.alternative = self.alternative.replace_tail(replace)
+        return self
+
 
 class ALambda(Analyzer):
     @classmethod
@@ -185,13 +558,35 @@ class ALambda(Analyzer):
         self.parameter = l.parameter
         self.body = analyze_sequence(l.body)
 
+        self.free_names: Optional[Dict[str, int]] = None
+        self.box_names: Tuple[str, ...] = ()
+
     def eval(self, environment: Environment) -> ComputationalObject:
         return Procedure(
             parameter=self.parameter,
             body=self.body,
-            environment=environment
+            environment=capture(environment, self.free_names),
+            box_names=self.box_names
         )
 
+    def children(self) -> List[Analyzer]:
+        return [self.body]
+
+    def frame_children(self) -> List[Analyzer]:
+        return []
+
+    def resolve(self, scope: Optional[Scope]):
+        self.free_names = {}
+        definitions = internal_definitions(self.body)
+        inner = Scope(self.parameter.names + definitions, scope, boundary=self)
+        inner.mutated.update(definitions)
+        self.body.resolve(inner)
+        self.box_names = tuple(inner.finish())
+
+    def optimize(self, optimizer) -> Analyzer:
+        self.body = optimizer.optimize(self.body)
+        return self
+
 
 class AAnd(Analyzer):
     @classmethod
@@ -207,6 +602,26 @@ class AAnd(Analyzer):
                 return Boolean(False)
         return Boolean(True)
 
+    def children(self) -> List[Analyzer]:
+        return list(self.item_lst)
+
+    def optimize(self, optimizer) -> Analyzer:
+        """字面量真值不影响结果，去掉；遇到字面量假值，之后的项不会再求值"""
+        item_lst = []
+        for item in map(optimizer.optimize, self.item_lst):
+            if not optimizer.is_literal(item):
+                item_lst.append(item)
+            elif not optimizer.literal_is_true(item):
+                item_lst.append(item)
+                break
+
+        if not item_lst:
+            return optimizer.literal(Boolean(True))
+        elif len(item_lst) == 1 and optimizer.is_literal(item_lst[0]):
+            return optimizer.literal(Boolean(False))
+        self.item_lst = item_lst
+        return self
+
 
 class AOr(Analyzer):
     @classmethod
@@ -222,6 +637,26 @@ class AOr(Analyzer):
                 return Boolean(True)
         return Boolean(False)
 
+    def children(self) -> List[Analyzer]:
+        return list(self.item_lst)
+
+    def optimize(self, optimizer) -> Analyzer:
+        """字面量假值不影响结果，去掉；遇到字面量真值，之后的项不会再求值"""
+        item_lst = []
+        for item in map(optimizer.optimize, self.item_lst):
+            if not optimizer.is_literal(item):
+                item_lst.append(item)
+            elif optimizer.literal_is_true(item):
+                item_lst.append(item)
+                break
+
+        if not item_lst:
+            return optimizer.literal(Boolean(False))
+        elif len(item_lst) == 1 and optimizer.is_literal(item_lst[0]):
+            return optimizer.literal(Boolean(True))
+        self.item_lst = item_lst
+        return self
+
 
 class ACond(Analyzer):
     @classmethod
@@ -257,6 +692,20 @@ class ACond(Analyzer):
     def eval(self, environment: Environment) -> ComputationalObject:
         return self.code.eval(environment)
 
+    def compile(self) -> CompiledFunction:
+        return self.code.compile()
+
+    def children(self) -> List[Analyzer]:
+        return [self.code]
+
+    def optimize(self, optimizer) -> Analyzer:
+        # cond 已经展开成 if，直接用优化后的 if 链替换自身
+        return optimizer.optimize(self.code)
+
+    def replace_tail(self, replace) -> Analyzer:
+        self.code = self.code.replace_tail(replace)
+        return self
+
 
 class AApplication(Analyzer):
     @classmethod
@@ -267,6 +716,7 @@ class AApplication(Analyzer):
         a = SApplication(expression)
         self.proc = analyze(a.procedure_expression)
         self.arg_lst = _mp(analyze, a.argument_lst)
+        self.arg_count = len(self.arg_lst)
 
     def eval(self, environment: Environment) -> ComputationalObject:
         proc = Thunk.force(self.proc.eval(environment))
@@ -274,7 +724,7 @@ class AApplication(Analyzer):
         # args = _mp(lambda x: x.eval(environment), self.arg_lst)
 
         if isinstance(proc, Primitive):
-            args = [Thunk.force(arg.eval(environment)) for arg in self.arg_lst]
+            return self.call_primitive(proc, environment)
         elif isinstance(proc, Procedure):
             args = [Thunk(arg, environment) for arg in self.arg_lst]
         else:
@@ -282,6 +732,160 @@ class AApplication(Analyzer):
 
         return proc.call(*args)
 
+    def call_primitive(self, proc: Primitive, environment: Environment) -> ComputationalObject:
+        """原始过程的参数立即求值；常见的一、两个参数直接传参，不构造列表再拆包"""
+        arg_lst = self.arg_lst
+        force = Thunk.force
+
+        if self.arg_count == 2:
+            return proc.call(force(arg_lst[0].eval(environment)), force(arg_lst[1].eval(environment)))
+        elif self.arg_count == 1:
+            return proc.call(force(arg_lst[0].eval(environment)))
+        return proc.call(*[force(arg.eval(environment)) for arg in arg_lst])
+
+    def compile(self) -> CompiledFunction:
+        proc_code = self.proc.compile()
+        arg_code_lst = [arg.compile() for arg in self.arg_lst]
+        thunk_code_lst = [CompiledCode(c) for c in arg_code_lst]
+        arg_count = self.arg_count
+        force = Thunk.force
+
+        def run(environment):
+            proc = proc_code(environment)
+            if isinstance(proc, Thunk):
+                proc = proc.result
+
+            if isinstance(proc, Primitive):
+                if arg_count == 2:
+                    return proc.call(force(arg_code_lst[0](environment)), force(arg_code_lst[1](environment)))
+                elif arg_count == 1:
+                    return proc.call(force(arg_code_lst[0](environment)))
+                return proc.call(*[force(c(environment)) for c in arg_code_lst])
+            elif isinstance(proc, Procedure):
+                return proc.call(*[Thunk(c, environment) for c in thunk_code_lst])
+            raise TypeError('{} is not a procedure and can not be called'.format(proc))
+
+        return run
+
+    def children(self) -> List[Analyzer]:
+        return [self.proc] + self.arg_lst
+
+    def optimize(self, optimizer) -> Analyzer:
+        """调用可以内联的小过程时展开其过程体；
+        参数全是字面量、且运算符是未被重新绑定的纯原始过程时，在分析期直接算出结果"""
+        self.proc = optimizer.optimize(self.proc)
+        self.arg_lst = _mp(optimizer.optimize, self.arg_lst)
+        self.arg_count = len(self.arg_lst)
+
+        inlined = optimizer.inline(self)
+        if inlined is not None:
+            return inlined
+
+        if isinstance(self.proc, AVariable) and optimizer.is_foldable(self.proc.name) \
+                and all(map(optimizer.is_constant, self.arg_lst)):
+            primitive = primitive_by_keyword[self.proc.name]
+            try:
+                value = primitive.call(*[optimizer.constant_value(arg) for arg in self.arg_lst])
+            except Exception:
+                # 比如除以零，留到运行时按原样报错
+                return self
+            # 之后的求值可能重新绑定这个原始过程，守卫不成立时照常调用
+            return optimizer.assume([BoundTo(self.proc.name, primitive)], optimizer.literal(value), self, self.arg_lst)
+
+        return self
+
+
+class AArithmeticApplication(AApplication):
+    """算术、比较原始过程调用点的特化
+
+    推测调用点的运算符仍绑定着内建的原始过程，且参数都是 Number：
+    守卫成立时直接对裸值运算，省去 isinstance 分派、参数列表和原始过程调用；守卫失败则退回通用的调用路径
+    字面量参数在分析时就取出，求值时不再经过分析树
+    """
+    operations = {
+        '+': (operator.add, Number),
+        '-': (operator.sub, Number),
+        '*': (operator.mul, Number),
+        'remainder': (operator.mod, Number),
+        '=': (operator.eq, Boolean),
+        '<': (operator.lt, Boolean),
+        '>': (operator.gt, Boolean),
+    }
+
+    @classmethod
+    def adapt(cls, expression: Expression) -> bool:
+        return SApplication.adapt(expression) \
+               and isinstance(expression.car, Symbol) \
+               and expression.car.value in cls.operations \
+               and len(list_to_pylist(expression.cdr)) == 2
+
+    def __init__(self, expression):
+        super(AArithmeticApplication, self).__init__(expression)
+        self.name = self.proc.name
+        self.primitive = primitive_by_keyword[self.name]
+        self.operate, self.box = self.operations[self.name]
+        self.left, self.right = self.arg_lst
+        self.left_literal = _literal_number(self.left)
+        self.right_literal = _literal_number(self.right)
+
+    def eval(self, environment: Environment) -> ComputationalObject:
+        proc = environment.get(self.name)
+        if proc is not self.primitive:
+            return super(AArithmeticApplication, self).eval(environment)
+
+        a = self.left_literal
+        if a is None:
+            a = self.left.eval(environment)
+            if isinstance(a, Thunk):
+                a = a.result
+
+        b = self.right_literal
+        if b is None:
+            b = self.right.eval(environment)
+            if isinstance(b, Thunk):
+                b = b.result
+
+        if type(a) is Number and type(b) is Number:
+            return self.box(self.operate(a.value, b.value))
+        return proc.call(a, b)
+
+    def compile(self) -> CompiledFunction:
+        name, primitive, operate, box = self.name, self.primitive, self.operate, self.box
+        generic = super(AArithmeticApplication, self).compile()
+        left_literal, right_literal = self.left_literal, self.right_literal
+        left, right = self.left.compile(), self.right.compile()
+
+        def run(environment):
+            proc = environment.get(name)
+            if proc is not primitive:
+                return generic(environment)
+
+            a = left_literal
+            if a is None:
+                a = left(environment)
+                if isinstance(a, Thunk):
+                    a = a.result
+
+            b = right_literal
+            if b is None:
+                b = right(environment)
+                if isinstance(b, Thunk):
+                    b = b.result
+
+            if type(a) is Number and type(b) is Number:
+                return box(operate(a.value, b.value))
+            return proc.call(a, b)
+
+        return run
+
+    def optimize(self, optimizer) -> Analyzer:
+        ret = super(AArithmeticApplication, self).optimize(optimizer)
+        if ret is self:
+            self.left, self.right = self.arg_lst
+            self.left_literal = _literal_number(self.left)
+            self.right_literal = _literal_number(self.right)
+        return ret
+
 
 class ALet(Analyzer):
     @classmethod
@@ -292,21 +896,501 @@ class ALet(Analyzer):
         l = SLet(expression)
         self.name_lst = _mp(lambda x: x[0], l.name_value_pair_lst)
         self.value_lst = _mp(lambda x: analyze(x[1]), l.name_value_pair_lst)
-        self.body = analyze(l.body)
+        self.body = analyze_sequence(l.body)
+        self.box_names: Tuple[str, ...] = ()
 
     def eval(self, environment: Environment) -> ComputationalObject:
         env = environment.extend()
         for name, value in zip(self.name_lst, self.value_lst):
             env.set(name.value, value.eval(environment))
+        if self.box_names:
+            box_frame(env, self.box_names)
+        return self.body.eval(env)
+
+    def children(self) -> List[Analyzer]:
+        return self.value_lst + [self.body]
+
+    def frame_children(self) -> List[Analyzer]:
+        return list(self.value_lst)
+
+    def resolve(self, scope: Optional[Scope]):
+        for value in self.value_lst:
+            value.resolve(scope)
+
+        definitions = internal_definitions(self.body)
+        inner = Scope([name.value for name in self.name_lst] + definitions, scope)
+        inner.mutated.update(definitions)
+        self.body.resolve(inner)
+        self.box_names = tuple(inner.finish())
+
+    def optimize(self, optimizer) -> Analyzer:
+        self.value_lst = _mp(optimizer.optimize, self.value_lst)
+        self.body = optimizer.optimize(self.body)
+        return self
+
+    def replace_tail(self, replace) -> Analyzer:
+        self.body = self.body.replace_tail(replace)
+        return self
+
+
+class ALetrec(Analyzer):
+    """(letrec ((name value) ...) body ...)，value 在新框架里求值，可以互相引用"""
+
+    @classmethod
+    def adapt(cls, expression: Expression) -> bool:
+        return SLetrec.adapt(expression)
+
+    def __init__(self, expression):
+        l = SLetrec(expression)
+        self.name_lst = _mp(lambda x: x[0].value, l.name_value_pair_lst)
+        self.value_lst = _mp(lambda x: analyze(x[1]), l.name_value_pair_lst)
+        self.body = analyze_sequence(l.body)
+        self.box_names: Tuple[str, ...] = ()
+
+    def eval(self, environment: Environment) -> ComputationalObject:
+        env = environment.extend()
+        if self.box_names:
+            box_frame(env, self.box_names)
+
+        for name, value in zip(self.name_lst, self.value_lst):
+            if name in self.box_names:
+                env.get(name).value = value.eval(env)
+            else:
+                env.set(name, value.eval(env))
+        return self.body.eval(env)
+
+    def children(self) -> List[Analyzer]:
+        return self.value_lst + [self.body]
+
+    def frame_children(self) -> List[Analyzer]:
+        return []
+
+    def resolve(self, scope: Optional[Scope]):
+        definitions = [name for c in self.value_lst + [self.body] for name in internal_definitions(c)]
+        inner = Scope(self.name_lst + definitions, scope)
+        # 绑定在求值 value 之后才填上，先创建的闭包要通过 Box 看到它们
+        inner.mutated.update(self.name_lst + definitions)
+        for c in self.children():
+            c.resolve(inner)
+        self.box_names = tuple(inner.finish())
+
+    def optimize(self, optimizer) -> Analyzer:
+        self.value_lst = _mp(optimizer.optimize, self.value_lst)
+        self.body = optimizer.optimize(self.body)
+        return self
+
+    def replace_tail(self, replace) -> Analyzer:
+        self.body = self.body.replace_tail(replace)
+        return self
+
+
+class BoundTo(object):
+    """守卫的假定：全局变量 name 仍绑定着 value，比如内建的原始过程"""
+    __slots__ = ('name', 'value')
+
+    def __init__(self, name: str, value):
+        self.name: str = name
+        self.value = value
+
+    def holds(self, environment: Environment) -> bool:
+        return environment.get(self.name) is self.value
+
+
+class DefinedBy(object):
+    """守卫的假定：全局变量 name 仍绑定着 definition 这个 define 创建的过程"""
+    __slots__ = ('name', 'definition')
+
+    def __init__(self, name: str, definition: 'ADefinition'):
+        self.name: str = name
+        self.definition: ADefinition = definition
+
+    def holds(self, environment: Environment) -> bool:
+        proc = environment.get(self.name)
+        return type(proc) is Procedure and proc.body is self.definition.proc_code
+
+
+class AGuarded(Analyzer):
+    """优化环节生成的守卫，没有对应的语法
+
+    折叠常量、删除死分支、内联全局过程时，都假定某些全局变量仍绑定着优化时的值；
+    之后的求值（比如 REPL 里后来输入的 define、set!）可能重新绑定它们。
+    求值时逐个确认假定，都成立就求值优化后的 fast，否则求值没有做这些变换的 fallback
+    """
+
+    def __init__(self, assumptions: Tuple, fast: Analyzer, fallback: Analyzer):
+        self.assumptions: Tuple = assumptions
+        self.fast: Analyzer = fast
+        self.fallback: Analyzer = fallback
+
+    def eval(self, environment: Environment) -> ComputationalObject:
+        for assumption in self.assumptions:
+            if not assumption.holds(environment):
+                return self.fallback.eval(environment)
+        return self.fast.eval(environment)
+
+    def compile(self) -> CompiledFunction:
+        assumptions = self.assumptions
+        fast, fallback = self.fast.compile(), self.fallback.compile()
+
+        def run(environment):
+            for assumption in assumptions:
+                if not assumption.holds(environment):
+                    return fallback(environment)
+            return fast(environment)
+
+        return run
+
+    def children(self) -> List[Analyzer]:
+        return [self.fast, self.fallback]
+
+    def replace_tail(self, replace) -> Analyzer:
+        self.fast = self.fast.replace_tail(replace)
+        self.fallback = self.fallback.replace_tail(replace)
+        return self
+
+
+class LoopJump(object):
+    """循环体在尾位置调用循环自身时的返回值，带着下一轮的绑定回到循环驱动处"""
+    __slots__ = ('values',)
+
+    def __init__(self, values: List[ComputationalObject]):
+        self.values: List[ComputationalObject] = values
+
+
+class ALoopJump(Analyzer):
+    """尾位置上对循环自身的调用，只由 ANamedLet 生成，没有对应的语法
+
+    参数在这里立即求值，下一轮的变量直接绑定到值上，不会一轮套一轮地串起 thunk
+    """
+
+    def __init__(self, arg_lst: List[Analyzer]):
+        self.arg_lst: List[Analyzer] = arg_lst
+
+    def eval(self, environment: Environment) -> ComputationalObject:
+        return LoopJump([Thunk.force(arg.eval(environment)) for arg in self.arg_lst])
+
+    def compile(self) -> CompiledFunction:
+        arg_code_lst = [arg.compile() for arg in self.arg_lst]
+        force = Thunk.force
+        return lambda environment: LoopJump([force(c(environment)) for c in arg_code_lst])
+
+    def children(self) -> List[Analyzer]:
+        return list(self.arg_lst)
+
+    def optimize(self, optimizer) -> Analyzer:
+        self.arg_lst = _mp(optimizer.optimize, self.arg_lst)
+        return self
+
+
+def bind_iteration(environment: Environment, names: List[str], values, box_names: Tuple[str, ...]) -> Environment:
+    """为新一轮循环扩展出一层框架绑定变量
+
+    不清空复用上一轮的框架：上一轮传给过程的 thunk、创建的闭包和承诺仍指向自己那一轮的绑定
+    """
+    env = environment.extend()
+    env.frame.data.update(zip(names, values))
+    if box_names:
+        box_frame(env, box_names)
+    return env
+
+
+def run_loop(environment: Environment, names: List[str], init_lst: List[CompiledFunction], body: CompiledFunction,
+             box_names: Tuple[str, ...]) -> ComputationalObject:
+    """命名 let 的循环驱动：循环体返回 LoopJump 就在新的一层框架里绑定变量，再跑一轮，不增长 python 的调用栈"""
+    env = bind_iteration(environment, names, [init(environment) for init in init_lst], box_names)
+
+    while True:
+        ret = body(env)
+        if type(ret) is not LoopJump:
+            return ret
+        env = bind_iteration(environment, names, ret.values, box_names)
+
+
+class ANamedLet(Analyzer):
+    """(let name ((var init) ...) body ...)
+
+    name 只在过程体的尾位置以正确的参数个数调用时，编译成循环：尾调用换成 ALoopJump，
+    不再创建过程，也不增长 python 的调用栈；否则按 letrec 绑定一个过程再调用
+    """
+
+    @classmethod
+    def adapt(cls, expression: Expression) -> bool:
+        return SNamedLet.adapt(expression)
+
+    boxed = False
+
+    def __init__(self, expression):
+        l = SNamedLet(expression)
+        self.name = l.name.value
+        self.parameter = Parameter([name.value for name, _ in l.name_value_pair_lst])
+        self.value_lst = _mp(lambda x: analyze(x[1]), l.name_value_pair_lst)
+        self.body = analyze_sequence(l.body)
+
+        tail_calls = []
+
+        def collect(code):
+            if self._is_self_call(code):
+                tail_calls.append(code)
+            return code
+
+        self.body.replace_tail(collect)
+        # 名字出现的次数和尾调用的个数相同，说明既没有别的用法，也没有被内层绑定遮蔽
+        self.is_loop = len(tail_calls) == _count_symbol(l.body, self.name)
+        if self.is_loop:
+            self.body = self.body.replace_tail(lambda c: ALoopJump(c.arg_lst) if self._is_self_call(c) else c)
+
+        self.free_names: Optional[Dict[str, int]] = None
+        self.box_names: Tuple[str, ...] = ()
+
+    def _is_self_call(self, code: Analyzer) -> bool:
+        return isinstance(code, AApplication) and isinstance(code.proc, AVariable) \
+               and code.proc.name == self.name and code.arg_count == len(self.parameter.names)
+
+    def eval(self, environment: Environment) -> ComputationalObject:
+        if self.is_loop:
+            return run_loop(environment, self.parameter.names, [v.eval for v in self.value_lst], self.body.eval,
+                            self.box_names)
+
+        env = environment.extend()
+        if self.boxed:
+            env.set(self.name, Box())
+        proc = Procedure(
+            parameter=self.parameter,
+            body=self.body,
+            environment=capture(env, self.free_names),
+            name=self.name,
+            box_names=self.box_names
+        )
+        if self.boxed:
+            env.get(self.name).value = proc
+        else:
+            env.set(self.name, proc)
+        return proc.call(*[v.eval(environment) for v in self.value_lst])
+
+    def compile(self) -> CompiledFunction:
+        if not self.is_loop:
+            return self.eval
+
+        names, box_names = self.parameter.names, self.box_names
+        init_lst = [v.compile() for v in self.value_lst]
+        body = self.body.compile()
+        return lambda environment: run_loop(environment, names, init_lst, body, box_names)
+
+    def children(self) -> List[Analyzer]:
+        return self.value_lst + [self.body]
+
+    def frame_children(self) -> List[Analyzer]:
+        return list(self.value_lst)
+
+    def resolve(self, scope: Optional[Scope]):
+        for value in self.value_lst:
+            value.resolve(scope)
+
+        definitions = internal_definitions(self.body)
+        if self.is_loop:
+            inner = Scope(self.parameter.names + definitions, scope)
+        else:
+            # 过程体里引用 name 都会跨过过程边界；name 在过程创建之后才绑定，被捕获时要装箱
+            frame = Scope([self.name], scope)
+            frame.mutated.add(self.name)
+            frame.lookup(self.name, self)
+            self.free_names = {}
+            inner = Scope(self.parameter.names + definitions, frame, boundary=self)
+
+        inner.mutated.update(definitions)
+        self.body.resolve(inner)
+        self.box_names = tuple(inner.finish())
+        if not self.is_loop:
+            frame.finish()
+
+    def optimize(self, optimizer) -> Analyzer:
+        self.value_lst = _mp(optimizer.optimize, self.value_lst)
+        self.body = optimizer.optimize(self.body)
+        return self
+
+
+def run_do(environment: Environment, names: List[str], init_lst: List[CompiledFunction], test: CompiledFunction,
+           body: CompiledFunction, step_lst: List[CompiledFunction], result: Optional[CompiledFunction],
+           box_names: Tuple[str, ...]) -> ComputationalObject:
+    env = bind_iteration(environment, names, [init(environment) for init in init_lst], box_names)
+
+    while True:
+        c = test(env)
+        if isinstance(c, Thunk):
+            c = c.result
+        if type(c) is not Boolean or c.value:
+            break
+
+        body(env)
+        # 先用这一轮的绑定求出所有 step，再统一换成下一轮
+        env = bind_iteration(environment, names, [Thunk.force(step(env)) for step in step_lst], box_names)
+
+    if result is None:
+        return Symbol('ok')
+    return result(env)
+
+
+class ALetEc(Analyzer):
+    """(let/ec name body ...)，不经过 lambda 和 call/ec 的过程调用，直接在新框架里绑定逃逸续延"""
+
+    @classmethod
+    def adapt(cls, expression: Expression) -> bool:
+        return SLetEc.adapt(expression)
+
+    def __init__(self, expression):
+        l = SLetEc(expression)
+        self.name = l.name.value
+        self.body = analyze_sequence(l.body)
+        self.box_names: Tuple[str, ...] = ()
+
+    def eval(self, environment: Environment) -> ComputationalObject:
+        return run_let_ec(environment, self.name, self.body.eval, self.box_names)
+
+    def compile(self) -> CompiledFunction:
+        name, body, box_names = self.name, self.body.compile(), self.box_names
+        return lambda environment: run_let_ec(environment, name, body, box_names)
+
+    def children(self) -> List[Analyzer]:
+        return [self.body]
+
+    def frame_children(self) -> List[Analyzer]:
+        return []
+
+    def resolve(self, scope: Optional[Scope]):
+        definitions = internal_definitions(self.body)
+        inner = Scope([self.name] + definitions, scope)
+        inner.mutated.update(definitions)
+        self.body.resolve(inner)
+        self.box_names = tuple(inner.finish())
+
+    def optimize(self, optimizer) -> Analyzer:
+        self.body = optimizer.optimize(self.body)
+        return self
+
+
+def run_let_ec(environment: Environment, name: str, body: CompiledFunction, box_names: Tuple[str, ...]):
+    def run(k):
+        env = environment.extend()
+        env.set(name, k)
+        if box_names:
+            box_frame(env, box_names)
+        return body(env)
+
+    return call_with_escape(run)
+
+
+class ADo(Analyzer):
+    """(do ((var init step) ...) (test result ...) command ...)，直接编译成循环，每轮新建一层框架"""
+
+    @classmethod
+    def adapt(cls, expression: Expression) -> bool:
+        return SDo.adapt(expression)
+
+    def __init__(self, expression):
+        d = SDo(expression)
+        self.name_lst = [name.value for name, _, _ in d.variable_lst]
+        self.init_lst = [analyze(init) for _, init, _ in d.variable_lst]
+        # 没有 step 的变量保持原值，即以变量自身为 step
+        self.step_lst = [analyze(name if step is None else step) for name, _, step in d.variable_lst]
+        self.test = analyze(d.test)
+        self.body = analyze_sequence(d.body)
+        self.result = None if d.result is NIL else analyze_sequence(d.result)
+        self.box_names: Tuple[str, ...] = ()
+
+    def _loop_children(self) -> List[Analyzer]:
+        return [self.test, self.body] + self.step_lst + ([self.result] if self.result else [])
+
+    def eval(self, environment: Environment) -> ComputationalObject:
+        return run_do(environment, self.name_lst, [c.eval for c in self.init_lst], self.test.eval, self.body.eval,
+                      [c.eval for c in self.step_lst], self.result and self.result.eval, self.box_names)
+
+    def compile(self) -> CompiledFunction:
+        name_lst, box_names = self.name_lst, self.box_names
+        init_lst = [c.compile() for c in self.init_lst]
+        test, body = self.test.compile(), self.body.compile()
+        step_lst = [c.compile() for c in self.step_lst]
+        result = self.result and self.result.compile()
+        return lambda environment: run_do(environment, name_lst, init_lst, test, body, step_lst, result, box_names)
+
+    def children(self) -> List[Analyzer]:
+        return self.init_lst + self._loop_children()
+
+    def frame_children(self) -> List[Analyzer]:
+        return list(self.init_lst)
+
+    def resolve(self, scope: Optional[Scope]):
+        for init in self.init_lst:
+            init.resolve(scope)
+
+        definitions = internal_definitions(self.body)
+        inner = Scope(self.name_lst + definitions, scope)
+        inner.mutated.update(definitions)
+        for c in self._loop_children():
+            c.resolve(inner)
+        self.box_names = tuple(inner.finish())
+
+    def optimize(self, optimizer) -> Analyzer:
+        self.init_lst = _mp(optimizer.optimize, self.init_lst)
+        self.step_lst = _mp(optimizer.optimize, self.step_lst)
+        self.test = optimizer.optimize(self.test)
+        self.body = optimizer.optimize(self.body)
+        if self.result is not None:
+            self.result = optimizer.optimize(self.result)
+        return self
+
+
+class AInlinedCall(Analyzer):
+    """内联展开的过程调用，只由优化环节生成，没有对应的语法
+
+    能直接代入的参数已经替换进过程体；需要多次使用的复杂参数仍按需求值：
+    以改过名的形参绑定到 thunk 上，过程体在扩展出的一层环境里求值
+    """
+
+    def __init__(self, binding_lst: List[Tuple[str, Analyzer]], body: Analyzer):
+        self.binding_lst: List[Tuple[str, Analyzer]] = binding_lst
+        self.body: Analyzer = body
+
+    def eval(self, environment: Environment) -> ComputationalObject:
+        env = environment.extend()
+        for name, arg in self.binding_lst:
+            env.set(name, Thunk(arg, environment))
         return self.body.eval(env)
 
+    def compile(self) -> CompiledFunction:
+        binding_lst = [(name, CompiledCode(arg.compile())) for name, arg in self.binding_lst]
+        body = self.body.compile()
+
+        def run(environment):
+            env = environment.extend()
+            for name, arg in binding_lst:
+                env.set(name, Thunk(arg, environment))
+            return body(env)
+
+        return run
+
+    def children(self) -> List[Analyzer]:
+        return [arg for _, arg in self.binding_lst] + [self.body]
+
+    def frame_children(self) -> List[Analyzer]:
+        return [arg for _, arg in self.binding_lst]
+
+    def resolve(self, scope: Optional[Scope]):
+        for _, arg in self.binding_lst:
+            arg.resolve(scope)
+        # 可内联的过程体里没有 lambda，也没有 set!，改过名的形参不会被捕获或修改，无需装箱
+        self.body.resolve(Scope([name for name, _ in self.binding_lst], scope))
+
 
 analyzer_class_lst = [
     ASelfEvaluating,
     AVariable,
     AQuoted,
+    ADelay,
+    AConsStream,
     AAssignment,
     ADefinition,
+    AVariableDefinition,
+    ARecordTypeDefinition,
     ASequence,
     AIf,
     ALambda,
@@ -314,9 +1398,39 @@ analyzer_class_lst = [
     AOr,
     ACond,
     ALet,
+    ANamedLet,
+    ALetrec,
+    ADo,
+    ALetEc,
+    AArithmeticApplication,
     AApplication,
 ]
 
 
+primitive_by_keyword = {p.keyword: p for p in primitives}
+
+
+def _literal_number(code: Analyzer) -> Optional[Number]:
+    """字面量数字直接返回，否则返回 None"""
+    if isinstance(code, ASelfEvaluating) and type(code.value) is Number:
+        return code.value
+    return None
+
+
+def _count_symbol(expression: Expression, name: str) -> int:
+    """名字在表达式里作为符号出现的次数，跳过 quote 里的数据"""
+    n = 0
+    stack = [expression]
+    while stack:
+        e = stack.pop()
+        if isinstance(e, Symbol):
+            n += e.value == name
+        elif isinstance(e, Pair) and not SQuoted.adapt(e):
+            while isinstance(e, Pair):
+                stack.append(e.car)
+                e = e.cdr
+    return n
+
+
 def _mp(*args, **kwargs):
     return list(map(*args, **kwargs))
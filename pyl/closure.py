@@ -0,0 +1,67 @@
+# -*- coding:utf8 -*-
+
+"""闭包分析
+
+在分析树上做一遍作用域分析，算出每个 lambda / define 用到的外层局部变量（自由变量），
+使过程只捕获这些变量，而不是整条环境链
+
+被闭包捕获、又会被 set! 或内部 define 修改的变量放进 Box：
+绑定它的框架里存 Box，各个闭包复制的也是同一个 Box，修改对所有闭包可见
+"""
+
+from collections import defaultdict
+from typing import Optional, Set, Iterable, Dict, List, Any
+
+
+class Box(object):
+    """可变变量的存储单元"""
+    __slots__ = ('value',)
+
+    def __init__(self, value: Any = None):
+        self.value: Any = value
+
+
+class Scope(object):
+    """一层局部作用域，对应运行时的一个环境框架
+
+    boundary 是创建这层作用域的过程节点（lambda / define），let 等不跨过程的作用域为 None；
+    从内层查找变量跨过 boundary 时，说明变量被那个过程捕获
+    """
+
+    def __init__(self, names: Iterable[str], parent: Optional['Scope'], boundary=None):
+        self.names: Set[str] = set(names)
+        self.parent: Optional[Scope] = parent
+        self.boundary = boundary
+
+        # 解析到这层作用域的变量节点，装箱时要一并标记
+        self.references: Dict[str, List] = defaultdict(list)
+        self.mutated: Set[str] = set()
+        self.captured: Set[str] = set()
+
+    def lookup(self, name: str, node) -> Optional['Scope']:
+        """查找绑定 name 的作用域，记下引用它的节点和沿途捕获它的过程；全局变量返回 None"""
+        crossed = []
+
+        scope = self
+        while scope is not None:
+            if name in scope.names:
+                scope.references[name].append(node)
+                if crossed:
+                    scope.captured.add(name)
+                for proc in crossed:
+                    proc.free_names.setdefault(name, len(proc.free_names))
+                return scope
+
+            if scope.boundary is not None:
+                crossed.append(scope.boundary)
+            scope = scope.parent
+
+        return None
+
+    def finish(self) -> List[str]:
+        """作用域分析完毕：既被捕获又被修改的变量需要装箱，标记引用它们的节点，返回这些名字"""
+        boxed = sorted(self.mutated & self.captured)
+        for name in boxed:
+            for node in self.references[name]:
+                node.boxed = True
+        return boxed
@@ -2,13 +2,24 @@
 
 """基础数据结构"""
 
-from typing import Union, List
+import operator
+import struct
+from array import array
+from bisect import bisect_left, insort
+from typing import Union, List, Optional, Dict, Sequence, Tuple, Callable
 
 
 class ComputationalObject(object):
+    # 空的 __slots__：各子类照常带 __dict__，声明了 __slots__ 的子类（比如记录类型）可以不带
+    __slots__ = ()
+
     def __eq__(self, other):
         return self.__class__ == other.__class__ and self.__dict__ == other.__dict__
 
+    def __hash__(self):
+        # 与 __eq__ 保持一致的保守实现，可作 key 的类型各自覆盖
+        return hash(self.__class__)
+
 
 Expression = ComputationalObject
 
@@ -17,6 +28,9 @@ class Symbol(ComputationalObject):
     def __init__(self, value: str):
         self.value: str = value
 
+    def __hash__(self):
+        return hash((self.__class__, self.value))
+
     def __str__(self):
         return self.value
 
@@ -25,22 +39,132 @@ class Number(ComputationalObject):
     def __init__(self, value: int):
         self.value: int = value
 
+    def __hash__(self):
+        return hash((self.__class__, self.value))
+
     def __str__(self):
         return str(self.value)
 
 
 class String(ComputationalObject):
-    def __init__(self, value: str):
-        self.value: str = value
+    """字符串
+
+    string-append 和 substring 的结果先不拼接、不复制：拼接记下各部分（rope），子串记下原串和起止位置，
+    长度总是 O(1)；第一次取 value 时才展开成一个 str 并缓存，同时放开对各部分的引用
+    """
+
+    def __init__(self, value: Optional[str] = None):
+        self._value: Optional[str] = value
+        # 未展开的拼接：各部分；未展开的子串：(原串, 起, 止)，原串总是已经展开的
+        self._parts: Optional[Tuple['String', ...]] = None
+        self._slice: Optional[Tuple['String', int, int]] = None
+        self._length: int = len(value) if value is not None else 0
+
+    @classmethod
+    def concat(cls, parts: Sequence['String']) -> 'String':
+        parts = tuple(p for p in parts if p._length)
+        if len(parts) == 1:
+            return parts[0]
+        s = cls()
+        if parts:
+            s._parts = parts
+            s._length = sum(p._length for p in parts)
+        else:
+            s._value = ''
+        return s
+
+    def substring(self, start: int, end: int) -> 'String':
+        """[start, end) 的子串，不复制字符；拼接出来的字符串先展开一次（结果缓存）"""
+        if not 0 <= start <= end <= self._length:
+            raise IndexError('substring: range [{}, {}) out of range for length {}'.format(start, end, self._length))
+        if start == 0 and end == self._length:
+            return self
+
+        base = self
+        if self._slice is not None:
+            base, offset, _ = self._slice
+            start, end = start + offset, end + offset
+        elif self._value is None:
+            self._flatten()
+
+        s = String()
+        s._slice = (base, start, end)
+        s._length = end - start
+        return s
+
+    def length(self) -> int:
+        return self._length
+
+    def ref(self, index: int) -> str:
+        if not 0 <= index < self._length:
+            raise IndexError('string index {} out of range'.format(index))
+        if self._slice is not None:
+            base, start, _ = self._slice
+            return base._value[start + index]
+        return self.value[index]
+
+    @property
+    def value(self) -> str:
+        if self._value is None:
+            self._flatten()
+        return self._value
+
+    def _flatten(self):
+        # 显式的栈，一次次 string-append 出来的很深的 rope 也不会爆栈
+        pieces = []
+        stack = [self]
+        while stack:
+            s = stack.pop()
+            if s._value is not None:
+                pieces.append(s._value)
+            elif s._parts is not None:
+                stack.extend(reversed(s._parts))
+            else:
+                base, start, end = s._slice
+                pieces.append(base._value[start:end])
+
+        self._value = ''.join(pieces)
+        self._parts = None
+        self._slice = None
+
+    def __eq__(self, other):
+        return isinstance(other, String) and self._length == other._length and self.value == other.value
+
+    def __hash__(self):
+        return hash((self.__class__, self.value))
+
+    def __str__(self):
+        return '"%s"' % self.value.replace('\\', '\\\\').replace('"', '\\"')
+
+
+class StringBuilder(ComputationalObject):
+    """逐段累积字符串，追加是均摊 O(1)，取结果时只拼接一次"""
+
+    def __init__(self):
+        self.parts: List[String] = []
+        self._length: int = 0
+
+    def append(self, s: String):
+        self.parts.append(s)
+        self._length += s.length()
+
+    def length(self) -> int:
+        return self._length
+
+    def build(self) -> String:
+        return String(''.join(p.value for p in self.parts))
 
     def __str__(self):
-        return '"%s"' % self.value
+        return '#<string-builder {}>'.format(self._length)
 
 
 class Boolean(ComputationalObject):
     def __init__(self, value: bool):
         self.value: bool = value
 
+    def __hash__(self):
+        return hash((self.__class__, self.value))
+
     def __str__(self):
         return '#f' if not self.value else '#t'
 
@@ -50,27 +174,109 @@ class Pair(ComputationalObject):
         self.car: ComputationalObject = car
         self.cdr: ComputationalObject = cdr
 
-    def format(self, closed=True):
-        car = str(self.car)
+    def __str__(self):
+        from .printer import to_string
+        return to_string(self)
 
-        if isinstance(self.cdr, Pair):
-            cdr = self.cdr.format(closed=False)
-            ret = '{} {}'.format(car, cdr)
+    def __eq__(self, other):
+        """结构相等，不区分 Pair 链和 CompactList；迭代比较，长表、深表都不会爆栈"""
+        return structurally_equal(self, other, operator.eq)
 
-        elif isinstance(self.cdr, Nil):
-            ret = car
+    def __hash__(self):
+        """结构哈希：与 __eq__ 一致，结构相同的表哈希相同，不论是 Pair 链还是 CompactList"""
+        return structural_hash(self)
 
-        else:
-            cdr = str(self.cdr)
-            ret = '{} . {}'.format(car, cdr)
 
-        if closed:
-            ret = '({})'.format(ret)
+_PAIR_HASH_MARK = hash('pair')
+_VECTOR_HASH_MARK = hash('vector')
 
-        return ret
 
-    def __str__(self):
-        return self.format(closed=True)
+class CompactCells(object):
+    """CompactList 共享的存储：元素连续放在 list 里；被 set-cdr! 改过（或非真表结尾）的位置，其 cdr 记在 tails 里
+
+    ends 是 tails 里的位置从小到大排好的列表，二分查找某个位置之后的第一段结尾，改过多少次 cdr 都不用逐个扫描
+    frozen 的存储是共享的常量（见 hashcons），不能修改，结构哈希只算一次
+    """
+    __slots__ = ('items', 'tails', 'ends', 'frozen', 'hash')
+
+    def __init__(self, items: List[ComputationalObject], tails: Dict[int, ComputationalObject]):
+        self.items: List[ComputationalObject] = items
+        self.tails: Dict[int, ComputationalObject] = tails
+        self.ends: List[int] = sorted(tails)
+        self.frozen: bool = False
+        # frozen 时缓存整个表的结构哈希
+        self.hash: Optional[int] = None
+
+    def check_mutable(self):
+        if self.frozen:
+            raise TypeError('can not modify a shared constant list')
+
+
+class CompactList(Pair):
+    """cdr 编码的列表，用于解析器输出和引用的常量
+
+    一整段元素放在一个数组里，不为每个元素建一个序对；car / cdr 是数组上的视图，cdr 每次返回新的视图对象
+    长度和下标访问是 O(1)（见 helpers 里的 list_length、list_tail）
+    在前面 cons 就是普通的 Pair；改 car 直接写数组，改 cdr 记到 tails 里，
+    之后走到这个位置就接上新的 cdr，共享同一段存储的所有视图都能看到修改
+    """
+    __slots__ = ('cells', 'start')
+
+    def __init__(self, cells: CompactCells, start: int = 0):
+        self.cells: CompactCells = cells
+        self.start: int = start
+
+    @property
+    def car(self) -> ComputationalObject:
+        return self.cells.items[self.start]
+
+    @car.setter
+    def car(self, o: ComputationalObject):
+        self.cells.check_mutable()
+        self.cells.items[self.start] = o
+
+    @property
+    def cdr(self) -> ComputationalObject:
+        cells = self.cells
+        if cells.tails and self.start in cells.tails:
+            return cells.tails[self.start]
+        if self.start + 1 < len(cells.items):
+            return CompactList(cells, self.start + 1)
+        return NIL
+
+    @cdr.setter
+    def cdr(self, o: ComputationalObject):
+        cells = self.cells
+        cells.check_mutable()
+        if self.start not in cells.tails:
+            insort(cells.ends, self.start)
+        cells.tails[self.start] = o
+
+    def segment(self) -> Tuple[int, ComputationalObject]:
+        """从 start 起连续存放的一段的结束位置（不含），以及这段之后的 cdr"""
+        cells = self.cells
+        if cells.ends:
+            i = bisect_left(cells.ends, self.start)
+            if i < len(cells.ends):
+                end = cells.ends[i]
+                return end + 1, cells.tails[end]
+        return len(cells.items), NIL
+
+    def unpack(self) -> Tuple[List[ComputationalObject], ComputationalObject]:
+        """连续存放的一段元素，以及这段之后的 cdr"""
+        end, rest = self.segment()
+        return self.cells.items[self.start:end], rest
+
+
+def compact_list(elements: Sequence[ComputationalObject], tail: 'ComputationalObject' = None) -> ComputationalObject:
+    """用 elements 建一个 CompactList，tail 为结尾的 cdr，默认是空表"""
+    if not elements:
+        return NIL if tail is None else tail
+
+    tails = {}
+    if tail is not None and tail is not NIL:
+        tails[len(elements) - 1] = tail
+    return CompactList(CompactCells(list(elements), tails))
 
 
 class Nil(ComputationalObject):
@@ -83,6 +289,330 @@ NIL = Nil()
 LispList = Union[Pair, Nil]
 
 
+class HashTable(ComputationalObject):
+    """哈希表，以 python dict 为底层存储，key 依赖各类型的 __hash__"""
+
+    def __init__(self, table: Optional[Dict[ComputationalObject, ComputationalObject]] = None):
+        self.table: Dict[ComputationalObject, ComputationalObject] = {} if table is None else table
+
+    def __str__(self):
+        return '#<hash-table {}>'.format(len(self.table))
+
+
+class Vector(ComputationalObject):
+    """向量，元素连续存放，O(1) 下标访问
+
+    元素全是同类数字时用 array 紧凑存放裸值（整数 'q'，浮点 'd'），否则用 list 存放对象；
+    写入不合类型的值时自动退化为 list
+    """
+
+    def __init__(self, elements: Sequence[ComputationalObject] = ()):
+        self.items: Union[array, List[ComputationalObject]] = self._pack(elements)
+
+    @classmethod
+    def from_items(cls, items: Union[array, List[ComputationalObject]]) -> 'Vector':
+        """直接用已经排好的底层存储构造，不再检查元素类型"""
+        vector = cls()
+        vector.items = items
+        return vector
+
+    @staticmethod
+    def _typecode(elements: Sequence[ComputationalObject]) -> Optional[str]:
+        if not elements or not all(isinstance(e, Number) for e in elements):
+            return None
+
+        types = {type(e.value) for e in elements}
+        if types == {int}:
+            return 'q'
+        elif types == {float}:
+            return 'd'
+        return None
+
+    @classmethod
+    def _pack(cls, elements: Sequence[ComputationalObject]) -> Union[array, List[ComputationalObject]]:
+        typecode = cls._typecode(elements)
+        if typecode:
+            try:
+                return array(typecode, [e.value for e in elements])
+            except OverflowError:
+                pass
+        return list(elements)
+
+    @property
+    def is_typed(self) -> bool:
+        return isinstance(self.items, array)
+
+    def elements(self) -> List[ComputationalObject]:
+        if self.is_typed:
+            return [Number(v) for v in self.items]
+        return list(self.items)
+
+    def ref(self, index: int) -> ComputationalObject:
+        if not 0 <= index < len(self.items):
+            raise IndexError('vector index {} out of range'.format(index))
+        if self.is_typed:
+            return Number(self.items[index])
+        return self.items[index]
+
+    def set(self, index: int, o: ComputationalObject):
+        if not 0 <= index < len(self.items):
+            raise IndexError('vector index {} out of range'.format(index))
+        if self.is_typed:
+            if isinstance(o, Number) and type(o.value) is {'q': int, 'd': float}[self.items.typecode]:
+                try:
+                    self.items[index] = o.value
+                    return
+                except OverflowError:
+                    pass
+            self.items = self.elements()
+        self.items[index] = o
+
+    def fill(self, o: ComputationalObject):
+        self.items = self._pack([o] * self.length())
+
+    def length(self) -> int:
+        # 不定义 __len__：空向量不能被当成假值（解析器、thunk 都靠真值判断）
+        return len(self.items)
+
+    def __eq__(self, other):
+        return structurally_equal(self, other, operator.eq)
+
+    def __hash__(self):
+        return structural_hash(self)
+
+    def __str__(self):
+        from .printer import to_string
+        return to_string(self)
+
+
+class Bytevector(ComputationalObject):
+    """字节向量，通过 memoryview 访问底层的 bytearray 或 mmap，每个字节只占一个字节
+
+    切片是共享同一块缓冲区的视图，不复制；多字节的整数、浮点数用 struct 直接在缓冲区上读写
+    底层是只读的映射时，写入会抛出 TypeError
+    """
+
+    def __init__(self, buffer=b''):
+        view = memoryview(buffer)
+        self.view: memoryview = view if view.format == 'B' and view.ndim == 1 else view.cast('B')
+
+    @classmethod
+    def make(cls, k: int, fill: int = 0) -> 'Bytevector':
+        return cls(bytearray([fill]) * k)
+
+    def length(self) -> int:
+        return len(self.view)
+
+    def _check(self, index: int, size: int = 1):
+        """[index, index + size) 要落在字节向量里；负数下标不按 python 的习惯从末尾数"""
+        if not 0 <= index <= len(self.view) - size:
+            raise IndexError('bytevector index {} out of range for length {}'.format(index, len(self.view)))
+
+    def ref(self, index: int) -> int:
+        self._check(index)
+        return self.view[index]
+
+    def set(self, index: int, byte: int):
+        self._check(index)
+        self.view[index] = byte
+
+    def slice(self, start: int, end: int) -> 'Bytevector':
+        if not 0 <= start <= end <= len(self.view):
+            raise IndexError('bytevector slice [{}, {}) out of range for length {}'.format(start, end, len(self.view)))
+        return Bytevector(self.view[start:end])
+
+    def copy(self, start: int, end: int) -> 'Bytevector':
+        if not 0 <= start <= end <= len(self.view):
+            raise IndexError('bytevector copy [{}, {}) out of range for length {}'.format(start, end, len(self.view)))
+        return Bytevector(bytearray(self.view[start:end]))
+
+    def unpack(self, fmt: struct.Struct, offset: int):
+        self._check(offset, fmt.size)
+        return fmt.unpack_from(self.view, offset)[0]
+
+    def pack(self, fmt: struct.Struct, offset: int, value):
+        self._check(offset, fmt.size)
+        fmt.pack_into(self.view, offset, value)
+
+    def tobytes(self) -> bytes:
+        return self.view.tobytes()
+
+    def __eq__(self, other):
+        return isinstance(other, Bytevector) and self.view == other.view
+
+    def __hash__(self):
+        return hash((Bytevector, self.view.tobytes()))
+
+    def __str__(self):
+        return '#u8({})'.format(' '.join(map(str, self.view)))
+
+
+def unpack_list(lst) -> Tuple[List[ComputationalObject], ComputationalObject]:
+    """把表拆成元素的 python 列表和结尾的 cdr（真表为空表），CompactList 整段复制，不逐个走 cdr"""
+    items = []
+
+    pair = lst
+    while isinstance(pair, Pair):
+        if type(pair) is CompactList:
+            segment, pair = pair.unpack()
+            items.extend(segment)
+        else:
+            items.append(pair.car)
+            pair = pair.cdr
+
+    return items, pair
+
+
+def _cached_hash(o: ComputationalObject) -> Optional[int]:
+    """共享常量表（frozen 的整段 CompactList）缓存的哈希，没有时为 None"""
+    if type(o) is CompactList and o.start == 0 and o.cells.frozen and not o.cells.tails:
+        return o.cells.hash
+    return None
+
+
+class _Combine(object):
+    """structural_hash 的栈上标记：把最后 n 个哈希合成一个"""
+    __slots__ = ('mark', 'n', 'cells')
+
+    def __init__(self, mark: int, n: int, cells: Optional[CompactCells]):
+        self.mark: int = mark
+        self.n: int = n
+        self.cells: Optional[CompactCells] = cells
+
+
+def structural_hash(o: ComputationalObject) -> int:
+    """表和向量的结构哈希，按 (元素..., 结尾) 组合而成，与底层是 Pair 链还是 CompactList 无关
+
+    用显式的栈后序计算，不会爆栈；共享常量表的哈希算过一次就缓存下来，再遇到时不往下走
+    """
+    hashes = []
+    stack = [o]
+    while stack:
+        o = stack.pop()
+
+        if type(o) is _Combine:
+            # n 可能是 0（空向量），不能写成 hashes[-n:]，那样会取到整个列表
+            start = len(hashes) - o.n
+            h = hash((o.mark, tuple(hashes[start:])))
+            del hashes[start:]
+            if o.cells is not None:
+                o.cells.hash = h
+            hashes.append(h)
+
+        elif isinstance(o, Pair):
+            h = _cached_hash(o)
+            if h is not None:
+                hashes.append(h)
+                continue
+
+            cells = o.cells if type(o) is CompactList and o.start == 0 and o.cells.frozen \
+                and not o.cells.tails else None
+            items, tail = unpack_list(o)
+            items.append(tail)
+
+            # 元素里没有表和向量时（最常见的叶子表）直接算出来，不经过栈
+            for e in items:
+                if isinstance(e, (Pair, Vector)):
+                    break
+            else:
+                h = hash((_PAIR_HASH_MARK, tuple([hash(e) for e in items])))
+                if cells is not None:
+                    cells.hash = h
+                hashes.append(h)
+                continue
+
+            stack.append(_Combine(_PAIR_HASH_MARK, len(items), cells))
+            stack.extend(reversed(items))
+
+        elif isinstance(o, Vector):
+            elements = o.elements()
+            stack.append(_Combine(_VECTOR_HASH_MARK, len(elements), None))
+            stack.extend(reversed(elements))
+
+        else:
+            hashes.append(hash(o))
+
+    return hashes[0]
+
+
+def structurally_equal(a: ComputationalObject, b: ComputationalObject,
+                       same: Callable[[ComputationalObject, ComputationalObject], bool]) -> bool:
+    """逐层比较表和向量的元素，其它对象用 same 比较；显式的栈，线性时间，不会爆栈
+
+    同一个对象直接相等；两边都有缓存的哈希且不同时直接不等
+    """
+    stack = [(a, b)]
+    while stack:
+        a, b = stack.pop()
+        if a is b:
+            continue
+
+        if isinstance(a, Pair):
+            if not isinstance(b, Pair):
+                return False
+            ha, hb = _cached_hash(a), _cached_hash(b)
+            if ha is not None and hb is not None and ha != hb:
+                return False
+
+            items_a, tail_a = unpack_list(a)
+            items_b, tail_b = unpack_list(b)
+            if len(items_a) != len(items_b):
+                return False
+            stack.append((tail_a, tail_b))
+            stack.extend(zip(reversed(items_a), reversed(items_b)))
+
+        elif isinstance(a, Vector):
+            if not isinstance(b, Vector) or a.length() != b.length():
+                return False
+            if a.is_typed and b.is_typed and a.items.typecode == b.items.typecode:
+                if a.items != b.items:
+                    return False
+                continue
+            stack.extend(zip(reversed(a.elements()), reversed(b.elements())))
+
+        elif not same(a, b):
+            return False
+
+    return True
+
+
+def is_eq(a: ComputationalObject, b: ComputationalObject) -> bool:
+    """同一个对象；符号、布尔值按值比较，同名的符号总是 eq
+
+    紧凑列表每次取 cdr 都新建一个视图，指向同一块存储的同一个位置的视图是同一个序对
+    """
+    if a is b:
+        return True
+    t = type(a)
+    if t is not type(b):
+        return False
+    if t is CompactList:
+        return a.cells is b.cells and a.start == b.start
+    return (t is Symbol or t is Boolean) and a.value == b.value
+
+
+def is_eqv(a: ComputationalObject, b: ComputationalObject) -> bool:
+    """在 eq 之外，精确性相同且值相等的数字也相等"""
+    if is_eq(a, b):
+        return True
+    return type(a) is Number and type(b) is Number \
+        and type(a.value) is type(b.value) and a.value == b.value
+
+
+def _equal_leaf(a: ComputationalObject, b: ComputationalObject) -> bool:
+    if type(a) is String and type(b) is String:
+        return a.value == b.value
+    # 持久化的映射和向量是值，按内容比较；字节向量也按内容比较
+    if type(a) is type(b) and (type(a) is PersistentMap or type(a) is PersistentVector or type(a) is Bytevector):
+        return a == b
+    return is_eqv(a, b)
+
+
+def is_equal(a: ComputationalObject, b: ComputationalObject) -> bool:
+    """结构相等：表和向量逐个元素比较，字符串比较内容，其它按 eqv"""
+    return structurally_equal(a, b, _equal_leaf)
+
+
 def is_true(v):
     assert isinstance(v, ComputationalObject)
     return not is_false(v)
@@ -93,6 +623,351 @@ def is_false(v):
     return v == Boolean(False)
 
 
+_ABSENT = object()
+
+# 每层用哈希或下标的 5 位，节点最多 32 个槽位
+_BITS = 5
+_WIDTH = 1 << _BITS
+_MASK = _WIDTH - 1
+_HASH_BITS = 64
+
+
+class _MapNode(object):
+    """HAMT 的内部节点：bitmap 的第 i 位表示这一层哈希片段为 i 的槽位存在，entries 只放存在的槽位
+
+    槽位是叶子 (key, value, hash) 或下一层的节点；节点创建后不再修改，新版本复制路径上的节点
+    """
+    __slots__ = ('bitmap', 'entries')
+
+    def __init__(self, bitmap: int, entries: tuple):
+        self.bitmap: int = bitmap
+        self.entries: tuple = entries
+
+    def assoc(self, shift: int, leaf: tuple) -> Tuple['_MapNode', bool]:
+        """返回新节点和是否新增了键"""
+        bit = 1 << ((leaf[2] >> shift) & _MASK)
+        index = (self.bitmap & (bit - 1)).bit_count()
+        entries = self.entries
+
+        if not self.bitmap & bit:
+            return _MapNode(self.bitmap | bit, entries[:index] + (leaf,) + entries[index:]), True
+
+        e = entries[index]
+        if type(e) is tuple:
+            if e[2] == leaf[2] and (e[0] is leaf[0] or e[0] == leaf[0]):
+                if e[1] is leaf[1]:
+                    return self, False
+                new, added = leaf, False
+            else:
+                new, added = _merge(shift + _BITS, e, leaf), True
+        else:
+            new, added = e.assoc(shift + _BITS, leaf)
+            if new is e:
+                return self, False
+
+        return _MapNode(self.bitmap, entries[:index] + (new,) + entries[index + 1:]), added
+
+    def dissoc(self, shift: int, h: int, key) -> Tuple[Optional['_MapNode'], bool]:
+        """返回新节点（删空时为 None）和是否删除了键"""
+        bit = 1 << ((h >> shift) & _MASK)
+        if not self.bitmap & bit:
+            return self, False
+
+        index = (self.bitmap & (bit - 1)).bit_count()
+        entries = self.entries
+        e = entries[index]
+        if type(e) is tuple:
+            if e[2] != h or not (e[0] is key or e[0] == key):
+                return self, False
+            new = None
+        else:
+            new, removed = e.dissoc(shift + _BITS, h, key)
+            if not removed:
+                return self, False
+            # 只剩一个叶子的子节点收回到这一层
+            if new is not None and len(new.entries) == 1 and type(new.entries[0]) is tuple:
+                new = new.entries[0]
+
+        if new is None:
+            if len(entries) == 1:
+                return None, True
+            return _MapNode(self.bitmap ^ bit, entries[:index] + entries[index + 1:]), True
+        return _MapNode(self.bitmap, entries[:index] + (new,) + entries[index + 1:]), True
+
+
+class _CollisionNode(object):
+    """64 位哈希完全相同的键，按顺序放在一起"""
+    __slots__ = ('entries',)
+
+    def __init__(self, entries: tuple):
+        self.entries: tuple = entries
+
+    def assoc(self, shift: int, leaf: tuple) -> Tuple['_CollisionNode', bool]:
+        for i, e in enumerate(self.entries):
+            if e[0] is leaf[0] or e[0] == leaf[0]:
+                return _CollisionNode(self.entries[:i] + (leaf,) + self.entries[i + 1:]), False
+        return _CollisionNode(self.entries + (leaf,)), True
+
+    def dissoc(self, shift: int, h: int, key) -> Tuple[Optional['_CollisionNode'], bool]:
+        for i, e in enumerate(self.entries):
+            if e[0] is key or e[0] == key:
+                entries = self.entries[:i] + self.entries[i + 1:]
+                return (_CollisionNode(entries) if entries else None), True
+        return self, False
+
+
+def _merge(shift: int, a: tuple, b: tuple):
+    """两个哈希不同（或到底也相同）的叶子放进同一个新节点"""
+    if shift >= _HASH_BITS:
+        return _CollisionNode((a, b))
+
+    ia, ib = (a[2] >> shift) & _MASK, (b[2] >> shift) & _MASK
+    if ia == ib:
+        return _MapNode(1 << ia, (_merge(shift + _BITS, a, b),))
+    if ia > ib:
+        a, b = b, a
+    return _MapNode((1 << ia) | (1 << ib), (a, b))
+
+
+def _key_hash(key: ComputationalObject) -> int:
+    return hash(key) & ((1 << _HASH_BITS) - 1)
+
+
+class PersistentMap(ComputationalObject):
+    """持久化哈希映射（hash array mapped trie）
+
+    每层按哈希的 5 位分 32 路，查找、插入、更新、删除都是 O(log32 n)；
+    修改返回新的映射，只复制根到叶子路径上的节点，其余部分和旧版本共享，旧版本保持不变
+    键的比较和哈希与 HashTable 一样依赖各类型的 __eq__ / __hash__
+    """
+
+    def __init__(self, root: Union[_MapNode, _CollisionNode, None] = None, count: int = 0):
+        self.root: Union[_MapNode, _CollisionNode, None] = root
+        self.count: int = count
+
+    @classmethod
+    def from_items(cls, items) -> 'PersistentMap':
+        m = cls()
+        for key, value in items:
+            m = m.assoc(key, value)
+        return m
+
+    def get(self, key: ComputationalObject, default=None):
+        h = _key_hash(key)
+        node, shift = self.root, 0
+        while node is not None:
+            if type(node) is _CollisionNode:
+                for e in node.entries:
+                    if e[0] is key or e[0] == key:
+                        return e[1]
+                return default
+
+            bit = 1 << ((h >> shift) & _MASK)
+            if not node.bitmap & bit:
+                return default
+            e = node.entries[(node.bitmap & (bit - 1)).bit_count()]
+            if type(e) is tuple:
+                return e[1] if e[2] == h and (e[0] is key or e[0] == key) else default
+            node, shift = e, shift + _BITS
+        return default
+
+    def contains(self, key: ComputationalObject) -> bool:
+        return self.get(key, _ABSENT) is not _ABSENT
+
+    def assoc(self, key: ComputationalObject, value: ComputationalObject) -> 'PersistentMap':
+        leaf = (key, value, _key_hash(key))
+        if self.root is None:
+            return PersistentMap(_MapNode(1 << (leaf[2] & _MASK), (leaf,)), 1)
+
+        root, added = self.root.assoc(0, leaf)
+        if root is self.root:
+            return self
+        return PersistentMap(root, self.count + added)
+
+    def dissoc(self, key: ComputationalObject) -> 'PersistentMap':
+        if self.root is None:
+            return self
+
+        root, removed = self.root.dissoc(0, _key_hash(key), key)
+        if not removed:
+            return self
+        return PersistentMap(root, self.count - 1)
+
+    def items(self):
+        """按哈希顺序逐个产生 (key, value)"""
+        stack = [self.root] if self.root is not None else []
+        while stack:
+            node = stack.pop()
+            for e in reversed(node.entries):
+                if type(e) is tuple:
+                    yield e[0], e[1]
+                else:
+                    stack.append(e)
+
+    def length(self) -> int:
+        # 和 Vector 一样不定义 __len__，空映射不能被当成假值
+        return self.count
+
+    def __eq__(self, other):
+        if not isinstance(other, PersistentMap) or self.count != other.count:
+            return False
+        if self.root is other.root:
+            return True
+        return all(other.get(key, _ABSENT) == value for key, value in self.items())
+
+    def __hash__(self):
+        h = self.count
+        for key, value in self.items():
+            h ^= hash((key, value))
+        return h
+
+    def __str__(self):
+        return '#<pmap {}>'.format(self.count)
+
+
+class PersistentVector(ComputationalObject):
+    """持久化向量：32 路的前缀树，末尾不满 32 个的元素放在 tail 里
+
+    下标访问和更新是 O(log32 n)，追加和弹出末尾多数时候只复制 tail；修改返回新向量，和旧版本共享没改到的节点
+    节点都是 tuple，创建后不再修改
+    只支持在末尾追加，没有实现 RRB 树的松弛节点，拼接按逐个追加进行
+    """
+
+    def __init__(self, count: int = 0, shift: int = _BITS, root: tuple = (), tail: tuple = ()):
+        self.count: int = count
+        self.shift: int = shift
+        self.root: tuple = root
+        self.tail: tuple = tail
+
+    @classmethod
+    def from_items(cls, items: Sequence[ComputationalObject]) -> 'PersistentVector':
+        """按整层自底向上建树，不逐个追加"""
+        items = tuple(items)
+        count = len(items)
+        if not count:
+            return cls()
+
+        tail_offset = (count - 1) >> _BITS << _BITS
+        nodes = [items[i:i + _WIDTH] for i in range(0, tail_offset, _WIDTH)]
+        shift = _BITS
+        while len(nodes) > _WIDTH:
+            nodes = [tuple(nodes[i:i + _WIDTH]) for i in range(0, len(nodes), _WIDTH)]
+            shift += _BITS
+        return cls(count, shift, tuple(nodes), items[tail_offset:])
+
+    def _tail_offset(self) -> int:
+        return 0 if self.count < _WIDTH else (self.count - 1) >> _BITS << _BITS
+
+    def _leaf(self, index: int) -> tuple:
+        """下标所在的叶子节点（或 tail）"""
+        if index >= self._tail_offset():
+            return self.tail
+        node = self.root
+        level = self.shift
+        while level > 0:
+            node = node[(index >> level) & _MASK]
+            level -= _BITS
+        return node
+
+    def ref(self, index: int) -> ComputationalObject:
+        if not 0 <= index < self.count:
+            raise IndexError('pvector index {} out of range'.format(index))
+        return self._leaf(index)[index & _MASK]
+
+    def set(self, index: int, o: ComputationalObject) -> 'PersistentVector':
+        if index == self.count:
+            return self.push(o)
+        if not 0 <= index < self.count:
+            raise IndexError('pvector index {} out of range'.format(index))
+
+        if index >= self._tail_offset():
+            i = index & _MASK
+            return PersistentVector(self.count, self.shift, self.root, self.tail[:i] + (o,) + self.tail[i + 1:])
+        return PersistentVector(self.count, self.shift, _assoc_path(self.shift, self.root, index, o), self.tail)
+
+    def push(self, o: ComputationalObject) -> 'PersistentVector':
+        if self.count - self._tail_offset() < _WIDTH:
+            return PersistentVector(self.count + 1, self.shift, self.root, self.tail + (o,))
+
+        # tail 满了，放进树里；根也满了时树长高一层
+        if (self.count >> _BITS) > (1 << self.shift):
+            root, shift = (self.root, _new_path(self.shift, self.tail)), self.shift + _BITS
+        else:
+            root, shift = _push_tail(self.count, self.shift, self.root, self.tail), self.shift
+        return PersistentVector(self.count + 1, shift, root, (o,))
+
+    def pop(self) -> 'PersistentVector':
+        if not self.count:
+            raise IndexError('pop from an empty pvector')
+        if self.count == 1:
+            return PersistentVector()
+        if self.count - self._tail_offset() > 1:
+            return PersistentVector(self.count - 1, self.shift, self.root, self.tail[:-1])
+
+        # tail 只剩一个，把树里最后一个叶子取出来当新的 tail
+        tail = self._leaf(self.count - 2)
+        root = _pop_tail(self.count, self.shift, self.root) or ()
+        shift = self.shift
+        if shift > _BITS and len(root) == 1:
+            root, shift = root[0], shift - _BITS
+        return PersistentVector(self.count - 1, shift, root, tail)
+
+    def elements(self) -> List[ComputationalObject]:
+        ret = []
+        for i in range(0, self._tail_offset(), _WIDTH):
+            ret.extend(self._leaf(i))
+        ret.extend(self.tail)
+        return ret
+
+    def length(self) -> int:
+        return self.count
+
+    def __eq__(self, other):
+        return isinstance(other, PersistentVector) and self.count == other.count \
+            and self.elements() == other.elements()
+
+    def __hash__(self):
+        return hash((PersistentVector, tuple(self.elements())))
+
+    def __str__(self):
+        return '#<pvector {}>'.format(self.count)
+
+
+def _new_path(level: int, node: tuple) -> tuple:
+    while level > 0:
+        node = (node,)
+        level -= _BITS
+    return node
+
+
+def _push_tail(count: int, level: int, parent: tuple, tail: tuple) -> tuple:
+    index = ((count - 1) >> level) & _MASK
+    if level == _BITS:
+        child = tail
+    elif index < len(parent):
+        child = _push_tail(count, level - _BITS, parent[index], tail)
+    else:
+        child = _new_path(level - _BITS, tail)
+    return parent[:index] + (child,) + parent[index + 1:]
+
+
+def _pop_tail(count: int, level: int, node: tuple) -> Optional[tuple]:
+    index = ((count - 2) >> level) & _MASK
+    if level > _BITS:
+        child = _pop_tail(count, level - _BITS, node[index])
+        if child is None:
+            return node[:index] or None
+        return node[:index] + (child,)
+    return node[:index] or None
+
+
+def _assoc_path(level: int, node: tuple, index: int, o: ComputationalObject) -> tuple:
+    i = (index >> level) & _MASK
+    if level == 0:
+        return node[:i] + (o,) + node[i + 1:]
+    return node[:i] + (_assoc_path(level - _BITS, node[i], index, o),) + node[i + 1:]
+
+
 class Parameter(object):
     def __init__(self, names):
         self.names: List[str] = names
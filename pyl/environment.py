@@ -1,13 +1,15 @@
 # -*- coding:utf8 -*-
 
 
-from typing import Optional, Any
+from typing import Optional, Any, Dict, Tuple
 
 
 class EnvironmentFrame(object):
-    def __init__(self, parent: Optional['Environment'] = None):
+    def __init__(self, parent: Optional['EnvironmentFrame'] = None):
         self.data = {}
-        self.parent: Optional[Environment] = parent
+        self.parent: Optional[EnvironmentFrame] = parent
+        # 最外层的全局框架，平坦闭包以它为父框架
+        self.root: EnvironmentFrame = parent.root if parent else self
 
     def get(self, key):
         if key in self.data:
@@ -18,6 +20,35 @@ class EnvironmentFrame(object):
     def set(self, key, value):
         self.data[key] = value
 
+    def has(self, key) -> bool:
+        return key in self.data
+
+
+class ClosureFrame(EnvironmentFrame):
+    """平坦闭包的框架，只保存过程用到的外层局部变量
+
+    值按分析期确定的顺序放在元组里，index 由同一个 lambda 创建的所有闭包共用，
+    其余名字直接到全局框架里找，不再保留外层的整条框架链
+    """
+
+    def __init__(self, index: Dict[str, int], values: Tuple, parent: EnvironmentFrame):
+        self.index: Dict[str, int] = index
+        self.values: Tuple = values
+        self.parent: EnvironmentFrame = parent
+        self.root: EnvironmentFrame = parent.root
+
+    def get(self, key):
+        i = self.index.get(key)
+        if i is not None:
+            return self.values[i]
+        return self.parent.get(key)
+
+    def set(self, key, value):
+        raise TypeError('closure frame is read-only, {} should have been boxed'.format(key))
+
+    def has(self, key) -> bool:
+        return key in self.index
+
 
 class Environment(object):
     def __init__(self, frame=None):
@@ -29,17 +60,35 @@ class Environment(object):
     def set(self, key: str, value: Any):
         self.frame.set(key, value)
 
+    def assign(self, key: str, value: Any):
+        """给已有的绑定赋值（set!），找不到绑定时在当前框架新建"""
+        frame = self.frame
+        while frame is not None:
+            if frame.has(key):
+                frame.set(key, value)
+                return
+            frame = frame.parent
+        self.frame.set(key, value)
+
     def extend(self) -> 'Environment':
         return Environment(EnvironmentFrame(parent=self.frame))
 
+    def capture(self, index: Dict[str, int]) -> 'Environment':
+        """按 index 复制自由变量的当前值，建立平坦闭包的环境"""
+        if not index:
+            return Environment(self.frame.root)
+        return Environment(ClosureFrame(index, tuple(self.get(key) for key in index), self.frame.root))
+
 
 def init_environment() -> Environment:
     """初始环境"""
     env = Environment()
 
     from .primitive import primitives
+    from .numeric import primitives as numeric_primitives
+    from .ffi import primitives as ffi_primitives, registered
 
-    for primitive in primitives:
+    for primitive in primitives + numeric_primitives + ffi_primitives + registered:
         env.set(primitive.keyword, primitive)
 
     return env
@@ -5,6 +5,7 @@ from pyl.structure import *
 from .datatype import *
 from .environment import Environment
 from .helpers import list_to_pylist
+from .lazy import Thunk, Promise
 
 
 def evaluate(expression: Expression, environment: Environment) -> ComputationalObject:
@@ -64,7 +65,7 @@ class ESelfEvaluating(Evaluator):
     """针对 解释为自己的表达式 的解释"""
 
     def adapt(self, expression):
-        return isinstance(expression, (Number, String, Boolean))
+        return isinstance(expression, (Number, String, Boolean, Vector))
 
     def eval(self, expression, environment):
         return expression
@@ -91,6 +92,38 @@ class EQuoted(Evaluator):
         return SQuoted(expression).quoted
 
 
+class DelayedExpression(object):
+    """delay 的表达式，包装成 Thunk 可以求值的代码"""
+    __slots__ = ('expression',)
+
+    def __init__(self, expression: Expression):
+        self.expression: Expression = expression
+
+    def eval(self, environment: Environment) -> ComputationalObject:
+        return evaluate(self.expression, environment)
+
+
+def delay(expression: Expression, environment: Environment) -> Promise:
+    return Promise(Thunk(DelayedExpression(expression), environment))
+
+
+class EDelay(Evaluator):
+    def adapt(self, expression: Expression) -> bool:
+        return SDelay.adapt(expression)
+
+    def eval(self, expression: Expression, environment: Environment) -> ComputationalObject:
+        return delay(SDelay(expression).delayed, environment)
+
+
+class EConsStream(Evaluator):
+    def adapt(self, expression: Expression) -> bool:
+        return SConsStream.adapt(expression)
+
+    def eval(self, expression: Expression, environment: Environment) -> ComputationalObject:
+        c = SConsStream(expression)
+        return Pair(evaluate(c.head, environment), delay(c.tail, environment))
+
+
 class EAssignment(Evaluator):
     """针对 赋值 的解释"""
 
@@ -101,7 +134,7 @@ class EAssignment(Evaluator):
         s = SAssignment(expression)
         name = s.variable_name
         value = evaluate(s.assignment_body, environment)
-        environment.set(name.value, value)
+        environment.assign(name.value, value)
         return Symbol('ok')
 
 
@@ -123,6 +156,18 @@ class EDefinition(Evaluator):
         return Symbol('ok')
 
 
+class EVariableDefinition(Evaluator):
+    """针对 (define name value) 的解释"""
+
+    def adapt(self, expression: Expression) -> bool:
+        return SVariableDefinition.adapt(expression)
+
+    def eval(self, expression: Expression, environment: Environment) -> ComputationalObject:
+        d = SVariableDefinition(expression)
+        environment.set(d.name.value, evaluate(d.value, environment))
+        return Symbol('ok')
+
+
 class ESequence(Evaluator):
     def adapt(self, expression: Expression) -> bool:
         return SSequence.adapt(expression)
@@ -219,8 +264,15 @@ class EApplication(Evaluator):
     def eval(self, expression: Expression, environment: Environment) -> ComputationalObject:
         a = SApplication(expression)
         proc = evaluate(a.procedure_expression, environment)
-        args = [evaluate(expr, environment) for expr in a.argument_lst]
-        return proc.call(*args)
+
+        # 常见的一、两个参数直接传参：展开的参数元组在调用期间一直被引用着，
+        # 传进去的流走过的部分就无法回收
+        arg_lst = a.argument_lst
+        if len(arg_lst) == 2:
+            return proc.call(evaluate(arg_lst[0], environment), evaluate(arg_lst[1], environment))
+        elif len(arg_lst) == 1:
+            return proc.call(evaluate(arg_lst[0], environment))
+        return proc.call(*[evaluate(expr, environment) for expr in arg_lst])
 
 
 class ELet(Evaluator):
@@ -234,15 +286,110 @@ class ELet(Evaluator):
         for name, val_expr in l.name_value_pair_lst:
             env.set(name.value, evaluate(val_expr, environment))
 
-        return evaluate(l.body, env)
+        return evaluate_sequence(l.body, env)
+
+
+class ENamedLet(Evaluator):
+    """(let name ((var init) ...) body ...)：在新框架里把 name 绑定到以 var 为形参的过程上再调用"""
+
+    def adapt(self, expression: Expression) -> bool:
+        return SNamedLet.adapt(expression)
+
+    def eval(self, expression: Expression, environment: Environment) -> ComputationalObject:
+        l = SNamedLet(expression)
+
+        env = environment.extend()
+        proc = Procedure(
+            parameter=Parameter([name.value for name, _ in l.name_value_pair_lst]),
+            body=l.body,
+            environment=env
+        )
+        env.set(l.name.value, proc)
+
+        return proc.call(*[evaluate(val_expr, environment) for _, val_expr in l.name_value_pair_lst])
+
+
+class ELetrec(Evaluator):
+    def adapt(self, expression: Expression) -> bool:
+        return SLetrec.adapt(expression)
+
+    def eval(self, expression: Expression, environment: Environment) -> ComputationalObject:
+        l = SLetrec(expression)
+
+        env = environment.extend()
+        for name, val_expr in l.name_value_pair_lst:
+            env.set(name.value, evaluate(val_expr, env))
+
+        return evaluate_sequence(l.body, env)
+
+
+class EDo(Evaluator):
+    def adapt(self, expression: Expression) -> bool:
+        return SDo.adapt(expression)
+
+    def eval(self, expression: Expression, environment: Environment) -> ComputationalObject:
+        d = SDo(expression)
+
+        env = environment.extend()
+        for name, init, _ in d.variable_lst:
+            env.set(name.value, evaluate(init, environment))
+
+        while is_false(evaluate(d.test, env)):
+            evaluate_sequence(d.body, env)
+
+            # 所有 step 都用上一轮的绑定求值，再放进新的一层框架，先前创建的闭包看到的仍是旧值
+            values = [env.get(name.value) if step is None else evaluate(step, env)
+                      for name, _, step in d.variable_lst]
+            env = environment.extend()
+            for (name, _, _), value in zip(d.variable_lst, values):
+                env.set(name.value, value)
+
+        if d.result is NIL:
+            return Symbol('ok')
+        return evaluate_sequence(d.result, env)
+
+
+class ELetEc(Evaluator):
+    def adapt(self, expression: Expression) -> bool:
+        return SLetEc.adapt(expression)
+
+    def eval(self, expression: Expression, environment: Environment) -> ComputationalObject:
+        # 逃逸续延定义在 primitive 模块，延迟导入以免循环依赖
+        from .primitive import call_with_escape
+        l = SLetEc(expression)
+
+        def run(k):
+            env = environment.extend()
+            env.set(l.name.value, k)
+            return evaluate_sequence(l.body, env)
+
+        return call_with_escape(run)
+
+
+class ERecordTypeDefinition(Evaluator):
+    """(define-record-type ...)，每次求值都新建一个记录类型"""
+
+    def adapt(self, expression: Expression) -> bool:
+        return SRecordTypeDefinition.adapt(expression)
+
+    def eval(self, expression: Expression, environment: Environment) -> ComputationalObject:
+        # 记录过程是原始过程，依赖 primitive 模块，延迟导入以免循环依赖
+        from .record import record_bindings
+        for name, value in record_bindings(SRecordTypeDefinition(expression)):
+            environment.set(name, value)
+        return Symbol('ok')
 
 
 _evaluator_search_sequence = [
     ESelfEvaluating(),
     EVariable(),
     EQuoted(),
+    EDelay(),
+    EConsStream(),
     EAssignment(),
     EDefinition(),
+    EVariableDefinition(),
+    ERecordTypeDefinition(),
     ESequence(),
     EIf(),
     ECond(),
@@ -250,5 +397,9 @@ _evaluator_search_sequence = [
     EAnd(),
     ELambda(),
     ELet(),
+    ENamedLet(),
+    ELetrec(),
+    EDo(),
+    ELetEc(),
     EApplication(),
 ]
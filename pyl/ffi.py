@@ -0,0 +1,241 @@
+# -*- coding:utf8 -*-
+
+"""Python Interop -- 从 scheme 调用 python
+
+py-import、py-getattr、py-call 取得并调用 python 的模块、对象和函数，参数和结果在两边的值之间自动转换：
+
+    scheme                      python
+    数字、布尔值                int / float、bool
+    字符串、符号                str（转回来都是字符串）
+    表、持久化向量              list（转回来是表）
+    空表                        []（None 转回来也是空表）
+    哈希表、持久化映射          dict（转回来是哈希表）
+    字节向量                    memoryview，共享缓冲区，不复制
+    紧凑存放的向量              array.array 本身，共享，不复制；其它向量是 list
+    numpy 数组（NumericArray）  ndarray 本身，不复制
+    过程                        可以调用的 python 函数，回调 scheme 过程
+    其它 python 对象            包装成不透明的对象，可以调用的包装成原始过程
+
+已经写好的 python 函数可以用 primitive 装饰器注册成原始过程，声明参数个数，之后创建的求值器都能直接调用
+"""
+
+import importlib
+from array import array
+from fractions import Fraction
+from typing import Any, Callable, List, Optional, Tuple, Union
+
+from .datatype import ComputationalObject, Number, Boolean, Symbol, String, Pair, NIL, HashTable, Vector, \
+    Bytevector, PersistentMap, PersistentVector, Parameter, ProcedureBase, compact_list, unpack_list
+from .numeric import NumericArray, numpy
+from .primitive import Primitive, apply_procedure
+
+
+class PyObject(ComputationalObject):
+    """不透明地包装一个 python 对象"""
+
+    def __init__(self, value: Any):
+        self.value: Any = value
+
+    def __eq__(self, other):
+        return isinstance(other, PyObject) and self.value is other.value
+
+    def __hash__(self):
+        return id(self.value)
+
+    def __str__(self):
+        return '#<python {!r}>'.format(self.value)
+
+
+class PyProcedure(Primitive, ProcedureBase):
+    """可以调用的 python 对象，像原始过程一样按已经求值的参数调用，参数和结果自动转换"""
+    keyword = None
+
+    parameter = Parameter(['arguments'])
+
+    def __init__(self, function: Callable):
+        self.function: Callable = function
+        self.keyword: str = getattr(function, '__name__', None) or repr(function)
+
+    def call(self, *arguments):
+        return from_python(self.function(*[to_python(a) for a in arguments]))
+
+    def __eq__(self, other):
+        return isinstance(other, PyProcedure) and self.function is other.function
+
+    def __hash__(self):
+        return id(self.function)
+
+    def __str__(self):
+        return '#<python {}>'.format(self.keyword)
+
+
+def to_python(o: ComputationalObject) -> Any:
+    t = type(o)
+    if t is Number:
+        return o.value
+    elif t is String:
+        return o.value
+    elif t is Boolean:
+        return o.value
+    elif t is Symbol:
+        return o.value
+    elif isinstance(o, Pair):
+        items, tail = unpack_list(o)
+        if tail is not NIL:
+            raise TypeError('can not pass improper list {} to python'.format(o))
+        return [to_python(e) for e in items]
+    elif o is NIL:
+        return []
+    elif t is Bytevector:
+        return o.view
+    elif t is Vector:
+        return o.items if o.is_typed else [to_python(e) for e in o.items]
+    elif t is NumericArray:
+        return o.data
+    elif t is HashTable:
+        return {_python_key(k): to_python(v) for k, v in o.table.items()}
+    elif t is PersistentMap:
+        return {_python_key(k): to_python(v) for k, v in o.items()}
+    elif t is PersistentVector:
+        return [to_python(e) for e in o.elements()]
+    elif t is PyObject:
+        return o.value
+    elif t is PyProcedure:
+        return o.function
+    elif isinstance(o, ProcedureBase):
+        return lambda *arguments: to_python(apply_procedure(o, *[from_python(a) for a in arguments]))
+    # 记录等没有对应 python 值的对象原样传过去
+    return o
+
+
+def _python_key(k: ComputationalObject) -> Any:
+    key = to_python(k)
+    return tuple(key) if isinstance(key, list) else key
+
+
+def from_python(v: Any) -> ComputationalObject:
+    t = type(v)
+    if t is int or t is float:
+        return Number(v)
+    elif t is bool:
+        return Boolean(v)
+    elif t is str:
+        return String(v)
+    elif v is None:
+        return NIL
+    elif isinstance(v, ComputationalObject):
+        return v
+    elif t is list or t is tuple:
+        return compact_list([from_python(e) for e in v])
+    elif t is dict:
+        return HashTable({from_python(k): from_python(x) for k, x in v.items()})
+    elif t is bytearray or t is memoryview or t is bytes:
+        return Bytevector(v)
+    elif t is array:
+        if v.typecode in ('q', 'd'):
+            return Vector.from_items(v)
+        return Vector([from_python(e) for e in v])
+    elif isinstance(v, (complex, Fraction)):
+        return Number(v)
+    elif numpy is not None and isinstance(v, numpy.ndarray):
+        return NumericArray(v)
+    elif numpy is not None and isinstance(v, numpy.generic):
+        return from_python(v.item())
+    elif callable(v):
+        return PyProcedure(v)
+    return PyObject(v)
+
+
+class PyImport(Primitive, ProcedureBase):
+    """(py-import name)"""
+    keyword = 'py-import'
+
+    parameter = Parameter(['name'])
+
+    def call(self, name):
+        return from_python(importlib.import_module(name.value))
+
+
+class PyGetattr(Primitive, ProcedureBase):
+    """(py-getattr object name [default])"""
+    keyword = 'py-getattr'
+
+    parameter = Parameter(['o', 'name', 'default'])
+
+    def call(self, o, name, default=None):
+        if default is None:
+            return from_python(getattr(to_python(o), name.value))
+        return from_python(getattr(to_python(o), name.value, to_python(default)))
+
+
+class PySetattr(Primitive, ProcedureBase):
+    keyword = 'py-setattr!'
+
+    parameter = Parameter(['o', 'name', 'value'])
+
+    def call(self, o, name, value):
+        setattr(to_python(o), name.value, to_python(value))
+        return Symbol('ok')
+
+
+class PyCall(Primitive, ProcedureBase):
+    """(py-call function argument ...)"""
+    keyword = 'py-call'
+
+    parameter = Parameter(['function', 'arguments'])
+
+    def call(self, function, *arguments):
+        return from_python(to_python(function)(*[to_python(a) for a in arguments]))
+
+
+Arity = Union[int, Tuple[int, Optional[int]]]
+
+
+class PythonPrimitive(Primitive, ProcedureBase):
+    """用 primitive 装饰器注册的 python 函数
+
+    调用前先检查参数个数；convert 为假时参数和结果不做转换，函数直接处理 pyl.datatype 的对象，省去转换的开销
+    """
+    keyword = None
+    parameter = None
+
+    def __init__(self, keyword: str, function: Callable, arity: Arity, convert: bool):
+        self.keyword: str = keyword
+        self.function: Callable = function
+        self.min_arity, self.max_arity = (arity, arity) if isinstance(arity, int) else arity
+        self.parameter: Parameter = Parameter(['arg{}'.format(i) for i in range(self.min_arity)])
+        self.convert: bool = convert
+
+    def call(self, *arguments):
+        n = len(arguments)
+        if n < self.min_arity or (self.max_arity is not None and n > self.max_arity):
+            raise TypeError('{}: wrong number of arguments, got {}'.format(self.keyword, n))
+
+        if not self.convert:
+            return self.function(*arguments)
+        return from_python(self.function(*[to_python(a) for a in arguments]))
+
+
+# primitive 装饰器注册的原始过程，初始环境里都会绑定
+registered: List[PythonPrimitive] = []
+
+
+def primitive(keyword: str, arity: Arity, convert: bool = True):
+    """把 python 函数注册成名为 keyword 的原始过程，返回原函数
+
+    arity 是参数个数，或 (最少, 最多)，最多为 None 表示不限；要在创建求值器之前注册
+    """
+
+    def register(function: Callable) -> Callable:
+        registered.append(PythonPrimitive(keyword, function, arity, convert))
+        return function
+
+    return register
+
+
+primitives = [
+    PyImport(),
+    PyGetattr(),
+    PySetattr(),
+    PyCall(),
+]
@@ -0,0 +1,73 @@
+# -*- coding:utf8 -*-
+
+"""Hash-consing -- 解析时共享结构相等的不可变数据
+
+大的生成程序和数据文件里，同样的子树会反复出现。开启后，解析器对结构相等的原子和表只保留一份：
+原子按类型和值查驻留表，表按各元素（已经共享过的）对象身份查驻留表
+驻留表只持有弱引用，没有其它地方引用时表项自动消失
+
+共享的表是常量，set-car! / set-cdr! 会报错；port 的 read 读出的数据不共享，仍然可以修改
+"""
+
+import weakref
+from typing import Optional, Tuple
+
+from .datatype import ComputationalObject, Number, Symbol, String, Boolean, CompactList
+
+
+class HashConsConfig(object):
+    def __init__(self, enabled: bool = False):
+        self.enabled: bool = enabled
+
+
+config = HashConsConfig()
+
+stats = {
+    'shared': 0,
+}
+
+
+class InternTable(object):
+    def __init__(self):
+        self.objects: weakref.WeakValueDictionary = weakref.WeakValueDictionary()
+
+    def intern(self, o: ComputationalObject) -> ComputationalObject:
+        """返回和 o 结构相等的共享对象；第一次见到时 o 自己成为共享的那一份"""
+        key = _key(o)
+        if key is None:
+            return o
+
+        shared = self.objects.get(key)
+        if shared is not None:
+            stats['shared'] += 1
+            return shared
+
+        if type(o) is CompactList:
+            o.cells.frozen = True
+        self.objects[key] = o
+        return o
+
+    def __len__(self):
+        return len(self.objects)
+
+
+def _key(o: ComputationalObject) -> Optional[Tuple]:
+    t = type(o)
+    if t is Number:
+        v = o.value
+        # 1 和 1.0、0.0 和 -0.0 相等但不能合并
+        return t, type(v), v.hex() if type(v) is float else v
+    elif t is Symbol or t is String or t is Boolean:
+        return t, o.value
+    elif t is CompactList and o.start == 0 and not o.cells.tails:
+        # 元素已经共享过，按身份比较就是按结构比较；表项活着时元素也活着，id 不会被复用
+        return t, tuple(map(id, o.cells.items))
+    return None
+
+
+table = InternTable()
+
+
+def current_table() -> Optional[InternTable]:
+    """开启 hash-consing 时解析器使用的驻留表，否则为 None"""
+    return table if config.enabled else None
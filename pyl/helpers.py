@@ -2,17 +2,14 @@
 from typing import Optional
 
 from pyl.datatype import Expression, Symbol
-from .datatype import Pair, NIL
+from .datatype import Pair, NIL, CompactList, unpack_list
 
 
-def pylist_to_list(py_lst):
-    if len(py_lst) > 0:
-        ret = Pair(
-            py_lst[0],
-            pylist_to_list(py_lst[1:])
-        )
-    else:
-        ret = NIL
+def pylist_to_list(py_lst, tail=NIL):
+    """从尾部向前逐个 cons，不递归也不切片，长列表也不会爆栈"""
+    ret = tail
+    for element in reversed(py_lst):
+        ret = Pair(element, ret)
     return ret
 
 
@@ -21,14 +18,36 @@ def cons_list(*elements):
 
 
 def list_to_pylist(lst):
-    py_lst = []
-
-    pair = lst
-    while isinstance(pair, Pair):
-        py_lst.append(pair.car)
-        pair = pair.cdr
-
-    return py_lst
+    return unpack_list(lst)[0]
+
+
+def list_length(lst) -> int:
+    """表里序对的个数，CompactList 连续的一段直接算长度"""
+    n = 0
+    while isinstance(lst, Pair):
+        if type(lst) is CompactList:
+            end, rest = lst.segment()
+            n += end - lst.start
+            lst = rest
+        else:
+            n += 1
+            lst = lst.cdr
+    return n
+
+
+def list_tail(lst, k: int):
+    """跳过表的前 k 个序对，表不够长时返回走到的结尾；CompactList 连续的一段里直接定位"""
+    while k and isinstance(lst, Pair):
+        if type(lst) is CompactList:
+            end, rest = lst.segment()
+            if lst.start + k < end:
+                return CompactList(lst.cells, lst.start + k)
+            k -= end - lst.start
+            lst = rest
+        else:
+            k -= 1
+            lst = lst.cdr
+    return lst
 
 
 def first_symbol(expression: Expression) -> Optional[Symbol]:
@@ -48,20 +67,10 @@ def first_symbol(expression: Expression) -> Optional[Symbol]:
 
 def by_index(lst: Expression, index: int) -> Optional[Expression]:
     """获取 lst 里的第 index 个元素，如果不存在则返回 None"""
-    ret = None
-
     if not isinstance(index, int) or index < 0:
         raise ValueError
 
-    elif not isinstance(lst, Pair):
-        ret = None
-
-    elif index == 0:
-        pair = lst
-        ret = pair.car
-
-    elif index > 0:
-        # noinspection PyTypeChecker
-        ret = by_index(lst.cdr, index - 1)
-
-    return ret
+    pair = list_tail(lst, index)
+    if not isinstance(pair, Pair):
+        return None
+    return pair.car
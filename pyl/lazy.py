@@ -1,25 +1,64 @@
 from pyl.datatype import ComputationalObject
 
+_UNFORCED = object()
+
 
 class Thunk(ComputationalObject):
     def __init__(self, code, environment):
         self.code = code
         self.env = environment
-        self._result = None
+        self._result = _UNFORCED
 
     @property
     def result(self):
-        if self._result:
+        if self._result is not _UNFORCED:
             return self._result
 
         else:
-            self._result = self.code.eval(self.env)
+            # 参数可能本身就是另一个 thunk（变量透传），要一次展开到底
+            self._result = Thunk.force(self.code.eval(self.env))
+            # 求过值之后不再引用代码和环境，流中已经走过的部分可以被回收
+            self.code = None
             self.env = None
             return self._result
 
     @staticmethod
     def force(o):
-        if isinstance(o, Thunk):
-            return o.result
-        else:
-            return o
\ No newline at end of file
+        while isinstance(o, Thunk):
+            o = o.result
+        return o
+
+
+class Deferred(object):
+    """把无参的 python 函数包装成 Thunk 可以求值的代码，供原始过程构造惰性的结果"""
+    __slots__ = ('function',)
+
+    def __init__(self, function):
+        self.function = function
+
+    def eval(self, environment):
+        return self.function()
+
+
+class Promise(ComputationalObject):
+    """delay / cons-stream 生成的承诺，第一次 force 时求值并记住结果，借用 Thunk 的记忆化"""
+
+    def __init__(self, thunk: Thunk):
+        self.thunk: Thunk = thunk
+
+    @classmethod
+    def forced(cls, value) -> 'Promise':
+        """已经有值的承诺（make-promise）"""
+        thunk = Thunk(None, None)
+        thunk._result = value
+        return cls(thunk)
+
+    @classmethod
+    def defer(cls, function) -> 'Promise':
+        return cls(Thunk(Deferred(function), None))
+
+    def force(self):
+        return self.thunk.result
+
+    def __str__(self):
+        return '#<promise>'
@@ -7,18 +7,25 @@
 
 当作一个表达式解释，还是当作表达式序列解释，留给调用者决定
 """
+from typing import Iterable, TextIO
+
 from pyl.lazy import Thunk
 
-__all__ = ['Evaluator']
+__all__ = ['Evaluator', 'evaluate']
 
+from .datatype import ProcedureBase, String, is_false
 from .environment import init_environment
+from .primitive import apply_procedure
 
 
 class Evaluator(object):
-    def __init__(self, bool_analyze):
+    def __init__(self, bool_analyze, bool_optimize=False):
         self.bool_analyze = bool(bool_analyze)
+        self.bool_optimize = self.bool_analyze and bool(bool_optimize)
 
-        if self.bool_analyze:
+        if self.bool_optimize:
+            from .optimize import evaluate, evaluate_sequence
+        elif self.bool_analyze:
             from .analyze import evaluate, evaluate_sequence
         else:
             from .evaluator import evaluate, evaluate_sequence
@@ -32,3 +39,27 @@ class Evaluator(object):
 
     def eval_seq(self, expression):
         return Thunk.force(self._eval_seq(expression, self.env))
+
+    @staticmethod
+    def each_line(procedure: ProcedureBase, reader: Iterable[str], writer: TextIO) -> int:
+        """对每一行（去掉换行符，作为 String）调用求值好的过程，结果逐行写出，返回处理的行数
+
+        过程只在求值表达式时分析一次；返回 #f 的行不输出，字符串输出其内容，其它值输出打印形式
+        """
+        n = 0
+        for line in reader:
+            n += 1
+            if line.endswith('\n'):
+                line = line[:-1]
+
+            ret = apply_procedure(procedure, String(line))
+            if is_false(ret):
+                continue
+            writer.write(ret.value if type(ret) is String else str(ret))
+            writer.write('\n')
+        return n
+
+
+def evaluate(expression):
+    """在新的初始环境里用分析求值器求值一个表达式"""
+    return Evaluator(True).eval(expression)
@@ -0,0 +1,241 @@
+# -*- coding:utf8 -*-
+
+"""Numeric Arrays -- 基于 numpy 的数值数组及其向量化原始过程
+
+numpy 是可选依赖：没有安装时这些原始过程不会注册到初始环境
+数组运算整体交给 numpy 在 C 层完成，scheme 只负责控制逻辑
+"""
+
+from typing import Union
+
+from .datatype import ComputationalObject, Number, Boolean, Vector, Parameter, ProcedureBase
+from .helpers import list_to_pylist, pylist_to_list
+from .primitive import Primitive
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+class NumericArray(ComputationalObject):
+    """数值数组，包装一个 numpy.ndarray"""
+
+    def __init__(self, data: 'numpy.ndarray'):
+        self.data: 'numpy.ndarray' = data
+
+    def __eq__(self, other):
+        return self.__class__ == other.__class__ and bool(numpy.array_equal(self.data, other.data))
+
+    __hash__ = ComputationalObject.__hash__
+
+    def __str__(self):
+        return '#<array {}>'.format(numpy.array2string(self.data, separator=' '))
+
+
+def to_scalar(o: Union[NumericArray, Number]):
+    """把参数转成 numpy 可以直接运算的值，数字拆箱，数组取 ndarray"""
+    if isinstance(o, NumericArray):
+        return o.data
+    elif isinstance(o, Number):
+        return o.value
+    raise TypeError('{} is neither a number nor an array'.format(o))
+
+
+def from_scalar(v) -> ComputationalObject:
+    """把 numpy 运算结果装箱：数组包成 NumericArray，标量转成 python 值再装箱"""
+    if isinstance(v, numpy.ndarray):
+        return NumericArray(v)
+
+    v = v.item() if isinstance(v, numpy.generic) else v
+    if isinstance(v, bool):
+        return Boolean(v)
+    return Number(v)
+
+
+class ListToArray(Primitive, ProcedureBase):
+    keyword = 'list->array'
+
+    parameter = Parameter(['lst'])
+
+    def call(self, lst):
+        return NumericArray(numpy.array([x.value for x in list_to_pylist(lst)]))
+
+
+class VectorToArray(Primitive, ProcedureBase):
+    keyword = 'vector->array'
+
+    parameter = Parameter(['vector'])
+
+    def call(self, vector):
+        if vector.is_typed:
+            # 紧凑存放的向量通过缓冲区协议整块复制，不逐个拆箱
+            return NumericArray(numpy.array(vector.items))
+        return NumericArray(numpy.array([x.value for x in vector.elements()]))
+
+
+class ArrayToList(Primitive, ProcedureBase):
+    keyword = 'array->list'
+
+    parameter = Parameter(['arr'])
+
+    def call(self, arr):
+        return pylist_to_list([from_scalar(x) for x in arr.data.tolist()])
+
+
+class ArrayToVector(Primitive, ProcedureBase):
+    keyword = 'array->vector'
+
+    parameter = Parameter(['arr'])
+
+    def call(self, arr):
+        return Vector([from_scalar(x) for x in arr.data.tolist()])
+
+
+class ArrayLength(Primitive, ProcedureBase):
+    keyword = 'array-length'
+
+    parameter = Parameter(['arr'])
+
+    def call(self, arr):
+        return Number(len(arr.data))
+
+
+class ArrayRef(Primitive, ProcedureBase):
+    keyword = 'array-ref'
+
+    parameter = Parameter(['arr', 'k'])
+
+    def call(self, arr, k):
+        return from_scalar(arr.data[k.value])
+
+
+class ArraySlice(Primitive, ProcedureBase):
+    """(array-slice arr start end [step])，返回共享内存的视图，不复制数据"""
+    keyword = 'array-slice'
+
+    parameter = Parameter(['arr', 'start', 'end', 'step'])
+
+    def call(self, arr, start, end, step=Number(1)):
+        return NumericArray(arr.data[start.value:end.value:step.value])
+
+
+class ElementwiseOperation(Primitive, ProcedureBase):
+    """逐元素运算，参数可以是数组或数字（按 numpy 规则广播），支持多个参数从左到右结合"""
+
+    parameter = Parameter(['a', 'b'])
+
+    @staticmethod
+    def operate(a, b):
+        raise NotImplementedError
+
+    def call(self, first, *rest):
+        ret = to_scalar(first)
+        for o in rest:
+            ret = self.operate(ret, to_scalar(o))
+        return from_scalar(ret)
+
+
+class ArrayPlus(ElementwiseOperation):
+    keyword = 'array+'
+    operate = staticmethod(lambda a, b: numpy.add(a, b))
+
+
+class ArrayMinus(ElementwiseOperation):
+    keyword = 'array-'
+    operate = staticmethod(lambda a, b: numpy.subtract(a, b))
+
+
+class ArrayMultiply(ElementwiseOperation):
+    keyword = 'array*'
+    operate = staticmethod(lambda a, b: numpy.multiply(a, b))
+
+
+class ArrayDivide(ElementwiseOperation):
+    keyword = 'array/'
+    operate = staticmethod(lambda a, b: numpy.divide(a, b))
+
+
+class ArrayEqual(ElementwiseOperation):
+    keyword = 'array='
+    operate = staticmethod(lambda a, b: numpy.equal(a, b))
+
+
+class ArrayGreaterThan(ElementwiseOperation):
+    keyword = 'array>'
+    operate = staticmethod(lambda a, b: numpy.greater(a, b))
+
+
+class ArrayLessThan(ElementwiseOperation):
+    keyword = 'array<'
+    operate = staticmethod(lambda a, b: numpy.less(a, b))
+
+
+class ArraySum(Primitive, ProcedureBase):
+    keyword = 'array-sum'
+
+    parameter = Parameter(['arr'])
+
+    def call(self, arr):
+        return from_scalar(arr.data.sum())
+
+
+class ArrayMax(Primitive, ProcedureBase):
+    keyword = 'array-max'
+
+    parameter = Parameter(['arr'])
+
+    def call(self, arr):
+        return from_scalar(arr.data.max())
+
+
+class ArrayMin(Primitive, ProcedureBase):
+    keyword = 'array-min'
+
+    parameter = Parameter(['arr'])
+
+    def call(self, arr):
+        return from_scalar(arr.data.min())
+
+
+class ArrayDot(Primitive, ProcedureBase):
+    keyword = 'array-dot'
+
+    parameter = Parameter(['a', 'b'])
+
+    def call(self, a, b):
+        return from_scalar(numpy.dot(a.data, b.data))
+
+
+class IsNumericAvailable(Primitive, ProcedureBase):
+    keyword = 'array-available?'
+
+    parameter = Parameter([])
+
+    def call(self):
+        return Boolean(numpy is not None)
+
+
+primitives = [IsNumericAvailable()]
+
+if numpy is not None:
+    primitives += [
+        ListToArray(),
+        VectorToArray(),
+        ArrayToList(),
+        ArrayToVector(),
+        ArrayLength(),
+        ArrayRef(),
+        ArraySlice(),
+        ArrayPlus(),
+        ArrayMinus(),
+        ArrayMultiply(),
+        ArrayDivide(),
+        ArrayEqual(),
+        ArrayGreaterThan(),
+        ArrayLessThan(),
+        ArraySum(),
+        ArrayMax(),
+        ArrayMin(),
+        ArrayDot(),
+    ]
@@ -0,0 +1,338 @@
+# -*- coding:utf8 -*-
+
+"""分析树优化
+
+在分析之后、求值之前对 Analyzer 树做一遍变换：
+折叠参数全为字面量的纯原始过程调用，删除条件为常量的 if / cond 分支，
+展平嵌套的 begin，化简带字面量的 and / or，在调用处内联小的全局过程
+
+原始过程只有在整个程序里都没有被重新绑定时才会折叠；
+全局过程只有在只定义了一次、从未被重新赋值时才会内联
+同一个全局环境里先前求值绑定过的名字也计算在内（REPL 里逐条输入、先求值文件再求值 -e 表达式）；
+之后的求值仍可能重新绑定，折叠和内联的结果都套上守卫，运行时确认绑定未变
+"""
+
+from collections import Counter
+from itertools import count
+from typing import List, Dict, Optional
+from weakref import WeakKeyDictionary
+
+from pyl.analyze import Analyzer, ASelfEvaluating, AQuoted, AVariable, AApplication, AInlinedCall, AGuarded, \
+    ADefinition, ASequence, DefinedBy, analyze_sequence, analyze, resolve
+from pyl.datatype import ComputationalObject, Expression, Pair, Symbol, Parameter, is_true
+from pyl.environment import Environment
+from pyl.helpers import list_to_pylist, pylist_to_list
+from pyl.structure import SDefinition, SSequence, SQuoted, SRecordTypeDefinition
+
+# 没有副作用、结果不可变的原始过程，可以在分析期算出结果
+FOLDABLE_PRIMITIVES = {'+', '-', '*', '/', 'remainder', '=', '<', '>'}
+
+# 出现在过程体里就不内联的形式：会引入新绑定或修改绑定，代入参数时要处理变量捕获
+BINDING_FORMS = {'define', 'set!', 'lambda', 'let', 'letrec', 'do', 'define-record-type', 'let/ec'}
+
+
+class OptimizeConfig(object):
+    def __init__(self, inline: bool = True, inline_budget: int = 16):
+        self.inline: bool = inline
+        # 可内联过程体的分析树节点数上限
+        self.inline_budget: int = inline_budget
+
+
+config = OptimizeConfig()
+
+stats = {
+    'removed': 0,
+    'inlined': 0,
+}
+
+
+# 每个全局环境里历次求值绑定过的名字
+_history: 'WeakKeyDictionary[object, Counter]' = WeakKeyDictionary()
+
+
+def history(environment: Environment) -> Counter:
+    """environment 所在的全局环境里，先前的求值在绑定位置用过的名字及次数"""
+    root = environment.frame.root
+    bindings = _history.get(root)
+    if bindings is None:
+        bindings = _history[root] = Counter()
+    return bindings
+
+
+def evaluate(expression: Expression, environment: Environment) -> ComputationalObject:
+    forms = [expression]
+    if SSequence.adapt(expression):
+        forms = list_to_pylist(SSequence(expression).sequence)
+    return resolve(Optimizer(forms, history(environment)).run(analyze(expression))).eval(environment)
+
+
+def evaluate_sequence(expression_lst: Expression, environment: Environment) -> ComputationalObject:
+    optimizer = Optimizer(list_to_pylist(expression_lst), history(environment))
+    return resolve(optimizer.run(analyze_sequence(expression_lst))).eval(environment)
+
+
+def bound_names(expression: Expression) -> Counter:
+    """统计程序里每个名字在 define / set! / let / letrec / do / lambda / define-record-type / let/ec 绑定位置出现的次数，不递归，大程序也不会爆栈"""
+    names = Counter()
+
+    stack = [expression]
+    while stack:
+        e = stack.pop()
+        if not isinstance(e, Pair):
+            continue
+
+        head = e.car
+        second = e.cdr.car if isinstance(e.cdr, Pair) else None
+
+        if head == Symbol('define') or head == Symbol('set!'):
+            if isinstance(second, Pair):
+                names.update(_symbol_names(second))
+            elif isinstance(second, Symbol):
+                names[second.value] += 1
+        elif head == Symbol('lambda'):
+            names.update(_symbol_names(second))
+        elif head == Symbol('let') or head == Symbol('letrec') or head == Symbol('do'):
+            if isinstance(second, Symbol):
+                # 命名 let
+                names[second.value] += 1
+                second = e.cdr.cdr.car if isinstance(e.cdr.cdr, Pair) else None
+            names.update(_symbol_names([b.car for b in list_to_pylist(second) if isinstance(b, Pair)]))
+        elif SRecordTypeDefinition.adapt(e):
+            names.update(SRecordTypeDefinition(e).names())
+        elif head == Symbol('let/ec') and isinstance(second, Symbol):
+            names[second.value] += 1
+
+        while isinstance(e, Pair):
+            stack.append(e.car)
+            e = e.cdr
+
+    return names
+
+
+def referenced_names(expression: Expression) -> Counter:
+    """统计表达式里每个符号出现的次数，跳过 quote 里的数据"""
+    names = Counter()
+
+    stack = [expression]
+    while stack:
+        e = stack.pop()
+        if isinstance(e, Symbol):
+            names[e.value] += 1
+        elif isinstance(e, Pair) and not SQuoted.adapt(e):
+            while isinstance(e, Pair):
+                stack.append(e.car)
+                e = e.cdr
+
+    return names
+
+
+def rename(expression: Expression, mapping: Dict[str, str]) -> Expression:
+    """把表达式里的符号按 mapping 改名，quote 里的数据保持不变"""
+    if isinstance(expression, Symbol):
+        return Symbol(mapping.get(expression.value, expression.value))
+    elif isinstance(expression, Pair) and not SQuoted.adapt(expression):
+        return pylist_to_list([rename(e, mapping) for e in list_to_pylist(expression)])
+    return expression
+
+
+def _symbol_names(lst) -> List[str]:
+    if not isinstance(lst, list):
+        lst = list_to_pylist(lst)
+    return [o.value for o in lst if isinstance(o, Symbol)]
+
+
+def size(code: Analyzer) -> int:
+    """分析树的节点数；守卫只计入优化后的部分"""
+    n = 0
+    stack = [code]
+    while stack:
+        c = stack.pop()
+        if isinstance(c, AGuarded):
+            stack.append(c.fast)
+            continue
+        n += 1
+        stack.extend(c.children())
+    return n
+
+
+class InlineCandidate(object):
+    """可以内联的全局过程：形参表和过程体"""
+
+    def __init__(self, name: str, parameter: Parameter, body: Expression):
+        self.name: str = name
+        self.parameter: Parameter = parameter
+        self.body: Expression = body
+        self.references: Counter = referenced_names(body)
+        # 分析树里对应的 define 节点，内联处的守卫靠它确认全局变量仍绑定着这个过程
+        self.definition: Optional[ADefinition] = None
+
+
+class Optimizer(object):
+    def __init__(self, forms: List[Expression], history: Optional[Counter] = None):
+        # 这段程序里的绑定；history 是同一个全局环境里先前求值的绑定，合并进来之后记下这次的
+        self.bindings: Counter = Counter()
+        for form in forms:
+            self.bindings.update(bound_names(form))
+
+        self.global_bindings: Counter = self.bindings.copy()
+        if history is not None:
+            self.global_bindings.update(history)
+            history.update(self.bindings)
+
+        self.removed: int = 0
+        self.inlined: int = 0
+
+        self.candidates: Dict[str, InlineCandidate] = {}
+        if config.inline:
+            self.candidates = self._inline_candidates(forms)
+
+        # 正在展开的过程和对应的形参代入，防止相互调用的过程无限展开
+        self._inlining: List[str] = []
+        self._substitutions: List[Dict[str, Analyzer]] = []
+        self._fresh = count()
+
+    def _inline_candidates(self, forms: List[Expression]) -> Dict[str, InlineCandidate]:
+        definitions = {}
+        for form in forms:
+            if SDefinition.adapt(form):
+                d = SDefinition(form)
+                definitions[d.name.value] = InlineCandidate(d.name.value, d.parameter, d.body)
+
+        candidates = {}
+        for name, candidate in definitions.items():
+            # 只定义过一次、没有被 set! 或局部绑定遮蔽
+            if self.bindings[name] != 1:
+                continue
+
+            # 不递归调用自己，过程体里不引入新的绑定
+            if name in candidate.references or BINDING_FORMS & set(candidate.references):
+                continue
+
+            # 自由变量在任何地方都没有被局部绑定，展开到调用处后仍指向同一个全局值
+            free = set(candidate.references) - set(candidate.parameter.names)
+            if any(self.bindings[v] > (1 if v in definitions else 0) for v in free):
+                continue
+
+            if size(analyze_sequence(candidate.body)) > config.inline_budget:
+                continue
+
+            candidates[name] = candidate
+
+        return candidates
+
+    def run(self, code: Analyzer) -> Analyzer:
+        """优化整棵分析树，记录删除的节点数"""
+        self._find_definitions(code)
+
+        before = size(code)
+        code = self.optimize(code)
+        removed = before - size(code)
+
+        self.removed += removed
+        stats['removed'] += removed
+        return code
+
+    def _find_definitions(self, code: Analyzer):
+        """在顶层找到候选过程的 define 节点，找不到的不内联"""
+        for c in code.sequence if isinstance(code, ASequence) else [code]:
+            if isinstance(c, ADefinition) and c.name in self.candidates:
+                self.candidates[c.name].definition = c
+        self.candidates = {name: c for name, c in self.candidates.items() if c.definition is not None}
+
+    def optimize(self, code: Analyzer) -> Analyzer:
+        if isinstance(code, AVariable) and self._substitutions:
+            substitution = self._substitutions[-1].get(code.name)
+            if substitution is not None:
+                return substitution
+        return code.optimize(self)
+
+    def inline(self, application: AApplication) -> Optional[Analyzer]:
+        """展开对小全局过程的调用，不能展开时返回 None
+
+        形参先改成不会和任何名字冲突的新名字；字面量、变量和只用到一次的参数直接代入过程体，
+        其余参数保留按需求值的语义，绑定到 thunk 上
+        """
+        if not isinstance(application.proc, AVariable):
+            return None
+
+        candidate = self.candidates.get(application.proc.name)
+        if candidate is None or candidate.name in self._inlining \
+                or len(candidate.parameter.names) != application.arg_count:
+            return None
+
+        fresh = {name: '{}@inline{}'.format(name, next(self._fresh)) for name in candidate.parameter.names}
+
+        substitution = {}
+        binding_lst = []
+        for name, arg in zip(candidate.parameter.names, application.arg_lst):
+            if self.is_pure(arg) or candidate.references[name] <= 1:
+                substitution[fresh[name]] = arg
+            else:
+                binding_lst.append((fresh[name], arg))
+
+        code = analyze_sequence(rename(candidate.body, fresh))
+
+        self._inlining.append(candidate.name)
+        self._substitutions.append(substitution)
+        try:
+            code = self.optimize(code)
+        finally:
+            self._substitutions.pop()
+            self._inlining.pop()
+
+        self.inlined += 1
+        stats['inlined'] += 1
+
+        if binding_lst:
+            code = AInlinedCall(binding_lst, code)
+        # 之后的求值可能重新定义这个过程，守卫不成立时照常调用
+        return self.assume([DefinedBy(candidate.name, candidate.definition)], code, application)
+
+    def is_foldable(self, name: str) -> bool:
+        return name in FOLDABLE_PRIMITIVES and not self.global_bindings[name]
+
+    @staticmethod
+    def is_literal(code: Analyzer) -> bool:
+        return isinstance(code, (ASelfEvaluating, AQuoted))
+
+    @classmethod
+    def is_constant(cls, code: Analyzer) -> bool:
+        """字面量，或者折叠出来、带着守卫的字面量"""
+        return cls.is_literal(code) or isinstance(code, AGuarded) and cls.is_literal(code.fast)
+
+    @staticmethod
+    def constant_value(code: Analyzer) -> ComputationalObject:
+        if isinstance(code, AGuarded):
+            code = code.fast
+        return code.eval(None)
+
+    @classmethod
+    def literal_is_true(cls, code: Analyzer) -> bool:
+        return is_true(cls.constant_value(code))
+
+    @staticmethod
+    def assume(assumptions: List, fast: Analyzer, fallback: Analyzer, basis: List[Analyzer] = ()) -> Analyzer:
+        """依据 assumptions 和 basis 里折叠出来的常量把 fallback 变换成了 fast，套上守卫
+
+        basis 里带守卫的常量，其假定一并并入；fast 自身带着守卫时合并成一层；没有任何假定时直接返回 fast
+        """
+        merged = {}
+        for code in list(basis) + [fast]:
+            if isinstance(code, AGuarded):
+                merged.update((a.name, a) for a in code.assumptions)
+        merged.update((a.name, a) for a in assumptions)
+        if isinstance(fast, AGuarded):
+            fast = fast.fast
+
+        if not merged:
+            return fast
+        return AGuarded(tuple(merged.values()), fast, fallback)
+
+    @classmethod
+    def is_pure(cls, code: Analyzer) -> bool:
+        """求值没有副作用，结果不被使用时可以删掉"""
+        return cls.is_literal(code) or isinstance(code, AVariable)
+
+    @staticmethod
+    def literal(value: ComputationalObject) -> Analyzer:
+        return ASelfEvaluating(value)
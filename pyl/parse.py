@@ -1,18 +1,20 @@
 # -*- coding:utf8 -*-
 
 import re
-from typing import Optional, List
+from typing import Optional, List, Tuple
 
-from pyl.datatype import Expression, NIL, Number, Symbol, String, Boolean, Pair
+from pyl.datatype import Expression, NIL, Number, Symbol, String, Boolean, Vector, compact_list
 from pyl.evaluator import EQuoted
+from pyl.hashcons import InternTable, current_table
 from pyl.structure import SQuoted
 
 
 # Lisp grammar
 
-# Expression := Primitive | List | Quoted
+# Expression := Primitive | List | Vector | Quoted
 # Primitive := Number | Symbol | String | Boolean
 # List := "(" ")" | "(" Sequence ")"
+# Vector := "#(" ")" | "#(" Sequence ")"
 # Sequence := Expression Sequence | Expression
 # Quoted := "`" Expression | "'" Expression
 
@@ -45,6 +47,11 @@ class TLeftPar(Token):
     value = '('
 
 
+class TVectorStart(Token):
+    pattern = re.compile(r'#\(')
+    value = '#('
+
+
 class TRightPar(Token):
     pattern = re.compile(r'\)')
     value = ')'
@@ -110,6 +117,7 @@ token_by_preference = [
     TBlank,
     TComments,
     TLeftPar,
+    TVectorStart,
     TRightPar,
     TQuoteMark,
     TNumber,
@@ -120,28 +128,42 @@ token_by_preference = [
 ]
 
 
-def tokenize(text):
-    rest = text
+def scan(text):
+    """逐个产生 (token, 结束位置)，不含 EOF"""
+    pos = 0
 
-    while rest:
+    while pos < len(text):
         for token_class in token_by_preference:
-            match = token_class.pattern.match(rest)
+            match = token_class.pattern.match(text, pos)
 
             if match:
-                rest = rest[match.end():]
+                pos = match.end()
                 if not token_class.ignore:
-                    yield token_class(match.group())
+                    yield token_class(match.group()), pos
                 break
         else:
             raise ParseError('tokenize error')
 
+
+def tokenize(text):
+    for token, _ in scan(text):
+        yield token
+
     yield EOF
 
 
 class Parser(object):
-    def __init__(self, token_lst):
+    def __init__(self, token_lst, table: Optional[InternTable] = None):
         self.token_lst = iter(token_lst)
         self.buffer = []
+        # hash-consing 用的驻留表，为 None 时不共享
+        self.table: Optional[InternTable] = table
+
+    def share(self, o):
+        """换成驻留表里结构相等的那一份"""
+        if self.table is None or o is None:
+            return o
+        return self.table.intern(o)
 
     def foresee(self, number=1):
         assert number >= 1
@@ -222,25 +244,45 @@ class Parser(object):
 
                 return seq
 
+    def parse_vector(self):
+        t = self.foresee()
+        if t.is_a(TVectorStart):
+            self.cut()  # cut #(
+            elements = []
+            while not self.foresee().is_a(TRightPar):
+                element = self.parse_expression()
+                if element is None:
+                    self.error('a closing right parenthesis wanted')
+                elements.append(element)
+            self.cut()  # cut )
+
+            return Vector(elements)
+
     def parse_sequence(self):
-        car = self.parse_expression()
-        if not car:
-            return None
+        # 元素收进数组，整个表建成一个 CompactList；循环读取，长表不会爆栈
+        elements = []
+        while True:
+            e = self.parse_expression()
+            if e is None:
+                break
+            elements.append(e)
 
-        cdr = self.parse_sequence()
-        if not cdr:
-            return Pair(car, NIL)
-        else:
-            return Pair(car, cdr)
+        if not elements:
+            return None
+        return compact_list(elements)
 
     def parse_expression(self):
         pri = self.parse_primitive()
         if pri is not None:
-            return pri
+            return self.share(pri)
 
         lis = self.parse_list()
         if lis is not None:
-            return lis
+            return self.share(lis)
+
+        vec = self.parse_vector()
+        if vec is not None:
+            return vec
 
         quo = self.parse_quoted()
         if quo is not None:
@@ -260,12 +302,38 @@ class Parser(object):
 
 def parse(code: Optional[str] = None, token_lst: Optional[List[Token]] = None) -> Expression:
     token_lst = token_lst or tokenize(code)
-    return Parser(token_lst).parse_expression()
+    return Parser(token_lst, current_table()).parse_expression()
+
+
+def read_datum(text: str, eof: bool = True) -> Optional[Tuple[Expression, int]]:
+    """从 text 开头读出一个完整的表达式，返回表达式和它结束的位置，供端口的 read 使用
+
+    text 里还没有完整的表达式时返回 None；eof 为假表示后面可能还有文本，结尾处的原子可能没读全，也返回 None
+    读出的是可以修改的数据，不做 hash-consing
+    """
+    depth = 0
+
+    for token, end in scan(text):
+        if token.is_a(TLeftPar) or token.is_a(TVectorStart):
+            depth += 1
+        elif token.is_a(TRightPar):
+            depth -= 1
+            if depth < 0:
+                raise ParseError('unexpected right parenthesis')
+        elif token.is_a(TQuoteMark):
+            continue
+
+        if depth == 0:
+            if end == len(text) and not eof and not token.is_a(TRightPar):
+                return None
+            return Parser(tokenize(text[:end])).parse_expression(), end
+
+    return None
 
 
 def parse_sequence(code: Optional[str] = None, token_lst: Optional[List[Token]] = None) -> Expression:
     token_lst = token_lst or tokenize(code)
-    return Parser(token_lst).parse()
+    return Parser(token_lst, current_table()).parse()
 
 
 # sample_code = '''
@@ -0,0 +1,221 @@
+# -*- coding:utf8 -*-
+
+"""Ports -- 输入输出端口
+
+端口包装 python 的文本流：文件、字符串、标准输入输出
+输出经过缓冲，显式 flush 或关闭端口时才真正写出；只读的大文件可以用 mmap 打开，按需读入页面，不整体复制到内存
+"""
+
+import codecs
+import io
+import mmap
+import os
+import sys
+from typing import Optional, List, TextIO
+
+from .datatype import ComputationalObject, Bytevector
+
+# 文件端口的缓冲区大小
+BUFFER_SIZE = 1 << 16
+
+
+class EofObject(ComputationalObject):
+    def __str__(self):
+        return '#<eof>'
+
+
+EOF_OBJECT = EofObject()
+
+
+class Port(ComputationalObject):
+    closed = False
+
+    def close(self):
+        self.closed = True
+
+
+class InputPort(Port):
+    """输入端口
+
+    read 为了判断表达式是否完整会多读一些文本，没用完的部分放在 pending 里，之后的读取先从这里取
+    """
+
+    def __init__(self, stream: Optional[TextIO] = None):
+        self._stream: Optional[TextIO] = stream
+        self.pending: str = ''
+
+    @property
+    def stream(self) -> TextIO:
+        return self._stream
+
+    def _read_line(self) -> str:
+        """读一行，带着换行符；读完返回空串"""
+        return self.stream.readline()
+
+    def _read_char(self) -> str:
+        return self.stream.read(1)
+
+    def read_line(self) -> Optional[str]:
+        """读一行，去掉换行符；读完返回 None"""
+        if self.pending:
+            line, newline, self.pending = self.pending.partition('\n')
+            if not newline:
+                line += self._read_line()
+        else:
+            line = self._read_line()
+            if not line:
+                return None
+
+        if line.endswith('\n'):
+            line = line[:-1]
+        return line
+
+    def read_char(self) -> Optional[str]:
+        if self.pending:
+            c, self.pending = self.pending[0], self.pending[1:]
+            return c
+        return self._read_char() or None
+
+    def read_text(self) -> str:
+        """读 read 用的下一段文本，读完返回空串"""
+        text, self.pending = self.pending, ''
+        return text or self._read_line()
+
+    def unread(self, text: str):
+        self.pending = text + self.pending
+
+    def close(self):
+        super(InputPort, self).close()
+        if self._stream is not None:
+            self._stream.close()
+
+    def __str__(self):
+        return '#<input-port>'
+
+
+class ConsoleInputPort(InputPort):
+    """标准输入，每次用当前的 sys.stdin，不关闭"""
+
+    @property
+    def stream(self) -> TextIO:
+        return sys.stdin
+
+    def close(self):
+        pass
+
+
+class MmapInputPort(InputPort):
+    """把只读文件映射到内存，按行、按字符解码，不把整个文件读进来"""
+
+    def __init__(self, path: str):
+        super(MmapInputPort, self).__init__()
+        with open(path, 'rb') as fd:
+            # 空文件不能映射，当作已经读完
+            self.map: Optional[mmap.mmap] = \
+                mmap.mmap(fd.fileno(), 0, access=mmap.ACCESS_READ) if os.fstat(fd.fileno()).st_size else None
+        self.decoder = codecs.getincrementaldecoder('utf-8')()
+
+    def _read_line(self) -> str:
+        if self.map is None:
+            return ''
+        return self.map.readline().decode('utf-8')
+
+    def _read_char(self) -> str:
+        while self.map is not None:
+            b = self.map.read(1)
+            if not b:
+                break
+            c = self.decoder.decode(b)
+            if c:
+                return c
+        return ''
+
+    def close(self):
+        super(MmapInputPort, self).close()
+        if self.map is not None:
+            self.map.close()
+
+
+class OutputPort(Port):
+    def __init__(self, stream: Optional[TextIO] = None):
+        self._stream: Optional[TextIO] = stream
+
+    @property
+    def stream(self) -> TextIO:
+        return self._stream
+
+    def write(self, text: str):
+        self.stream.write(text)
+
+    def flush(self):
+        self.stream.flush()
+
+    def close(self):
+        super(OutputPort, self).close()
+        self._stream.close()
+
+    def __str__(self):
+        return '#<output-port>'
+
+
+class StringOutputPort(OutputPort):
+    def __init__(self):
+        super(StringOutputPort, self).__init__(io.StringIO())
+
+    def getvalue(self) -> str:
+        return self._stream.getvalue()
+
+
+class ConsoleOutputPort(OutputPort):
+    """标准输出，每次用当前的 sys.stdout，不关闭"""
+
+    @property
+    def stream(self) -> TextIO:
+        return sys.stdout
+
+    def close(self):
+        self.flush()
+
+
+def open_input_file(path: str, use_mmap: bool = False) -> InputPort:
+    if use_mmap:
+        return MmapInputPort(path)
+    return InputPort(io.open(path, 'r', buffering=BUFFER_SIZE))
+
+
+def open_output_file(path: str) -> OutputPort:
+    return OutputPort(io.open(path, 'w', buffering=BUFFER_SIZE))
+
+
+def read_bytevector(path: str, use_mmap: bool = False) -> Bytevector:
+    """把整个文件读成字节向量；use_mmap 时只读地映射文件，按需读入页面，不复制到内存"""
+    with open(path, 'rb') as fd:
+        if not use_mmap:
+            return Bytevector(bytearray(fd.read()))
+        # 空文件不能映射
+        if not os.fstat(fd.fileno()).st_size:
+            return Bytevector()
+        return Bytevector(mmap.mmap(fd.fileno(), 0, access=mmap.ACCESS_READ))
+
+
+def write_bytevector(bv: Bytevector, path: str):
+    with open(path, 'wb') as fd:
+        fd.write(bv.view)
+
+
+console_input_port = ConsoleInputPort()
+
+# with-output-to-file 时压入文件端口，栈顶为当前输出端口
+_output_ports: List[OutputPort] = [ConsoleOutputPort()]
+
+
+def current_output_port() -> OutputPort:
+    return _output_ports[-1]
+
+
+def push_output_port(port: OutputPort):
+    _output_ports.append(port)
+
+
+def pop_output_port() -> OutputPort:
+    return _output_ports.pop()
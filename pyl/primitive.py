@@ -2,10 +2,19 @@
 
 """ Primitive Procedures -- 原始过程及其实现"""
 
+import io
+import operator
+import struct
 from typing import List
 
-from .datatype import ComputationalObject, Number, Boolean, Symbol
+from .datatype import ComputationalObject, Number, Boolean, Symbol, String, Pair, NIL, is_true, HashTable, Vector, \
+    is_eq, is_eqv, is_equal, PersistentMap, PersistentVector, StringBuilder, Bytevector
 from pyl.datatype import Parameter, ProcedureBase
+from pyl.helpers import list_to_pylist, pylist_to_list, list_length, list_tail
+from pyl.lazy import Thunk, Promise
+from pyl.parse import ParseError, read_datum, scan
+from pyl import port as ports, printer
+from pyl.serialize import dump, load
 
 
 class Primitive(object):
@@ -21,7 +30,14 @@ class Plus(Primitive, ProcedureBase):
     parameter = Parameter(['a', 'b'])
 
     def call(self, *nums: List[ComputationalObject]) -> ComputationalObject:
-        return Number(sum([x.value for x in nums]))
+        if len(nums) == 2:
+            return Number(nums[0].value + nums[1].value)
+
+        # 多个参数时只累加裸值，最后装箱一次
+        total = 0
+        for x in nums:
+            total += x.value
+        return Number(total)
 
 
 class Minus(Primitive, ProcedureBase):
@@ -29,8 +45,16 @@ class Minus(Primitive, ProcedureBase):
 
     parameter = Parameter(['a', 'b'])
 
-    def call(self, a, b):
-        return Number(a.value - b.value)
+    def call(self, a, *rest):
+        if len(rest) == 1:
+            return Number(a.value - rest[0].value)
+        elif not rest:
+            return Number(-a.value)
+
+        ret = a.value
+        for x in rest:
+            ret -= x.value
+        return Number(ret)
 
 
 class Multiply(Primitive, ProcedureBase):
@@ -38,8 +62,14 @@ class Multiply(Primitive, ProcedureBase):
 
     parameter = Parameter(['a', 'b'])
 
-    def call(self, a, b):
-        return Number(a.value * b.value)
+    def call(self, *nums):
+        if len(nums) == 2:
+            return Number(nums[0].value * nums[1].value)
+
+        ret = 1
+        for x in nums:
+            ret *= x.value
+        return Number(ret)
 
 
 class Divide(Primitive, ProcedureBase):
@@ -47,8 +77,16 @@ class Divide(Primitive, ProcedureBase):
 
     parameter = Parameter(['a', 'b'])
 
-    def call(self, a, b):
-        return Number(a.value / b.value)
+    def call(self, a, *rest):
+        if len(rest) == 1:
+            return Number(a.value / rest[0].value)
+        elif not rest:
+            return Number(1 / a.value)
+
+        ret = a.value
+        for x in rest:
+            ret /= x.value
+        return Number(ret)
 
 
 class Remainder(Primitive, ProcedureBase):
@@ -60,31 +98,68 @@ class Remainder(Primitive, ProcedureBase):
         return Number(a.value % b.value)
 
 
-class Equal(Primitive, ProcedureBase):
+class Comparison(Primitive, ProcedureBase):
+    """数值比较，多个参数时逐对比较，全部成立才为真：(< a b c) 即 a < b < c"""
+
+    parameter = Parameter(['a', 'b'])
+
+    @staticmethod
+    def compare(a, b) -> bool:
+        raise NotImplementedError
+
+    def call(self, a, b, *rest):
+        if not rest:
+            return Boolean(self.compare(a.value, b.value))
+
+        values = [a.value, b.value]
+        values.extend(x.value for x in rest)
+        compare = self.compare
+        for i in range(len(values) - 1):
+            if not compare(values[i], values[i + 1]):
+                return Boolean(False)
+        return Boolean(True)
+
+
+class Equal(Comparison):
     keyword = '='
+    compare = staticmethod(operator.eq)
+
+
+class GreaterThan(Comparison):
+    keyword = '>'
+    compare = staticmethod(operator.gt)
+
+
+class LessThan(Comparison):
+    keyword = '<'
+    compare = staticmethod(operator.lt)
+
+
+class IsEq(Primitive, ProcedureBase):
+    keyword = 'eq?'
 
     parameter = Parameter(['a', 'b'])
 
     def call(self, a, b):
-        return Boolean(a.value == b.value)
+        return Boolean(is_eq(a, b))
 
 
-class GreaterThan(Primitive, ProcedureBase):
-    keyword = '>'
+class IsEqv(Primitive, ProcedureBase):
+    keyword = 'eqv?'
 
     parameter = Parameter(['a', 'b'])
 
     def call(self, a, b):
-        return Boolean(a.value > b.value)
+        return Boolean(is_eqv(a, b))
 
 
-class LessThan(Primitive, ProcedureBase):
-    keyword = '<'
+class IsEqual(Primitive, ProcedureBase):
+    keyword = 'equal?'
 
     parameter = Parameter(['a', 'b'])
 
     def call(self, a, b):
-        return Boolean(a.value < b.value)
+        return Boolean(is_equal(a, b))
 
 
 class Car(Primitive, ProcedureBase):
@@ -105,16 +180,1311 @@ class Cdr(Primitive, ProcedureBase):
         return expr.cdr
 
 
+class SetCar(Primitive, ProcedureBase):
+    keyword = 'set-car!'
+
+    parameter = Parameter(['pair', 'o'])
+
+    def call(self, pair, o):
+        pair.car = o
+        return Symbol('ok')
+
+
+class SetCdr(Primitive, ProcedureBase):
+    keyword = 'set-cdr!'
+
+    parameter = Parameter(['pair', 'o'])
+
+    def call(self, pair, o):
+        pair.cdr = o
+        return Symbol('ok')
+
+
 class Display(Primitive, ProcedureBase):
     keyword = 'display'
 
     parameter = Parameter(['o'])
 
     def call(self, o):
-        print(o)
+        port = ports.current_output_port()
+        printer.display(o, port)
+        port.write('\n')
         return Symbol('display')
 
 
+class Write(Primitive, ProcedureBase):
+    """和 display 一样每次输出一行，但字符串带引号和转义，输出可以被 read 读回"""
+    keyword = 'write'
+
+    parameter = Parameter(['o', 'port'])
+
+    def call(self, o, port=None):
+        port = port or ports.current_output_port()
+        printer.write(o, port)
+        port.write('\n')
+        return Symbol('ok')
+
+
+def apply_procedure(proc, *args) -> ComputationalObject:
+    """在原始过程内部回调 scheme 过程，返回已求值的结果"""
+    return Thunk.force(proc.call(*args))
+
+
+class Cons(Primitive, ProcedureBase):
+    keyword = 'cons'
+
+    parameter = Parameter(['a', 'b'])
+
+    def call(self, a, b):
+        return Pair(a, b)
+
+
+class MakeList(Primitive, ProcedureBase):
+    keyword = 'list'
+
+    parameter = Parameter(['items'])
+
+    def call(self, *items):
+        return pylist_to_list(items)
+
+
+class Length(Primitive, ProcedureBase):
+    keyword = 'length'
+
+    parameter = Parameter(['lst'])
+
+    def call(self, lst):
+        return Number(list_length(lst))
+
+
+class Append(Primitive, ProcedureBase):
+    keyword = 'append'
+
+    parameter = Parameter(['lsts'])
+
+    def call(self, *lsts):
+        if not lsts:
+            return NIL
+
+        # 最后一个列表不复制，直接共享作为结果的尾部
+        ret = lsts[-1]
+        for lst in reversed(lsts[:-1]):
+            ret = pylist_to_list(list_to_pylist(lst), tail=ret)
+        return ret
+
+
+class Reverse(Primitive, ProcedureBase):
+    keyword = 'reverse'
+
+    parameter = Parameter(['lst'])
+
+    def call(self, lst):
+        ret = NIL
+        while isinstance(lst, Pair):
+            ret = Pair(lst.car, ret)
+            lst = lst.cdr
+        return ret
+
+
+class ListRef(Primitive, ProcedureBase):
+    keyword = 'list-ref'
+
+    parameter = Parameter(['lst', 'k'])
+
+    def call(self, lst, k):
+        lst = list_tail(lst, k.value)
+        if not isinstance(lst, Pair):
+            raise IndexError('list-ref: index {} out of range'.format(k.value))
+        return lst.car
+
+
+class Map(Primitive, ProcedureBase):
+    keyword = 'map'
+
+    parameter = Parameter(['proc', 'lst'])
+
+    def call(self, proc, *lsts):
+        if len(lsts) == 1:
+            ret = [apply_procedure(proc, x) for x in list_to_pylist(lsts[0])]
+        else:
+            ret = [apply_procedure(proc, *xs) for xs in zip(*map(list_to_pylist, lsts))]
+        return pylist_to_list(ret)
+
+
+class Filter(Primitive, ProcedureBase):
+    keyword = 'filter'
+
+    parameter = Parameter(['pred', 'lst'])
+
+    def call(self, pred, lst):
+        return pylist_to_list(
+            [x for x in list_to_pylist(lst) if is_true(apply_procedure(pred, x))]
+        )
+
+
+class FoldLeft(Primitive, ProcedureBase):
+    keyword = 'fold-left'
+
+    parameter = Parameter(['proc', 'initial', 'lst'])
+
+    def call(self, proc, initial, lst):
+        acc = initial
+        while isinstance(lst, Pair):
+            acc = apply_procedure(proc, acc, lst.car)
+            lst = lst.cdr
+        return acc
+
+
+class FoldRight(Primitive, ProcedureBase):
+    keyword = 'fold-right'
+
+    parameter = Parameter(['proc', 'initial', 'lst'])
+
+    def call(self, proc, initial, lst):
+        acc = initial
+        for x in reversed(list_to_pylist(lst)):
+            acc = apply_procedure(proc, x, acc)
+        return acc
+
+
+class Assoc(Primitive, ProcedureBase):
+    keyword = 'assoc'
+
+    parameter = Parameter(['key', 'alist'])
+
+    def call(self, key, alist):
+        while isinstance(alist, Pair):
+            entry = alist.car
+            if isinstance(entry, Pair) and entry.car == key:
+                return entry
+            alist = alist.cdr
+        return Boolean(False)
+
+
+class Member(Primitive, ProcedureBase):
+    keyword = 'member'
+
+    parameter = Parameter(['o', 'lst'])
+
+    def call(self, o, lst):
+        while isinstance(lst, Pair):
+            if lst.car == o:
+                return lst
+            lst = lst.cdr
+        return Boolean(False)
+
+
+class _SortKey(object):
+    """让 python 的 timsort 用 scheme 过程作比较，每次比较只回调一次"""
+    __slots__ = ('o', 'less')
+
+    def __init__(self, o, less):
+        self.o = o
+        self.less = less
+
+    def __lt__(self, other):
+        return is_true(apply_procedure(self.less, self.o, other.o))
+
+
+class Sort(Primitive, ProcedureBase):
+    keyword = 'sort'
+
+    parameter = Parameter(['lst', 'less'])
+
+    def call(self, lst, less):
+        py_lst = list_to_pylist(lst)
+
+        # 常见的 (sort lst <) 直接按数值排，不必回调
+        if isinstance(less, LessThan) and all(isinstance(x, Number) for x in py_lst):
+            py_lst.sort(key=lambda x: x.value)
+        else:
+            py_lst.sort(key=lambda x: _SortKey(x, less))
+
+        return pylist_to_list(py_lst)
+
+
+class Force(Primitive, ProcedureBase):
+    keyword = 'force'
+
+    parameter = Parameter(['promise'])
+
+    def call(self, promise):
+        if isinstance(promise, Promise):
+            return promise.force()
+        return promise
+
+
+class MakePromise(Primitive, ProcedureBase):
+    keyword = 'make-promise'
+
+    parameter = Parameter(['o'])
+
+    def call(self, o):
+        if isinstance(o, Promise):
+            return o
+        return Promise.forced(o)
+
+
+def stream_cdr(stream: Pair) -> ComputationalObject:
+    return stream.cdr.force()
+
+
+def stream_map(proc, streams: List[ComputationalObject]) -> ComputationalObject:
+    if any(s is NIL for s in streams):
+        return NIL
+    return Pair(apply_procedure(proc, *[s.car for s in streams]),
+                Promise.defer(lambda: stream_map(proc, [stream_cdr(s) for s in streams])))
+
+
+def stream_filter(pred, stream: ComputationalObject) -> ComputationalObject:
+    # 跳过不满足条件的元素是循环，连续很长一段不满足也不会爆栈
+    while stream is not NIL and not is_true(apply_procedure(pred, stream.car)):
+        stream = stream_cdr(stream)
+
+    if stream is NIL:
+        return NIL
+    return Pair(stream.car, Promise.defer(lambda: stream_filter(pred, stream_cdr(stream))))
+
+
+class StreamCar(Primitive, ProcedureBase):
+    keyword = 'stream-car'
+
+    parameter = Parameter(['stream'])
+
+    def call(self, stream):
+        return stream.car
+
+
+class StreamCdr(Primitive, ProcedureBase):
+    keyword = 'stream-cdr'
+
+    parameter = Parameter(['stream'])
+
+    def call(self, stream):
+        return stream_cdr(stream)
+
+
+class IsStreamNull(Primitive, ProcedureBase):
+    keyword = 'stream-null?'
+
+    parameter = Parameter(['stream'])
+
+    def call(self, stream):
+        return Boolean(stream is NIL)
+
+
+class StreamMap(Primitive, ProcedureBase):
+    """结果仍是惰性的流，元素在走到时才计算"""
+    keyword = 'stream-map'
+
+    parameter = Parameter(['proc', 'stream'])
+
+    def call(self, proc, *streams):
+        return stream_map(proc, list(streams))
+
+
+class StreamFilter(Primitive, ProcedureBase):
+    keyword = 'stream-filter'
+
+    parameter = Parameter(['pred', 'stream'])
+
+    def call(self, pred, stream):
+        return stream_filter(pred, stream)
+
+
+class StreamTake(Primitive, ProcedureBase):
+    """(stream-take stream n)，取流的前 n 个元素，返回列表"""
+    keyword = 'stream-take'
+
+    parameter = Parameter(['stream', 'n'])
+
+    def call(self, stream, n):
+        ret = []
+        for _ in range(n.value):
+            if stream is NIL:
+                break
+            ret.append(stream.car)
+            stream = stream_cdr(stream)
+        return pylist_to_list(ret)
+
+
+class StreamForEach(Primitive, ProcedureBase):
+    """逐个元素调用 proc；只持有当前位置，走过的部分可以回收，遍历无穷长的流也只占常量内存"""
+    keyword = 'stream-for-each'
+
+    parameter = Parameter(['proc', 'stream'])
+
+    def call(self, proc, stream):
+        while stream is not NIL:
+            apply_procedure(proc, stream.car)
+            stream = stream_cdr(stream)
+        return Symbol('ok')
+
+
+class MakeHashTable(Primitive, ProcedureBase):
+    keyword = 'make-hash-table'
+
+    parameter = Parameter([])
+
+    def call(self, *args):
+        return HashTable()
+
+
+class HashTableRef(Primitive, ProcedureBase):
+    """(hash-table-ref table key [failure])，key 不存在时调用无参过程 failure"""
+    keyword = 'hash-table-ref'
+
+    parameter = Parameter(['table', 'key', 'failure'])
+
+    def call(self, table, key, failure=None):
+        try:
+            return table.table[key]
+        except KeyError:
+            if failure is None:
+                raise KeyError('hash-table-ref: no value for key {}'.format(key))
+            return apply_procedure(failure)
+
+
+class HashTableSet(Primitive, ProcedureBase):
+    keyword = 'hash-table-set!'
+
+    parameter = Parameter(['table', 'key', 'value'])
+
+    def call(self, table, key, value):
+        table.table[key] = value
+        return Symbol('ok')
+
+
+class HashTableDelete(Primitive, ProcedureBase):
+    keyword = 'hash-table-delete!'
+
+    parameter = Parameter(['table', 'key'])
+
+    def call(self, table, key):
+        table.table.pop(key, None)
+        return Symbol('ok')
+
+
+class HashTableCount(Primitive, ProcedureBase):
+    keyword = 'hash-table-count'
+
+    parameter = Parameter(['table'])
+
+    def call(self, table):
+        return Number(len(table.table))
+
+
+class HashTableKeys(Primitive, ProcedureBase):
+    keyword = 'hash-table-keys'
+
+    parameter = Parameter(['table'])
+
+    def call(self, table):
+        return pylist_to_list(list(table.table))
+
+
+class HashTableUpdate(Primitive, ProcedureBase):
+    """(hash-table-update! table key proc [failure])，以 (proc 旧值) 作为新值"""
+    keyword = 'hash-table-update!'
+
+    parameter = Parameter(['table', 'key', 'proc', 'failure'])
+
+    def call(self, table, key, proc, failure=None):
+        value = HashTableRef().call(table, key, failure)
+        table.table[key] = apply_procedure(proc, value)
+        return Symbol('ok')
+
+
+class MakeVector(Primitive, ProcedureBase):
+    keyword = 'make-vector'
+
+    parameter = Parameter(['k', 'fill'])
+
+    def call(self, k, fill=Number(0)):
+        return Vector([fill] * k.value)
+
+
+class MakeVectorFromElements(Primitive, ProcedureBase):
+    keyword = 'vector'
+
+    parameter = Parameter(['elements'])
+
+    def call(self, *elements):
+        return Vector(elements)
+
+
+class VectorRef(Primitive, ProcedureBase):
+    keyword = 'vector-ref'
+
+    parameter = Parameter(['vector', 'k'])
+
+    def call(self, vector, k):
+        return vector.ref(k.value)
+
+
+class VectorSet(Primitive, ProcedureBase):
+    keyword = 'vector-set!'
+
+    parameter = Parameter(['vector', 'k', 'o'])
+
+    def call(self, vector, k, o):
+        vector.set(k.value, o)
+        return Symbol('ok')
+
+
+class VectorLength(Primitive, ProcedureBase):
+    keyword = 'vector-length'
+
+    parameter = Parameter(['vector'])
+
+    def call(self, vector):
+        return Number(vector.length())
+
+
+class VectorFill(Primitive, ProcedureBase):
+    keyword = 'vector-fill!'
+
+    parameter = Parameter(['vector', 'fill'])
+
+    def call(self, vector, fill):
+        vector.fill(fill)
+        return Symbol('ok')
+
+
+class VectorToList(Primitive, ProcedureBase):
+    keyword = 'vector->list'
+
+    parameter = Parameter(['vector'])
+
+    def call(self, vector):
+        return pylist_to_list(vector.elements())
+
+
+class ListToVector(Primitive, ProcedureBase):
+    keyword = 'list->vector'
+
+    parameter = Parameter(['lst'])
+
+    def call(self, lst):
+        return Vector(list_to_pylist(lst))
+
+
+class MakePersistentMap(Primitive, ProcedureBase):
+    """(pmap key value ...)"""
+    keyword = 'pmap'
+
+    parameter = Parameter(['items'])
+
+    def call(self, *items):
+        if len(items) % 2:
+            raise ValueError('pmap: keys and values should come in pairs')
+        return PersistentMap.from_items(zip(items[::2], items[1::2]))
+
+
+class PersistentMapRef(Primitive, ProcedureBase):
+    """(pmap-ref map key [default])"""
+    keyword = 'pmap-ref'
+
+    parameter = Parameter(['m', 'key', 'default'])
+
+    def call(self, m, key, default=None):
+        value = m.get(key, default)
+        if value is None:
+            raise KeyError('pmap-ref: no value for key {}'.format(key))
+        return value
+
+
+class PersistentMapSet(Primitive, ProcedureBase):
+    keyword = 'pmap-set'
+
+    parameter = Parameter(['m', 'key', 'value'])
+
+    def call(self, m, key, value):
+        return m.assoc(key, value)
+
+
+class PersistentMapDelete(Primitive, ProcedureBase):
+    keyword = 'pmap-delete'
+
+    parameter = Parameter(['m', 'key'])
+
+    def call(self, m, key):
+        return m.dissoc(key)
+
+
+class PersistentMapUpdate(Primitive, ProcedureBase):
+    """(pmap-update map key proc [default])，以 (proc 旧值) 作为新值，返回新的映射"""
+    keyword = 'pmap-update'
+
+    parameter = Parameter(['m', 'key', 'proc', 'default'])
+
+    def call(self, m, key, proc, default=None):
+        value = PersistentMapRef().call(m, key, default)
+        return m.assoc(key, apply_procedure(proc, value))
+
+
+class PersistentMapContains(Primitive, ProcedureBase):
+    keyword = 'pmap-contains?'
+
+    parameter = Parameter(['m', 'key'])
+
+    def call(self, m, key):
+        return Boolean(m.contains(key))
+
+
+class PersistentMapCount(Primitive, ProcedureBase):
+    keyword = 'pmap-count'
+
+    parameter = Parameter(['m'])
+
+    def call(self, m):
+        return Number(m.length())
+
+
+class PersistentMapFold(Primitive, ProcedureBase):
+    """(pmap-fold proc initial map)，对每个键值调用 (proc key value acc)"""
+    keyword = 'pmap-fold'
+
+    parameter = Parameter(['proc', 'initial', 'm'])
+
+    def call(self, proc, initial, m):
+        acc = initial
+        for key, value in m.items():
+            acc = apply_procedure(proc, key, value, acc)
+        return acc
+
+
+class PersistentMapKeys(Primitive, ProcedureBase):
+    keyword = 'pmap-keys'
+
+    parameter = Parameter(['m'])
+
+    def call(self, m):
+        return pylist_to_list([key for key, _ in m.items()])
+
+
+class PersistentMapToAlist(Primitive, ProcedureBase):
+    keyword = 'pmap->alist'
+
+    parameter = Parameter(['m'])
+
+    def call(self, m):
+        return pylist_to_list([Pair(key, value) for key, value in m.items()])
+
+
+class AlistToPersistentMap(Primitive, ProcedureBase):
+    """(alist->pmap alist)，同一个键出现多次时以前面的为准，和 assoc 的查找顺序一致"""
+    keyword = 'alist->pmap'
+
+    parameter = Parameter(['alist'])
+
+    def call(self, alist):
+        return PersistentMap.from_items((p.car, p.cdr) for p in reversed(list_to_pylist(alist)))
+
+
+class MakePersistentVector(Primitive, ProcedureBase):
+    keyword = 'pvector'
+
+    parameter = Parameter(['elements'])
+
+    def call(self, *elements):
+        return PersistentVector.from_items(elements)
+
+
+class PersistentVectorRef(Primitive, ProcedureBase):
+    keyword = 'pvector-ref'
+
+    parameter = Parameter(['v', 'k'])
+
+    def call(self, v, k):
+        return v.ref(k.value)
+
+
+class PersistentVectorSet(Primitive, ProcedureBase):
+    """(pvector-set v k o)，k 等于长度时在末尾追加，返回新的向量"""
+    keyword = 'pvector-set'
+
+    parameter = Parameter(['v', 'k', 'o'])
+
+    def call(self, v, k, o):
+        return v.set(k.value, o)
+
+
+class PersistentVectorPush(Primitive, ProcedureBase):
+    keyword = 'pvector-push'
+
+    parameter = Parameter(['v', 'o'])
+
+    def call(self, v, o):
+        return v.push(o)
+
+
+class PersistentVectorPop(Primitive, ProcedureBase):
+    keyword = 'pvector-pop'
+
+    parameter = Parameter(['v'])
+
+    def call(self, v):
+        return v.pop()
+
+
+class PersistentVectorLength(Primitive, ProcedureBase):
+    keyword = 'pvector-length'
+
+    parameter = Parameter(['v'])
+
+    def call(self, v):
+        return Number(v.length())
+
+
+class PersistentVectorFold(Primitive, ProcedureBase):
+    """(pvector-fold proc initial v)，从左到右调用 (proc acc element)，和 fold-left 一致"""
+    keyword = 'pvector-fold'
+
+    parameter = Parameter(['proc', 'initial', 'v'])
+
+    def call(self, proc, initial, v):
+        acc = initial
+        for element in v.elements():
+            acc = apply_procedure(proc, acc, element)
+        return acc
+
+
+class PersistentVectorToList(Primitive, ProcedureBase):
+    keyword = 'pvector->list'
+
+    parameter = Parameter(['v'])
+
+    def call(self, v):
+        return pylist_to_list(v.elements())
+
+
+class ListToPersistentVector(Primitive, ProcedureBase):
+    keyword = 'list->pvector'
+
+    parameter = Parameter(['lst'])
+
+    def call(self, lst):
+        return PersistentVector.from_items(list_to_pylist(lst))
+
+
+class StringAppend(Primitive, ProcedureBase):
+    """(string-append s ...)，结果先记下各部分，用到内容时才拼接"""
+    keyword = 'string-append'
+
+    parameter = Parameter(['strings'])
+
+    def call(self, *strings):
+        return String.concat(strings)
+
+
+class Substring(Primitive, ProcedureBase):
+    """(substring s start [end])，不复制字符"""
+    keyword = 'substring'
+
+    parameter = Parameter(['s', 'start', 'end'])
+
+    def call(self, s, start, end=None):
+        return s.substring(start.value, s.length() if end is None else end.value)
+
+
+class StringLength(Primitive, ProcedureBase):
+    keyword = 'string-length'
+
+    parameter = Parameter(['s'])
+
+    def call(self, s):
+        return Number(s.length())
+
+
+class StringRef(Primitive, ProcedureBase):
+    """(string-ref s k)，没有字符类型，返回长度为 1 的字符串，和 read-char 一致"""
+    keyword = 'string-ref'
+
+    parameter = Parameter(['s', 'k'])
+
+    def call(self, s, k):
+        return String(s.ref(k.value))
+
+
+class StringToSymbol(Primitive, ProcedureBase):
+    keyword = 'string->symbol'
+
+    parameter = Parameter(['s'])
+
+    def call(self, s):
+        return Symbol(s.value)
+
+
+class SymbolToString(Primitive, ProcedureBase):
+    keyword = 'symbol->string'
+
+    parameter = Parameter(['symbol'])
+
+    def call(self, symbol):
+        return String(symbol.value)
+
+
+class NumberToString(Primitive, ProcedureBase):
+    """(number->string n [radix])，radix 只用于整数，可以是 2、8、10、16"""
+    keyword = 'number->string'
+
+    parameter = Parameter(['n', 'radix'])
+
+    formats = {2: 'b', 8: 'o', 10: 'd', 16: 'x'}
+
+    def call(self, n, radix=None):
+        if radix is None or radix.value == 10:
+            return String(str(n.value))
+        if not isinstance(n.value, int) or radix.value not in self.formats:
+            raise ValueError('number->string: can not write {} in radix {}'.format(n, radix))
+        return String(format(n.value, self.formats[radix.value]))
+
+
+class StringSplit(Primitive, ProcedureBase):
+    """(string-split s [separator])，不给分隔符时按连续的空白切分并去掉首尾空白"""
+    keyword = 'string-split'
+
+    parameter = Parameter(['s', 'separator'])
+
+    def call(self, s, separator=None):
+        pieces = s.value.split() if separator is None else s.value.split(separator.value)
+        return pylist_to_list([String(p) for p in pieces])
+
+
+class StringJoin(Primitive, ProcedureBase):
+    """(string-join lst [separator])，分隔符默认为一个空格"""
+    keyword = 'string-join'
+
+    parameter = Parameter(['lst', 'separator'])
+
+    def call(self, lst, separator=None):
+        separator = ' ' if separator is None else separator.value
+        return String(separator.join(s.value for s in list_to_pylist(lst)))
+
+
+class MakeStringBuilder(Primitive, ProcedureBase):
+    keyword = 'make-string-builder'
+
+    parameter = Parameter([])
+
+    def call(self):
+        return StringBuilder()
+
+
+class StringBuilderAppend(Primitive, ProcedureBase):
+    """(string-builder-append! builder s ...)"""
+    keyword = 'string-builder-append!'
+
+    parameter = Parameter(['builder', 'strings'])
+
+    def call(self, builder, *strings):
+        for s in strings:
+            builder.append(s)
+        return Symbol('ok')
+
+
+class StringBuilderLength(Primitive, ProcedureBase):
+    keyword = 'string-builder-length'
+
+    parameter = Parameter(['builder'])
+
+    def call(self, builder):
+        return Number(builder.length())
+
+
+class StringBuilderToString(Primitive, ProcedureBase):
+    keyword = 'string-builder->string'
+
+    parameter = Parameter(['builder'])
+
+    def call(self, builder):
+        return builder.build()
+
+
+class MakeBytevector(Primitive, ProcedureBase):
+    keyword = 'make-bytevector'
+
+    parameter = Parameter(['k', 'fill'])
+
+    def call(self, k, fill=Number(0)):
+        return Bytevector.make(k.value, fill.value)
+
+
+class MakeBytevectorFromBytes(Primitive, ProcedureBase):
+    keyword = 'bytevector'
+
+    parameter = Parameter(['bytes'])
+
+    def call(self, *bytes_):
+        return Bytevector(bytearray(b.value for b in bytes_))
+
+
+class BytevectorLength(Primitive, ProcedureBase):
+    keyword = 'bytevector-length'
+
+    parameter = Parameter(['bv'])
+
+    def call(self, bv):
+        return Number(bv.length())
+
+
+class BytevectorU8Ref(Primitive, ProcedureBase):
+    keyword = 'bytevector-u8-ref'
+
+    parameter = Parameter(['bv', 'k'])
+
+    def call(self, bv, k):
+        return Number(bv.ref(k.value))
+
+
+class BytevectorU8Set(Primitive, ProcedureBase):
+    keyword = 'bytevector-u8-set!'
+
+    parameter = Parameter(['bv', 'k', 'byte'])
+
+    def call(self, bv, k, byte):
+        bv.set(k.value, byte.value)
+        return Symbol('ok')
+
+
+class BytevectorSlice(Primitive, ProcedureBase):
+    """(bytevector-slice bv start [end])，和原字节向量共享缓冲区，不复制"""
+    keyword = 'bytevector-slice'
+
+    parameter = Parameter(['bv', 'start', 'end'])
+
+    def call(self, bv, start, end=None):
+        return bv.slice(start.value, bv.length() if end is None else end.value)
+
+
+class BytevectorCopy(Primitive, ProcedureBase):
+    """(bytevector-copy bv [start [end]])，复制出独立的字节向量"""
+    keyword = 'bytevector-copy'
+
+    parameter = Parameter(['bv', 'start', 'end'])
+
+    def call(self, bv, start=Number(0), end=None):
+        return bv.copy(start.value, bv.length() if end is None else end.value)
+
+
+_byte_structs = {}
+
+
+def byte_struct(code: str, endianness) -> struct.Struct:
+    """多字节访问用的 struct，endianness 为 'big 或 'little，不给时为 'big"""
+    if endianness is None or endianness == Symbol('big'):
+        fmt = '>' + code
+    elif endianness == Symbol('little'):
+        fmt = '<' + code
+    else:
+        raise ValueError('unknown endianness {}'.format(endianness))
+
+    s = _byte_structs.get(fmt)
+    if s is None:
+        s = _byte_structs[fmt] = struct.Struct(fmt)
+    return s
+
+
+class BytevectorNumberRef(Primitive, ProcedureBase):
+    """(bytevector-xxx-ref bv k [endianness])，从第 k 个字节起按 struct 格式 code 读一个数"""
+
+    parameter = Parameter(['bv', 'k', 'endianness'])
+
+    code = None
+
+    def call(self, bv, k, endianness=None):
+        return Number(bv.unpack(byte_struct(self.code, endianness), k.value))
+
+
+class BytevectorNumberSet(Primitive, ProcedureBase):
+    """(bytevector-xxx-set! bv k n [endianness])"""
+
+    parameter = Parameter(['bv', 'k', 'n', 'endianness'])
+
+    code = None
+
+    def call(self, bv, k, n, endianness=None):
+        bv.pack(byte_struct(self.code, endianness), k.value, n.value)
+        return Symbol('ok')
+
+
+class BytevectorS8Ref(BytevectorNumberRef):
+    keyword = 'bytevector-s8-ref'
+    code = 'b'
+
+
+class BytevectorS8Set(BytevectorNumberSet):
+    keyword = 'bytevector-s8-set!'
+    code = 'b'
+
+
+class BytevectorU16Ref(BytevectorNumberRef):
+    keyword = 'bytevector-u16-ref'
+    code = 'H'
+
+
+class BytevectorU16Set(BytevectorNumberSet):
+    keyword = 'bytevector-u16-set!'
+    code = 'H'
+
+
+class BytevectorS16Ref(BytevectorNumberRef):
+    keyword = 'bytevector-s16-ref'
+    code = 'h'
+
+
+class BytevectorS16Set(BytevectorNumberSet):
+    keyword = 'bytevector-s16-set!'
+    code = 'h'
+
+
+class BytevectorU32Ref(BytevectorNumberRef):
+    keyword = 'bytevector-u32-ref'
+    code = 'I'
+
+
+class BytevectorU32Set(BytevectorNumberSet):
+    keyword = 'bytevector-u32-set!'
+    code = 'I'
+
+
+class BytevectorS32Ref(BytevectorNumberRef):
+    keyword = 'bytevector-s32-ref'
+    code = 'i'
+
+
+class BytevectorS32Set(BytevectorNumberSet):
+    keyword = 'bytevector-s32-set!'
+    code = 'i'
+
+
+class BytevectorU64Ref(BytevectorNumberRef):
+    keyword = 'bytevector-u64-ref'
+    code = 'Q'
+
+
+class BytevectorU64Set(BytevectorNumberSet):
+    keyword = 'bytevector-u64-set!'
+    code = 'Q'
+
+
+class BytevectorS64Ref(BytevectorNumberRef):
+    keyword = 'bytevector-s64-ref'
+    code = 'q'
+
+
+class BytevectorS64Set(BytevectorNumberSet):
+    keyword = 'bytevector-s64-set!'
+    code = 'q'
+
+
+class BytevectorSingleRef(BytevectorNumberRef):
+    keyword = 'bytevector-ieee-single-ref'
+    code = 'f'
+
+
+class BytevectorSingleSet(BytevectorNumberSet):
+    keyword = 'bytevector-ieee-single-set!'
+    code = 'f'
+
+
+class BytevectorDoubleRef(BytevectorNumberRef):
+    keyword = 'bytevector-ieee-double-ref'
+    code = 'd'
+
+
+class BytevectorDoubleSet(BytevectorNumberSet):
+    keyword = 'bytevector-ieee-double-set!'
+    code = 'd'
+
+
+class BytevectorToList(Primitive, ProcedureBase):
+    keyword = 'bytevector->u8-list'
+
+    parameter = Parameter(['bv'])
+
+    def call(self, bv):
+        return pylist_to_list([Number(b) for b in bv.view])
+
+
+class ListToBytevector(Primitive, ProcedureBase):
+    keyword = 'u8-list->bytevector'
+
+    parameter = Parameter(['lst'])
+
+    def call(self, lst):
+        return Bytevector(bytearray(b.value for b in list_to_pylist(lst)))
+
+
+class Utf8ToString(Primitive, ProcedureBase):
+    keyword = 'utf8->string'
+
+    parameter = Parameter(['bv'])
+
+    def call(self, bv):
+        return String(str(bv.view, 'utf-8'))
+
+
+class StringToUtf8(Primitive, ProcedureBase):
+    keyword = 'string->utf8'
+
+    parameter = Parameter(['s'])
+
+    def call(self, s):
+        return Bytevector(bytearray(s.value.encode('utf-8')))
+
+
+class FileToBytevector(Primitive, ProcedureBase):
+    """(file->bytevector path [mode])，mode 为 'mmap 时只读地映射文件，配合 bytevector-slice 取其中一段"""
+    keyword = 'file->bytevector'
+
+    parameter = Parameter(['path', 'mode'])
+
+    def call(self, path, mode=None):
+        return ports.read_bytevector(path.value, use_mmap=mode == Symbol('mmap'))
+
+
+class BytevectorToFile(Primitive, ProcedureBase):
+    keyword = 'bytevector->file'
+
+    parameter = Parameter(['bv', 'path'])
+
+    def call(self, bv, path):
+        ports.write_bytevector(bv, path.value)
+        return Symbol('ok')
+
+
+class OpenInputFile(Primitive, ProcedureBase):
+    """(open-input-file path [mode])，mode 为 'mmap 时把文件映射到内存读取"""
+    keyword = 'open-input-file'
+
+    parameter = Parameter(['path', 'mode'])
+
+    def call(self, path, mode=None):
+        return ports.open_input_file(path.value, use_mmap=mode == Symbol('mmap'))
+
+
+class OpenOutputFile(Primitive, ProcedureBase):
+    keyword = 'open-output-file'
+
+    parameter = Parameter(['path'])
+
+    def call(self, path):
+        return ports.open_output_file(path.value)
+
+
+class OpenInputString(Primitive, ProcedureBase):
+    keyword = 'open-input-string'
+
+    parameter = Parameter(['string'])
+
+    def call(self, string):
+        return ports.InputPort(io.StringIO(string.value))
+
+
+class OpenOutputString(Primitive, ProcedureBase):
+    keyword = 'open-output-string'
+
+    parameter = Parameter([])
+
+    def call(self):
+        return ports.StringOutputPort()
+
+
+class GetOutputString(Primitive, ProcedureBase):
+    keyword = 'get-output-string'
+
+    parameter = Parameter(['port'])
+
+    def call(self, port):
+        return String(port.getvalue())
+
+
+class ReadLine(Primitive, ProcedureBase):
+    keyword = 'read-line'
+
+    parameter = Parameter(['port'])
+
+    def call(self, port=ports.console_input_port):
+        line = port.read_line()
+        if line is None:
+            return ports.EOF_OBJECT
+        return String(line)
+
+
+class ReadChar(Primitive, ProcedureBase):
+    """没有字符类型，读到的字符用长度为 1 的字符串表示"""
+    keyword = 'read-char'
+
+    parameter = Parameter(['port'])
+
+    def call(self, port=ports.console_input_port):
+        c = port.read_char()
+        if c is None:
+            return ports.EOF_OBJECT
+        return String(c)
+
+
+class Read(Primitive, ProcedureBase):
+    """从端口读一个表达式，不求值"""
+    keyword = 'read'
+
+    parameter = Parameter(['port'])
+
+    def call(self, port=ports.console_input_port):
+        text = ''
+        while True:
+            chunk = port.read_text()
+            text += chunk
+
+            datum = read_datum(text, eof=not chunk)
+            if datum is not None:
+                expression, end = datum
+                port.unread(text[end:])
+                return expression
+
+            if not chunk:
+                if next(scan(text), None) is not None:
+                    raise ParseError('incomplete expression at the end of input')
+                return ports.EOF_OBJECT
+
+
+class WriteString(Primitive, ProcedureBase):
+    keyword = 'write-string'
+
+    parameter = Parameter(['string', 'port'])
+
+    def call(self, string, port=None):
+        (port or ports.current_output_port()).write(string.value)
+        return Symbol('ok')
+
+
+class FlushOutput(Primitive, ProcedureBase):
+    keyword = 'flush-output'
+
+    parameter = Parameter(['port'])
+
+    def call(self, port=None):
+        (port or ports.current_output_port()).flush()
+        return Symbol('ok')
+
+
+class ClosePort(Primitive, ProcedureBase):
+    keyword = 'close-port'
+
+    parameter = Parameter(['port'])
+
+    def call(self, port):
+        port.close()
+        return Symbol('ok')
+
+
+class IsEofObject(Primitive, ProcedureBase):
+    keyword = 'eof-object?'
+
+    parameter = Parameter(['o'])
+
+    def call(self, o):
+        return Boolean(o is ports.EOF_OBJECT)
+
+
+class WithOutputToFile(Primitive, ProcedureBase):
+    """(with-output-to-file path thunk)，调用 thunk 期间 display 等输出写到文件里，结束时写出并关闭文件"""
+    keyword = 'with-output-to-file'
+
+    parameter = Parameter(['path', 'thunk'])
+
+    def call(self, path, thunk):
+        port = ports.open_output_file(path.value)
+        ports.push_output_port(port)
+        try:
+            return apply_procedure(thunk)
+        finally:
+            ports.pop_output_port()
+            port.close()
+
+
+class Escape(Exception):
+    """调用逃逸续延时抛出的轻量异常，只带着目标续延和返回值，沿途的 python 栈帧由解释器直接弹掉"""
+
+    def __init__(self, continuation, value):
+        super(Escape, self).__init__()
+        self.continuation = continuation
+        self.value = value
+
+
+class EscapeContinuation(Primitive, ProcedureBase):
+    """call/ec、let/ec 捕获的逃逸续延，只能在建立它的那次调用返回之前使用"""
+    keyword = 'escape-continuation'
+
+    parameter = Parameter(['value'])
+
+    def __init__(self):
+        self.active = True
+
+    def call(self, value):
+        if not self.active:
+            raise RuntimeError('escape continuation called after its extent has ended')
+        raise Escape(self, value)
+
+    def __str__(self):
+        return '#<escape-continuation>'
+
+
+def call_with_escape(function) -> ComputationalObject:
+    """新建逃逸续延 k 调用 function(k)，k 被调用时立即以它的参数作为返回值
+
+    结果要在 try 里求值到底，惰性的尾调用也在续延的有效范围之内；
+    跳出时途中没求完的 thunk 保持未求值，环境不做任何改动，之后再次求值结果不变
+    """
+    k = EscapeContinuation()
+    try:
+        return Thunk.force(function(k))
+    except Escape as e:
+        if e.continuation is not k:
+            raise
+        return e.value
+    finally:
+        k.active = False
+
+
+class CallWithEscapeContinuation(Primitive, ProcedureBase):
+    """(call-with-escape-continuation proc)，以逃逸续延为参数调用 proc"""
+    keyword = 'call-with-escape-continuation'
+
+    parameter = Parameter(['proc'])
+
+    def call(self, proc):
+        return call_with_escape(proc.call)
+
+
+class CallEc(CallWithEscapeContinuation):
+    keyword = 'call/ec'
+
+
+class Serialize(Primitive, ProcedureBase):
+    """(serialize o path)，把 o 编码成二进制写到文件里，覆盖原有内容"""
+    keyword = 'serialize'
+
+    parameter = Parameter(['o', 'path'])
+
+    def call(self, o, path):
+        with open(path.value, 'wb') as fp:
+            dump(o, fp)
+        return Symbol('ok')
+
+
+class Deserialize(Primitive, ProcedureBase):
+    keyword = 'deserialize'
+
+    parameter = Parameter(['path'])
+
+    def call(self, path):
+        with open(path.value, 'rb') as fp:
+            return load(fp)
+
+
 primitives = [
     Plus(),
     Minus(),
@@ -124,7 +1494,131 @@ primitives = [
     Equal(),
     GreaterThan(),
     LessThan(),
+    IsEq(),
+    IsEqv(),
+    IsEqual(),
     Car(),
     Cdr(),
+    SetCar(),
+    SetCdr(),
     Display(),
+    Write(),
+    Cons(),
+    MakeList(),
+    Length(),
+    Append(),
+    Reverse(),
+    ListRef(),
+    Map(),
+    Filter(),
+    FoldLeft(),
+    FoldRight(),
+    Assoc(),
+    Member(),
+    Sort(),
+    Force(),
+    MakePromise(),
+    StreamCar(),
+    StreamCdr(),
+    IsStreamNull(),
+    StreamMap(),
+    StreamFilter(),
+    StreamTake(),
+    StreamForEach(),
+    MakeHashTable(),
+    HashTableRef(),
+    HashTableSet(),
+    HashTableDelete(),
+    HashTableCount(),
+    HashTableKeys(),
+    HashTableUpdate(),
+    MakeVector(),
+    MakeVectorFromElements(),
+    VectorRef(),
+    VectorSet(),
+    VectorLength(),
+    VectorFill(),
+    VectorToList(),
+    ListToVector(),
+    MakePersistentMap(),
+    PersistentMapRef(),
+    PersistentMapSet(),
+    PersistentMapDelete(),
+    PersistentMapUpdate(),
+    PersistentMapContains(),
+    PersistentMapCount(),
+    PersistentMapFold(),
+    PersistentMapKeys(),
+    PersistentMapToAlist(),
+    AlistToPersistentMap(),
+    MakePersistentVector(),
+    PersistentVectorRef(),
+    PersistentVectorSet(),
+    PersistentVectorPush(),
+    PersistentVectorPop(),
+    PersistentVectorLength(),
+    PersistentVectorFold(),
+    PersistentVectorToList(),
+    ListToPersistentVector(),
+    StringAppend(),
+    Substring(),
+    StringLength(),
+    StringRef(),
+    StringToSymbol(),
+    SymbolToString(),
+    NumberToString(),
+    StringSplit(),
+    StringJoin(),
+    MakeStringBuilder(),
+    StringBuilderAppend(),
+    StringBuilderLength(),
+    StringBuilderToString(),
+    MakeBytevector(),
+    MakeBytevectorFromBytes(),
+    BytevectorLength(),
+    BytevectorU8Ref(),
+    BytevectorU8Set(),
+    BytevectorSlice(),
+    BytevectorCopy(),
+    BytevectorS8Ref(),
+    BytevectorS8Set(),
+    BytevectorU16Ref(),
+    BytevectorU16Set(),
+    BytevectorS16Ref(),
+    BytevectorS16Set(),
+    BytevectorU32Ref(),
+    BytevectorU32Set(),
+    BytevectorS32Ref(),
+    BytevectorS32Set(),
+    BytevectorU64Ref(),
+    BytevectorU64Set(),
+    BytevectorS64Ref(),
+    BytevectorS64Set(),
+    BytevectorSingleRef(),
+    BytevectorSingleSet(),
+    BytevectorDoubleRef(),
+    BytevectorDoubleSet(),
+    BytevectorToList(),
+    ListToBytevector(),
+    Utf8ToString(),
+    StringToUtf8(),
+    FileToBytevector(),
+    BytevectorToFile(),
+    OpenInputFile(),
+    OpenOutputFile(),
+    OpenInputString(),
+    OpenOutputString(),
+    GetOutputString(),
+    ReadLine(),
+    ReadChar(),
+    Read(),
+    WriteString(),
+    FlushOutput(),
+    ClosePort(),
+    IsEofObject(),
+    WithOutputToFile(),
+    CallWithEscapeContinuation(),
+    CallEc(),
+    Serialize(),
+    Deserialize(),
 ]
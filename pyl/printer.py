@@ -0,0 +1,84 @@
+# -*- coding:utf8 -*-
+
+"""Printer -- 把计算对象写成文本
+
+用显式的栈代替递归，很长、很深的表和向量都不会爆栈；
+片段先攒在列表里，攒够一批再整块写到输出，总耗时与输出长度成线性关系
+
+write 输出可以被 read 读回的形式，字符串带引号和转义；display 输出给人看的形式，字符串原样输出
+"""
+
+import io
+from typing import TextIO
+
+from .datatype import ComputationalObject, Pair, NIL, String, Vector
+from .helpers import unpack_list
+
+# 攒够这么多片段写出一次
+CHUNK_SIZE = 4096
+
+
+def write_to(o: ComputationalObject, sink: TextIO, readable: bool = True):
+    """把 o 的打印形式写到 sink（有 write 方法的对象），readable 为假时按 display 的形式"""
+    pieces = []
+    stack = [o]
+
+    while stack:
+        o = stack.pop()
+
+        if type(o) is str:
+            pieces.append(o)
+
+        elif isinstance(o, Pair):
+            items, o = unpack_list(o)
+
+            # 倒着压栈，弹出时就是从左到右的顺序
+            stack.append(')')
+            if o is not NIL:
+                stack.append(o)
+                stack.append(' . ')
+            _push_items(stack, items)
+            pieces.append('(')
+
+        elif isinstance(o, Vector):
+            stack.append(')')
+            _push_items(stack, list(o.elements()))
+            pieces.append('#(')
+
+        elif isinstance(o, String):
+            pieces.append(_quote(o.value) if readable else o.value)
+
+        else:
+            pieces.append(str(o))
+
+        if len(pieces) >= CHUNK_SIZE:
+            sink.write(''.join(pieces))
+            pieces.clear()
+
+    sink.write(''.join(pieces))
+
+
+def _push_items(stack, items):
+    for i in range(len(items) - 1, 0, -1):
+        stack.append(items[i])
+        stack.append(' ')
+    if items:
+        stack.append(items[0])
+
+
+def _quote(s: str) -> str:
+    return '"{}"'.format(s.replace('\\', '\\\\').replace('"', '\\"'))
+
+
+def write(o: ComputationalObject, sink: TextIO):
+    write_to(o, sink, readable=True)
+
+
+def display(o: ComputationalObject, sink: TextIO):
+    write_to(o, sink, readable=False)
+
+
+def to_string(o: ComputationalObject, readable: bool = True) -> str:
+    buf = io.StringIO()
+    write_to(o, buf, readable)
+    return buf.getvalue()
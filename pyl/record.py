@@ -0,0 +1,138 @@
+# -*- coding:utf8 -*-
+
+"""Records -- define-record-type 定义的记录类型
+
+每个记录类型生成一个 python 类，字段按声明顺序放在 __slots__ 的槽位 f0、f1 ... 里，实例不带 __dict__
+构造、判断、访问、修改过程在定义记录类型时就取好各字段槽位的描述符，调用时直接读写槽位，不按名字查找
+"""
+
+from typing import List, Tuple
+
+from .datatype import ComputationalObject, Boolean, Symbol, Parameter, ProcedureBase
+from .primitive import Primitive
+from .structure import SRecordTypeDefinition
+
+
+class Record(ComputationalObject):
+    """记录实例的基类，record_type 由各记录类型的子类设置"""
+    __slots__ = ()
+
+    record_type: 'RecordType' = None
+
+    def __eq__(self, other):
+        return self is other
+
+    def __hash__(self):
+        return id(self)
+
+    def __str__(self):
+        record_type = self.record_type
+        return '#<{} {}>'.format(record_type.name, ' '.join(
+            str(get(self)) for get in record_type.getters))
+
+
+class RecordType(ComputationalObject):
+    def __init__(self, name: str, field_names: List[str]):
+        self.name: str = name
+        self.field_names: List[str] = field_names
+        # 字段名在 scheme 里可以是任意符号，槽位按下标命名
+        self.cls = type(name, (Record,), {
+            '__slots__': tuple('f{}'.format(i) for i in range(len(field_names))),
+            'record_type': self,
+        })
+        descriptors = [getattr(self.cls, 'f{}'.format(i)) for i in range(len(field_names))]
+        self.getters = [d.__get__ for d in descriptors]
+        self.setters = [d.__set__ for d in descriptors]
+
+    def offset(self, field: str) -> int:
+        try:
+            return self.field_names.index(field)
+        except ValueError:
+            raise SyntaxError('record type {} has no field {}'.format(self.name, field))
+
+    def __str__(self):
+        return '#<record-type {}>'.format(self.name)
+
+
+class RecordProcedure(Primitive, ProcedureBase):
+    """记录类型生成的过程，和原始过程一样按已经求值的参数调用"""
+    keyword = None
+    parameter = None
+
+    def __init__(self, keyword: str, record_type: RecordType, field_names: List[str]):
+        self.keyword: str = keyword
+        self.parameter: Parameter = Parameter(field_names)
+        self.record_type: RecordType = record_type
+        self.cls = record_type.cls
+
+    def check(self, record):
+        if type(record) is not self.cls:
+            raise TypeError('{}: {} is not a {}'.format(self.keyword, record, self.record_type.name))
+
+    def __str__(self):
+        return '#<procedure {}>'.format(self.keyword)
+
+
+class RecordConstructor(RecordProcedure):
+    def __init__(self, keyword: str, record_type: RecordType, field_names: List[str]):
+        super(RecordConstructor, self).__init__(keyword, record_type, field_names)
+        self.setters = [record_type.setters[record_type.offset(f)] for f in field_names]
+        # 构造过程没有给出的字段初始化为 #f
+        given = set(field_names)
+        self.defaults = [record_type.setters[i] for i, f in enumerate(record_type.field_names) if f not in given]
+
+    def call(self, *values):
+        if len(values) != len(self.setters):
+            raise TypeError('{}: expects {} arguments, got {}'.format(self.keyword, len(self.setters), len(values)))
+
+        record = self.cls()
+        for set_field, value in zip(self.setters, values):
+            set_field(record, value)
+        for set_field in self.defaults:
+            set_field(record, Boolean(False))
+        return record
+
+
+class RecordPredicate(RecordProcedure):
+    def call(self, o):
+        return Boolean(type(o) is self.cls)
+
+
+class RecordAccessor(RecordProcedure):
+    def __init__(self, keyword: str, record_type: RecordType, field: str):
+        super(RecordAccessor, self).__init__(keyword, record_type, ['record'])
+        self.get = record_type.getters[record_type.offset(field)]
+
+    def call(self, record):
+        if type(record) is not self.cls:
+            self.check(record)
+        return self.get(record)
+
+
+class RecordModifier(RecordProcedure):
+    def __init__(self, keyword: str, record_type: RecordType, field: str):
+        super(RecordModifier, self).__init__(keyword, record_type, ['record', 'value'])
+        self.set = record_type.setters[record_type.offset(field)]
+
+    def call(self, record, value):
+        if type(record) is not self.cls:
+            self.check(record)
+        self.set(record, value)
+        return Symbol('ok')
+
+
+def record_bindings(definition: SRecordTypeDefinition) -> List[Tuple[str, ComputationalObject]]:
+    """新建记录类型，返回要绑定的 (名字, 值)：类型本身、构造、判断、各字段的访问和修改过程"""
+    record_type = RecordType(definition.type_name.value, [f.value for f, _, _ in definition.field_specs])
+
+    bindings = [
+        (definition.type_name.value, record_type),
+        (definition.constructor.value, RecordConstructor(
+            definition.constructor.value, record_type, [f.value for f in definition.constructor_fields])),
+        (definition.predicate.value, RecordPredicate(definition.predicate.value, record_type, ['o'])),
+    ]
+    for field, accessor, modifier in definition.field_specs:
+        bindings.append((accessor.value, RecordAccessor(accessor.value, record_type, field.value)))
+        if modifier is not None:
+            bindings.append((modifier.value, RecordModifier(modifier.value, record_type, field.value)))
+    return bindings
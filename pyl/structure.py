@@ -1,4 +1,4 @@
-from typing import List, Tuple
+from typing import List, Tuple, Optional
 
 from pyl.datatype import Expression, Symbol, Pair, NIL, Parameter
 from pyl.helpers import list_to_pylist, pylist_to_list, cons_list, first_symbol, by_index
@@ -66,6 +66,40 @@ class SQuoted(Structure):
         return Pair(Symbol(self.keyword), Pair(self.quoted, NIL))
 
 
+class SDelay(Structure):
+    """(delay expression)"""
+    keyword = 'delay'
+
+    def __init__(self, expression=None, delayed=None):
+        self.expression: Expression = expression
+        self.delayed: Expression = delayed
+        super(self.__class__, self).__init__()
+
+    def dismantle(self):
+        self.delayed = self.expression.cdr.car
+
+    def construct(self) -> Expression:
+        return cons_list(Symbol(self.keyword), self.delayed)
+
+
+class SConsStream(Structure):
+    """(cons-stream a b)，等价于 (cons a (delay b))"""
+    keyword = 'cons-stream'
+
+    def __init__(self, expression=None, head=None, tail=None):
+        self.expression: Expression = expression
+        self.head: Expression = head
+        self.tail: Expression = tail
+        super(self.__class__, self).__init__()
+
+    def dismantle(self):
+        self.head = self.expression.cdr.car
+        self.tail = self.expression.cdr.cdr.car
+
+    def construct(self) -> Expression:
+        return cons_list(Symbol(self.keyword), self.head, self.tail)
+
+
 class SAssignment(Structure):
     """针对 赋值 的解释"""
     keyword = 'set!'
@@ -84,9 +118,9 @@ class SAssignment(Structure):
         self.variable_name = self._variable_name()
         self.assignment_body = self._assignment_body()
 
-    def _variable_name(self) -> str:
+    def _variable_name(self) -> Symbol:
         symbol_as_var_name = by_index(self.expression, 1)
-        return symbol_as_var_name.value
+        return symbol_as_var_name
 
     def _assignment_body(self) -> Expression:
         body_expr = by_index(self.expression, 2)
@@ -127,6 +161,29 @@ class SDefinition(Structure):
                          self.body)
 
 
+class SVariableDefinition(Structure):
+    """针对 (define name value) 的解释"""
+    keyword = 'define'
+
+    @classmethod
+    def adapt(cls, expression: Expression) -> bool:
+        return first_symbol(expression) == Symbol(cls.keyword) \
+               and isinstance(by_index(expression, 1), Symbol)
+
+    def __init__(self, expression=None, name=None, value=None):
+        self.expression: Expression = expression
+        self.name: Symbol = name
+        self.value: Expression = value
+        super(self.__class__, self).__init__()
+
+    def dismantle(self):
+        self.name = self.expression.cdr.car
+        self.value = by_index(self.expression, 2)
+
+    def construct(self) -> Expression:
+        return cons_list(Symbol(self.keyword), self.name, self.value)
+
+
 class SParameter(Structure):
     def __init__(self, expression=None, parameter=None):
         self.expression: Expression = expression
@@ -259,9 +316,23 @@ class SApplication(Structure):
         return isinstance(expression, Pair)
 
 
+def _name_value_pairs(nv_lst: Expression) -> List[Tuple[Symbol, Expression]]:
+    """((name value) ...) 分解成 (name, value) 的列表"""
+    return [(nv.car, nv.cdr.car) for nv in list_to_pylist(nv_lst)]
+
+
+def _name_value_list(name_value_pair_lst: List[Tuple[Symbol, Expression]]) -> Expression:
+    return pylist_to_list([cons_list(name, val) for name, val in name_value_pair_lst])
+
+
 class SLet(Structure):
     keyword = 'let'
 
+    @classmethod
+    def adapt(cls, expression: Expression) -> bool:
+        return first_symbol(expression) == Symbol(cls.keyword) \
+               and not isinstance(by_index(expression, 1), Symbol)
+
     def __init__(self, expression=None, name_value_pair_lst=None, body=None):
         self.expression: Expression = expression
         self.name_value_pair_lst: List[Tuple[Symbol, Expression]] = name_value_pair_lst
@@ -269,25 +340,147 @@ class SLet(Structure):
         super(self.__class__, self).__init__()
 
     def construct(self) -> Expression:
-        return cons_list(
-            Symbol(self.keyword),
-            pylist_to_list(
-                [cons_list(name, val) for name, val in self.name_value_pair_lst]
-            ),
-            self.body
-        )
+        return Pair(Symbol(self.keyword), Pair(_name_value_list(self.name_value_pair_lst), self.body))
 
     def dismantle(self):
-        nv_lst = self.expression.cdr.car
+        self.name_value_pair_lst = _name_value_pairs(self.expression.cdr.car)
+        self.body = self.expression.cdr.cdr
 
-        nv_pair_lst = []
-        nv_lst = list_to_pylist(nv_lst)
-        for nv in nv_lst:
-            nv_pair_lst.append(
-                (nv.car, nv.cdr.car)
-            )
 
-        body = self.expression.cdr.cdr.car
+class SNamedLet(Structure):
+    """(let name ((var init) ...) body ...)"""
+    keyword = 'let'
+
+    @classmethod
+    def adapt(cls, expression: Expression) -> bool:
+        return first_symbol(expression) == Symbol(cls.keyword) \
+               and isinstance(by_index(expression, 1), Symbol)
+
+    def __init__(self, expression=None, name=None, name_value_pair_lst=None, body=None):
+        self.expression: Expression = expression
+        self.name: Symbol = name
+        self.name_value_pair_lst: List[Tuple[Symbol, Expression]] = name_value_pair_lst
+        self.body: Expression = body
+        super(self.__class__, self).__init__()
 
-        self.name_value_pair_lst = nv_pair_lst
-        self.body = body
+    def construct(self) -> Expression:
+        return Pair(Symbol(self.keyword),
+                    Pair(self.name, Pair(_name_value_list(self.name_value_pair_lst), self.body)))
+
+    def dismantle(self):
+        self.name = self.expression.cdr.car
+        self.name_value_pair_lst = _name_value_pairs(self.expression.cdr.cdr.car)
+        self.body = self.expression.cdr.cdr.cdr
+
+
+class SLetrec(Structure):
+    keyword = 'letrec'
+
+    def __init__(self, expression=None, name_value_pair_lst=None, body=None):
+        self.expression: Expression = expression
+        self.name_value_pair_lst: List[Tuple[Symbol, Expression]] = name_value_pair_lst
+        self.body: Expression = body
+        super(self.__class__, self).__init__()
+
+    def construct(self) -> Expression:
+        return Pair(Symbol(self.keyword), Pair(_name_value_list(self.name_value_pair_lst), self.body))
+
+    def dismantle(self):
+        self.name_value_pair_lst = _name_value_pairs(self.expression.cdr.car)
+        self.body = self.expression.cdr.cdr
+
+
+class SDo(Structure):
+    """(do ((var init step) ...) (test result ...) command ...)，step 可以省略"""
+    keyword = 'do'
+
+    def __init__(self, expression=None, variable_lst=None, test=None, result=None, body=None):
+        self.expression: Expression = expression
+        self.variable_lst: List[Tuple[Symbol, Expression, Optional[Expression]]] = variable_lst
+        self.test: Expression = test
+        self.result: Expression = result
+        self.body: Expression = body
+        super(self.__class__, self).__init__()
+
+    def construct(self) -> Expression:
+        spec_lst = [cons_list(name, init) if step is None else cons_list(name, init, step)
+                    for name, init, step in self.variable_lst]
+        return Pair(Symbol(self.keyword),
+                    Pair(pylist_to_list(spec_lst),
+                         Pair(Pair(self.test, self.result), self.body)))
+
+    def dismantle(self):
+        self.variable_lst = [(spec.car, spec.cdr.car, by_index(spec, 2))
+                             for spec in list_to_pylist(self.expression.cdr.car)]
+
+        clause = self.expression.cdr.cdr.car
+        self.test = clause.car
+        self.result = clause.cdr
+        self.body = self.expression.cdr.cdr.cdr
+
+
+class SLetEc(Structure):
+    """(let/ec name body ...)，相当于 (call/ec (lambda (name) body ...))"""
+    keyword = 'let/ec'
+
+    def __init__(self, expression=None, name=None, body=None):
+        self.expression: Expression = expression
+        self.name: Symbol = name
+        self.body: Expression = body
+        super(self.__class__, self).__init__()
+
+    def construct(self) -> Expression:
+        return Pair(Symbol(self.keyword), Pair(self.name, self.body))
+
+    def dismantle(self):
+        self.name = self.expression.cdr.car
+        self.body = self.expression.cdr.cdr
+
+
+class SRecordTypeDefinition(Structure):
+    """(define-record-type name (constructor field ...) predicate (field accessor [modifier]) ...)
+
+    constructor 只写名字时，构造过程按字段声明的顺序接收全部字段
+    """
+    keyword = 'define-record-type'
+
+    def __init__(self, expression=None, type_name=None, constructor=None, constructor_fields=None, predicate=None,
+                 field_specs=None):
+        self.expression: Expression = expression
+        self.type_name: Symbol = type_name
+        self.constructor: Symbol = constructor
+        self.constructor_fields: List[Symbol] = constructor_fields
+        self.predicate: Symbol = predicate
+        self.field_specs: List[Tuple[Symbol, Symbol, Optional[Symbol]]] = field_specs
+        super(self.__class__, self).__init__()
+
+    def construct(self) -> Expression:
+        spec_lst = [cons_list(field, accessor) if modifier is None else cons_list(field, accessor, modifier)
+                    for field, accessor, modifier in self.field_specs]
+        return Pair(Symbol(self.keyword),
+                    Pair(self.type_name,
+                         Pair(Pair(self.constructor, pylist_to_list(self.constructor_fields)),
+                              Pair(self.predicate, pylist_to_list(spec_lst)))))
+
+    def dismantle(self):
+        self.type_name = self.expression.cdr.car
+        self.predicate = by_index(self.expression, 3)
+        self.field_specs = [(spec.car, spec.cdr.car, by_index(spec, 2))
+                            for spec in list_to_pylist(self.expression.cdr.cdr.cdr.cdr)]
+
+        constructor = by_index(self.expression, 2)
+        if isinstance(constructor, Symbol):
+            self.constructor = constructor
+            self.constructor_fields = [field for field, _, _ in self.field_specs]
+        else:
+            self.constructor = constructor.car
+            self.constructor_fields = list_to_pylist(constructor.cdr)
+
+    def names(self) -> List[str]:
+        """这个定义绑定的全部名字"""
+        names = [self.type_name.value, self.constructor.value, self.predicate.value]
+        for _, accessor, modifier in self.field_specs:
+            names.append(accessor.value)
+            if modifier is not None:
+                names.append(modifier.value)
+        return names
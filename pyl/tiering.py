@@ -0,0 +1,31 @@
+# -*- coding:utf8 -*-
+
+"""分层执行的配置与观测
+
+过程先按分析树解释执行（冷代码只付出分析的代价），
+被调用次数达到阈值后编译成 python 闭包，之后的调用都走编译后的形式
+"""
+
+from typing import Callable, List
+
+
+class TieringConfig(object):
+    def __init__(self, threshold: int = 200, enabled: bool = True):
+        self.threshold: int = threshold
+        self.enabled: bool = enabled
+
+
+config = TieringConfig()
+
+# 过程升级时依次回调，参数为升级的过程
+listeners: List[Callable] = []
+
+stats = {
+    'tier_up': 0,
+}
+
+
+def report_tier_up(procedure):
+    stats['tier_up'] += 1
+    for listener in listeners:
+        listener(procedure)
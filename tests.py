@@ -1,9 +1,24 @@
 # -*- coding:utf8 -*-
+import io
+import math
+import os
+import tempfile
 import unittest
 
-from abbr import list_in_python as l
-from pyl.datatype import Number, String, Boolean
-from pyl.main import evaluate
+from abbr import list_in_python as l, Str
+from pyl.datatype import Number, String, Boolean, Vector, Pair, NIL, CompactList, compact_list, is_equal, \
+    PersistentMap, PersistentVector
+from pyl.environment import init_environment
+from pyl.helpers import list_to_pylist, list_length, list_tail
+from pyl.lazy import Thunk
+from pyl.analyze import analyze, ASelfEvaluating, AGuarded
+from pyl.main import evaluate, Evaluator
+from pyl.optimize import Optimizer, size
+from pyl.numeric import numpy
+from pyl import tiering, hashcons
+from pyl.parse import parse
+from pyl.printer import to_string
+from pyl.serialize import dumps, loads
 
 
 class TestSelfEvaluating(unittest.TestCase):
@@ -49,3 +64,621 @@ class TestBoolean(unittest.TestCase):
             ),
             Boolean(False)
         )
+
+
+class TestArithmetic(unittest.TestCase):
+    def test_variadic(self):
+        self.assertEqual(evaluate(l(['+', 1, 2, 3])), Number(6))
+        self.assertEqual(evaluate(l(['-', 10, 1, 2])), Number(7))
+        self.assertEqual(evaluate(l(['-', 5])), Number(-5))
+
+    def test_chained_comparison(self):
+        self.assertEqual(evaluate(l(['<', 1, 2, 3])), Boolean(True))
+        self.assertEqual(evaluate(l(['<', 1, 3, 2])), Boolean(False))
+
+    def test_rebound_operator(self):
+        self.assertEqual(evaluate(l(['let', [['+', '-']], ['+', 5, 1]])), Number(4))
+
+
+class TestTiering(unittest.TestCase):
+    def setUp(self):
+        self.threshold = tiering.config.threshold
+        tiering.config.threshold = 3
+
+    def tearDown(self):
+        tiering.config.threshold = self.threshold
+
+    def test_hot_procedure_compiled(self):
+        compiled = []
+        tiering.listeners.append(compiled.append)
+        try:
+            result = evaluate(parse('(begin (define (sum n) (if (< n 1) 0 (+ n (sum (- n 1))))) (sum 10))'))
+        finally:
+            tiering.listeners.remove(compiled.append)
+
+        self.assertEqual(result, Number(55))
+        self.assertEqual([p.name for p in compiled], ['sum'])
+
+
+class TestOptimizer(unittest.TestCase):
+    def test_fold_dead_branch(self):
+        expression = parse('(if (< 1 2) (* 2 3) (display "dead"))')
+        optimizer = Optimizer([expression])
+        code = optimizer.run(analyze(expression))
+
+        # 折叠假定 < 和 * 仍是内建的原始过程，结果带着守卫
+        self.assertIsInstance(code, AGuarded)
+        self.assertEqual({a.name for a in code.assumptions}, {'<', '*'})
+        self.assertIsInstance(code.fast, ASelfEvaluating)
+        self.assertEqual(code.fast.value, Number(6))
+
+        # 不钉死节点数：至少删掉了整个死分支，且优化前后求值结果相同
+        self.assertGreaterEqual(optimizer.removed, size(analyze(parse('(display "dead")'))))
+        self.assertEqual(Evaluator(True, True).eval(expression), evaluate(expression))
+
+    def test_inline(self):
+        expression = parse('(begin (define (sq x) (* x x)) (define (f n) (sq (+ n 1))) (f 2))')
+        optimizer = Optimizer(list_to_pylist(expression.cdr))
+        code = optimizer.run(analyze(expression))
+
+        self.assertEqual(optimizer.inlined, 3)
+        self.assertEqual(Thunk.force(code.eval(init_environment())), Number(9))
+
+    def test_rebound_primitive(self):
+        self.assertEqual(
+            Evaluator(bool_analyze=True, bool_optimize=True).eval(parse('(let ((+ -)) (+ 5 1))')),
+            Number(4)
+        )
+
+    def test_rebound_in_later_evaluation(self):
+        # 像 REPL 一样逐条求值，先前和之后的求值重新绑定原始过程，折叠过的常量都不能再用
+        evaluator = Evaluator(bool_analyze=True, bool_optimize=True)
+        evaluator.eval(parse('(define (five) (+ 2 3))'))
+        evaluator.eval(parse('(define (+ a b) (* a b))'))
+        self.assertEqual(evaluator.eval(parse('(+ 2 3)')), Number(6))
+        self.assertEqual(evaluator.eval(parse('(five)')), Number(6))
+
+        evaluator = Evaluator(bool_analyze=True, bool_optimize=True)
+        evaluator.eval(parse('(define (pick) (if (< 1 2) 1 2))'))
+        evaluator.eval(parse('(set! < >)'))
+        self.assertEqual(evaluator.eval(parse('(pick)')), Number(2))
+
+    def test_redefined_after_inline(self):
+        evaluator = Evaluator(bool_analyze=True, bool_optimize=True)
+        evaluator.eval(parse('(begin (define (sq x) (* x x)) (define (f n) (sq (+ n 1))))'))
+        self.assertEqual(evaluator.eval(parse('(f 2)')), Number(9))
+        evaluator.eval(parse('(define (sq x) (+ x x))'))
+        self.assertEqual(evaluator.eval(parse('(f 2)')), Number(6))
+
+
+class TestClosure(unittest.TestCase):
+    def test_mutated_capture(self):
+        self.assertEqual(
+            evaluate(parse(
+                '(let ((counter (let ((n 0)) (lambda () (begin (set! n (+ n 1)) n))))) '
+                '(begin (counter) (counter)))'
+            )),
+            Number(2)
+        )
+
+    def test_flat_capture(self):
+        evaluator = Evaluator(bool_analyze=True)
+        proc = evaluator.eval(parse('((lambda (a b) (lambda (x) (+ x a))) 1 2)'))
+
+        self.assertEqual(proc.environment.frame.index, {'a': 0})
+        self.assertIs(proc.environment.frame.parent, evaluator.env.frame)
+
+
+class TestLoop(unittest.TestCase):
+    def test_named_let(self):
+        self.assertEqual(
+            evaluate(parse('(let loop ((i 0) (acc 0)) (if (= i 100000) acc (loop (+ i 1) (+ acc i))))')),
+            Number(4999950000)
+        )
+        self.assertTrue(analyze(parse('(let loop ((i 0)) (if (= i 3) i (loop (+ i 1))))')).is_loop)
+        self.assertFalse(analyze(parse('(let loop ((i 3)) (if (= i 0) 0 (+ 1 (loop (- i 1)))))')).is_loop)
+
+    def test_do(self):
+        self.assertEqual(
+            evaluate(parse('(do ((i 0 (+ i 1)) (acc (quote ()) (cons i acc))) ((= i 3) acc))')),
+            l([2, 1, 0])
+        )
+
+    def test_escaped_thunk(self):
+        # 循环体传给过程的 thunk 没有求值就被留下，之后仍要看到当时那一轮的绑定
+        program = """
+        (begin
+          (define (keep x) (lambda () x))
+          (define (keep-delay x) (delay x))
+          (list (let loop ((i 0) (acc '()))
+                  (if (= i 3) (map (lambda (f) (f)) acc) (loop (+ i 1) (cons (keep i) acc))))
+                (let loop ((i 0) (acc '()))
+                  (if (= i 3) (map force acc) (loop (+ i 1) (cons (keep-delay i) acc))))
+                (do ((i 0 (+ i 1)) (acc '() (cons (keep i) acc))) ((= i 3) (map (lambda (f) (f)) acc)))))
+        """
+        for bool_analyze, bool_optimize in ((False, False), (True, False), (True, True)):
+            self.assertEqual(Evaluator(bool_analyze, bool_optimize).eval(parse(program)),
+                             parse('((2 1 0) (2 1 0) (2 1 0))'))
+
+    def test_letrec(self):
+        self.assertEqual(
+            evaluate(parse('(letrec ((even? (lambda (n) (if (= n 0) #t (odd? (- n 1))))) '
+                           '(odd? (lambda (n) (if (= n 0) #f (even? (- n 1)))))) '
+                           '(even? 10))')),
+            Boolean(True)
+        )
+
+    def test_internal_define(self):
+        self.assertEqual(
+            evaluate(parse('((lambda (x) (define y (* x 2)) (define (g) (+ y 1)) (g)) 5)')),
+            Number(11)
+        )
+
+
+class TestStream(unittest.TestCase):
+    integers = '(let loop ((n 0)) (cons-stream n (loop (+ n 1))))'
+
+    def test_promise_is_memoized(self):
+        self.assertEqual(
+            evaluate(parse('(let ((n 0)) (let ((p (delay (begin (set! n (+ n 1)) n)))) '
+                           '(begin (force p) (force p) n)))')),
+            Number(1)
+        )
+
+    def test_infinite_stream(self):
+        for analyze_ in (True, False):
+            self.assertEqual(
+                Evaluator(analyze_).eval(parse(
+                    '(stream-take (stream-filter (lambda (x) (= (remainder x 2) 0)) '
+                    '(stream-map (lambda (x) (* x x)) {})) 3)'.format(self.integers)
+                )),
+                l([0, 4, 16])
+            )
+
+
+class TestEachLine(unittest.TestCase):
+    def test_each_line(self):
+        evaluator = Evaluator(bool_analyze=True)
+        procedure = evaluator.eval(parse('(lambda (line) (if (= line "skip") #f (list line)))'))
+        writer = io.StringIO()
+
+        n = evaluator.each_line(procedure, io.StringIO('a\nskip\nb'), writer)
+
+        self.assertEqual(n, 3)
+        self.assertEqual(writer.getvalue(), '("a")\n("b")\n')
+
+
+class TestPort(unittest.TestCase):
+    def test_read(self):
+        self.assertEqual(
+            evaluate(parse('(let ((p (open-input-string "(a 1) 2"))) (read p) (read p))')),
+            Number(2)
+        )
+
+    def test_file(self):
+        fd, path = tempfile.mkstemp()
+        os.close(fd)
+        self.addCleanup(os.remove, path)
+
+        evaluate(parse('(with-output-to-file "{}" (lambda () (write-string "a") (display 1)))'.format(path)))
+        for mode in ("'file", "'mmap"):
+            self.assertEqual(
+                evaluate(parse('(read-line (open-input-file "{}" {}))'.format(path, mode))),
+                String('a1')
+            )
+
+
+class TestPrinter(unittest.TestCase):
+    def test_write_and_display(self):
+        o = parse('(1 "ab" #(2 (3 . 4)))')
+        self.assertEqual(to_string(o), '(1 "ab" #(2 (3 . 4)))')
+        self.assertEqual(to_string(o, readable=False), '(1 ab #(2 (3 . 4)))')
+
+    def test_deep(self):
+        o = NIL
+        for _ in range(100000):
+            o = Pair(o, NIL)
+        self.assertEqual(len(to_string(o)), 200003)
+
+
+class TestSerialize(unittest.TestCase):
+    def test_round_trip(self):
+        o = parse('(define (f x) (f "s" 1.5 -300 #t (1 2 3) (4 . 5) #(1 2) #(a "b") x))')
+        self.assertEqual(loads(dumps(o)), o)
+
+    def test_primitive(self):
+        fd, path = tempfile.mkstemp()
+        os.close(fd)
+        self.addCleanup(os.remove, path)
+
+        evaluate(parse('(serialize (list 1 (quote a) "b") "{}")'.format(path)))
+        self.assertEqual(evaluate(parse('(deserialize "{}")'.format(path))), l([1, 'a', Str('b')]))
+
+
+class TestCompactList(unittest.TestCase):
+    def test_parsed_list(self):
+        o = parse('(1 2 (3 4) 5)')
+        self.assertIsInstance(o, CompactList)
+        self.assertEqual(o, l([1, 2, [3, 4], 5]))
+        self.assertEqual(hash(o), hash(l([1, 2, [3, 4], 5])))
+        self.assertEqual(list_length(o), 4)
+        self.assertEqual(list_tail(o, 3).car, Number(5))
+
+    def test_mutate(self):
+        self.assertEqual(evaluate(parse("""
+        (begin
+          (define x '(1 2 3 4))
+          (define y (cdr x))
+          (set-car! y 'a)
+          (set-cdr! y '(b))
+          (list x y (length x) (list-ref x 2)))
+        """)), parse("((1 a b) (a b) 3 b)"))
+
+    def test_long(self):
+        o = parse('(' + ' '.join(['1'] * 100000) + ')')
+        self.assertEqual(evaluate(parse('(length (quote {}))'.format(o))), Number(100000))
+
+    def test_many_set_cdr(self):
+        # 每隔一个位置 set-cdr! 一次，之后按段遍历仍是线性的
+        n = 20000
+        o = compact_list([Number(i) for i in range(n)])
+        for i in range(0, n - 1, 2):
+            CompactList(o.cells, i).cdr = CompactList(o.cells, i + 1)
+        self.assertEqual(list_length(o), n)
+        self.assertEqual(o, compact_list([Number(i) for i in range(n)]))
+
+
+class TestHashCons(unittest.TestCase):
+    def setUp(self):
+        hashcons.config.enabled = True
+        self.addCleanup(setattr, hashcons.config, 'enabled', False)
+
+    def test_share(self):
+        o = parse('((1 "a" (x 2.5)) (1 "a" (x 2.5)) 1.0 -0.0 0.0)')
+        self.assertIs(o.car, o.cdr.car)
+        self.assertIsNot(list_tail(o, 2).car, o.car.car)
+        self.assertEqual(to_string(o), '((1 "a" (x 2.5)) (1 "a" (x 2.5)) 1.0 -0.0 0.0)')
+
+    def test_constant(self):
+        with self.assertRaises(TypeError):
+            evaluate(parse("(set-car! '(1 2) 3)"))
+
+    def test_empty_vector_hash(self):
+        # 空向量排在别的元素之后，哈希不能吞掉前面已经算好的哈希；冻结的表缓存的哈希必须和位置无关
+        a = parse('(#())')
+        b = parse('(0 (#()))')
+        self.assertEqual(hash(a), hash(b.cdr.car))
+        self.assertEqual(hash(compact_list([Number(0), Vector([])])), hash(Pair(Number(0), Pair(Vector([]), NIL))))
+        self.assertEqual(evaluate(parse("""
+        (let ((t (make-hash-table)) (a '(#())) (b '(0 (#()))))
+          (hash-table-set! t b 1)
+          (hash-table-set! t a 2)
+          (list (equal? a (car (cdr b))) (hash-table-ref t (car (cdr b)) (lambda () 99))))
+        """)), parse('(#t 2)'))
+
+    def test_disabled(self):
+        hashcons.config.enabled = False
+        o = parse('((1 2) (1 2))')
+        self.assertIsNot(o.car, o.cdr.car)
+
+
+class TestEquality(unittest.TestCase):
+    def test_predicates(self):
+        self.assertEqual(evaluate(parse("""
+        (let ((x (list 1 2)))
+          (list (eq? 'a 'a) (eq? x x) (eq? (list 1) (list 1))
+                (eqv? 2 2) (eqv? 2 2.0) (eqv? "a" "a")
+                (equal? (list 1 "a" (vector 2 3)) (list 1 "a" (vector 2 3))) (equal? (list 1) (list 1.0))))
+        """)), parse('(#t #t #f #t #f #f #t #f)'))
+
+    def test_compact_tail(self):
+        # 读入的表是紧凑列表，每次取 cdr 得到新的视图，共享的尾部仍然 eq
+        self.assertEqual(evaluate(parse("""
+        (let ((l '(1 2 3)) (m (list 1 2 3)))
+          (list (eq? (cdr l) (cdr l)) (eqv? (cdr l) (cdr l)) (eq? (cdr m) (cdr m))
+                (eq? l (cdr l)) (eq? (cdr l) (cdr '(1 2 3)))))
+        """)), parse('(#t #t #t #f #f)'))
+
+    def test_long(self):
+        elements = [compact_list([Number(1), String('x')]) for _ in range(100000)]
+        a = compact_list(elements)
+        b = NIL
+        for e in reversed(elements):
+            b = Pair(e, b)
+        self.assertTrue(is_equal(a, b))
+        self.assertEqual(hash(a), hash(b))
+        self.assertFalse(is_equal(a, Pair(Number(0), b)))
+
+
+class TestPersistent(unittest.TestCase):
+    def test_map(self):
+        self.assertEqual(evaluate(parse("""
+        (let ((a (pmap 'x 1 'y 2)))
+          (let ((b (pmap-set a 'x 10)))
+            (let ((c (pmap-update (pmap-delete b 'y) 'z (lambda (v) (+ v 1)) 0)))
+              (list (pmap-ref a 'x) (pmap-ref b 'x) (pmap-count c) (pmap-ref c 'z)
+                    (pmap-contains? c 'y) (pmap-ref c 'y 'none)
+                    (pmap-fold (lambda (k v acc) (+ v acc)) 0 b)))))
+        """)), parse('(1 10 2 1 #f none 12)'))
+
+    def test_vector(self):
+        self.assertEqual(evaluate(parse("""
+        (let ((a (list->pvector (list 1 2 3))))
+          (let ((b (pvector-push (pvector-set a 0 'x) 4)))
+            (list (pvector->list a) (pvector->list b) (pvector-length (pvector-pop b))
+                  (pvector-fold + 0 a))))
+        """)), parse('((1 2 3) (x 2 3 4) 3 6)'))
+
+    def test_sharing(self):
+        m = PersistentMap()
+        versions = []
+        for i in range(2000):
+            m = m.assoc(Number(i), Number(i * i))
+            versions.append(m)
+        self.assertEqual(versions[99].length(), 100)
+        self.assertIsNone(versions[99].get(Number(100)))
+        self.assertEqual(m.get(Number(1999)), Number(1999 * 1999))
+
+        v = PersistentVector.from_items([Number(i) for i in range(5000)])
+        w = v.set(1234, Number(-1))
+        self.assertEqual(v.ref(1234), Number(1234))
+        self.assertEqual(w.ref(1234), Number(-1))
+        self.assertIs(v.tail, w.tail)
+
+
+class TestString(unittest.TestCase):
+    def test_primitives(self):
+        self.assertEqual(evaluate(parse("""
+        (let ((s (string-append "hello" ", " "world")))
+          (list s (string-length s) (substring s 7) (substring (substring s 2 9) 1 3) (string-ref s 4)
+                (string->symbol "abc") (number->string 255 16)
+                (string-split " a  b c ") (string-split "a,b,,c" ",") (string-join (list "x" "y" "z") "-")))
+        """)), parse('("hello, world" 12 "world" "lo" "o" abc "ff" ("a" "b" "c") ("a" "b" "" "c") "x-y-z")'))
+
+    def test_builder(self):
+        self.assertEqual(evaluate(parse("""
+        (let ((b (make-string-builder)))
+          (do ((i 0 (+ i 1))) ((= i 3) (list (string-builder-length b) (string-builder->string b)))
+            (string-builder-append! b (number->string i) ",")))
+        """)), parse('(6 "0,1,2,")'))
+
+    def test_deep_rope(self):
+        s = String('')
+        for _ in range(100000):
+            s = String.concat([s, String('ab')])
+        self.assertEqual(s.length(), 200000)
+        self.assertEqual(s.substring(199998, 200000).value, 'ab')
+        self.assertEqual(s, String('ab' * 100000))
+
+
+class TestBytevector(unittest.TestCase):
+    def test_accessors(self):
+        self.assertEqual(evaluate(parse("""
+        (let ((b (make-bytevector 8)))
+          (bytevector-u16-set! b 0 513)
+          (bytevector-s32-set! b 2 -2 'little)
+          (let ((s (bytevector-slice b 4 8)))
+            (bytevector-u8-set! s 3 7)
+            (list (bytevector-u8-ref b 0) (bytevector-u16-ref b 0 'little) (bytevector-s32-ref b 2 'little)
+                  (bytevector-length s) (bytevector->u8-list b) (utf8->string (string->utf8 "abc")))))
+        """)), parse('(2 258 -2 4 (2 1 254 255 255 255 0 7) "abc")'))
+
+    def test_out_of_range(self):
+        for expression in ('(bytevector-u8-ref (bytevector 1 2 3) -1)', '(bytevector-u8-ref (bytevector 1 2 3) 3)',
+                           '(bytevector-u8-set! (bytevector 1 2 3) -1 9)', '(bytevector-u16-ref (bytevector 1 2 3) -2)',
+                           '(bytevector-u16-ref (bytevector 1 2 3) 2)', '(bytevector-u32-set! (bytevector 1 2 3) 0 1)',
+                           '(bytevector-copy (bytevector 1 2 3) -1)'):
+            with self.assertRaises(IndexError):
+                evaluate(parse(expression))
+        self.assertEqual(evaluate(parse('(bytevector-u16-ref (bytevector 1 2 3) 1)')), Number(0x0203))
+
+    def test_file(self):
+        fd, path = tempfile.mkstemp()
+        os.close(fd)
+        self.addCleanup(os.remove, path)
+
+        evaluate(parse('(bytevector->file (bytevector 1 2 3 4 5) "{}")'.format(path)))
+        for mode in ('file', 'mmap'):
+            self.assertEqual(
+                evaluate(parse("(bytevector->u8-list (bytevector-slice (file->bytevector \"{}\" '{}) 1 4))".format(
+                    path, mode))),
+                l([2, 3, 4]))
+        with self.assertRaises(TypeError):
+            evaluate(parse("(bytevector-u8-set! (file->bytevector \"{}\" 'mmap) 0 9)".format(path)))
+
+    def test_serialize(self):
+        o = evaluate(parse('(list (bytevector 0 255) 1)'))
+        self.assertEqual(loads(dumps(o)), o)
+
+
+class TestRecord(unittest.TestCase):
+    program = """
+    (begin
+      (define-record-type point (make-point x y) point? (x point-x set-point-x!) (y point-y))
+      (define (make-counter)
+        (define-record-type cell (make-cell) cell? (value cell-value set-cell-value!))
+        (define c (make-cell))
+        (set-cell-value! c 0)
+        (lambda () (set-cell-value! c (+ (cell-value c) 1)) (cell-value c)))
+      (define p (make-point 1 2))
+      (define counter (make-counter))
+      (set-point-x! p 10)
+      (counter)
+      (list (point-x p) (point-y p) (point? p) (point? (list 1 2)) (counter)))
+    """
+
+    def test_record(self):
+        for bool_analyze in (False, True):
+            self.assertEqual(Evaluator(bool_analyze).eval(parse(self.program)), parse('(10 2 #t #f 2)'))
+
+    def test_slots(self):
+        p = evaluate(parse('(begin (define-record-type p (make-p a) p? (a p-a)) (make-p 1))'))
+        self.assertFalse(hasattr(p, '__dict__'))
+        with self.assertRaises(TypeError):
+            evaluate(parse('(begin (define-record-type q (make-q a) q? (a q-a)) (q-a 1))'))
+
+
+class TestFFI(unittest.TestCase):
+    def test_call(self):
+        program = """
+        (begin
+          (define math (py-import "math"))
+          (define builtins (py-import "builtins"))
+          (define sqrt (py-getattr math "sqrt"))
+          (list (sqrt 16) (py-call (py-getattr math "floor") 2.5) (py-getattr math "pi")
+                (py-call (py-getattr builtins "sorted") (list 3 1 2))
+                ((py-getattr builtins "list") ((py-getattr builtins "map") (lambda (x) (* x x)) (list 1 2 3)))))
+        """
+        for bool_analyze in (False, True):
+            result = Evaluator(bool_analyze).eval(parse(program))
+            self.assertEqual(list_to_pylist(result), [Number(4.0), Number(2), Number(math.pi), parse('(1 2 3)'),
+                                                      parse('(1 4 9)')])
+
+    def test_zero_copy(self):
+        program = """
+        (begin
+          (define b (make-bytevector 4 0))
+          (py-call (py-getattr (py-import "struct") "pack_into") ">I" b 0 258)
+          b)
+        """
+        for bool_analyze in (False, True):
+            self.assertEqual(Evaluator(bool_analyze).eval(parse(program)).view.tobytes(), b'\x00\x00\x01\x02')
+
+    def test_primitive_decorator(self):
+        from pyl.ffi import primitive, registered
+
+        @primitive('py-test-add', (1, 2))
+        def add(a, b=10):
+            return a + b
+
+        try:
+            for bool_analyze in (False, True):
+                self.assertEqual(Evaluator(bool_analyze).eval(parse('(list (py-test-add 1) (py-test-add 1 2))')),
+                                 parse('(11 3)'))
+                with self.assertRaises(TypeError):
+                    Evaluator(bool_analyze).eval(parse('(py-test-add 1 2 3)'))
+        finally:
+            registered.pop()
+
+
+class TestEscapeContinuation(unittest.TestCase):
+    program = """
+    (begin
+      (define (find-first pred lst)
+        (let/ec return
+          (define (walk l)
+            (if (eq? l '()) #f
+                (begin (if (pred (car l)) (return (car l)) #f) (walk (cdr l)))))
+          (walk lst)))
+      (list (find-first (lambda (x) (> x 3)) '(1 2 5 6))
+            (find-first (lambda (x) (> x 30)) '(1 2 5 6))
+            (call/ec (lambda (k) (+ 1 (k 42))))
+            (call-with-escape-continuation (lambda (k) 5))
+            (let/ec outer (+ 1 (let/ec inner (outer 10))))
+            (let/ec outer (+ 1 (let/ec inner (inner 10))))
+            (let loop ((i 0)) (if (= i 5) i (let/ec k (loop (+ i 1)))))
+            (let loop ((i 0) (esc #f)) (if (= i 3) (esc 'escaped) (let/ec k (loop (+ i 1) (if esc esc k)))))))
+    """
+
+    def test_escape(self):
+        for bool_analyze, bool_optimize in ((False, False), (True, False), (True, True)):
+            self.assertEqual(Evaluator(bool_analyze, bool_optimize).eval(parse(self.program)),
+                             parse('(5 #f 42 5 10 11 5 escaped)'))
+
+    def test_extent(self):
+        for bool_analyze in (False, True):
+            evaluator = Evaluator(bool_analyze)
+            evaluator.eval(parse('(begin (define saved #f) (define x (let/ec k (set! saved k) 1)))'))
+            with self.assertRaises(RuntimeError):
+                evaluator.eval(parse('(saved 2)'))
+            self.assertEqual(evaluator.eval(parse('x')), Number(1))
+
+
+class TestListLibrary(unittest.TestCase):
+    def test_map(self):
+        self.assertEqual(
+            evaluate(
+                l(['map', ['lambda', ['x'], ['*', 'x', 'x']], ['list', 1, 2, 3]])
+            ),
+            l([1, 4, 9])
+        )
+
+    def test_fold_left(self):
+        self.assertEqual(
+            evaluate(
+                l(['fold-left', '-', 0, ['list', 1, 2, 3]])
+            ),
+            Number(-6)
+        )
+
+    def test_sort(self):
+        self.assertEqual(
+            evaluate(
+                l(['sort', ['list', 3, 1, 2], ['lambda', ['a', 'b'], ['>', 'a', 'b']]])
+            ),
+            l([3, 2, 1])
+        )
+
+
+class TestHashTable(unittest.TestCase):
+    def test_pair_key(self):
+        self.assertEqual(
+            evaluate(
+                l(['let', [['h', ['make-hash-table']]],
+                   ['begin',
+                    ['hash-table-set!', 'h', ['list', 1, 2], 3],
+                    ['hash-table-ref', 'h', ['list', 1, 2]]]])
+            ),
+            Number(3)
+        )
+
+    def test_update(self):
+        self.assertEqual(
+            evaluate(
+                l(['let', [['h', ['make-hash-table']]],
+                   ['begin',
+                    ['hash-table-update!', 'h', ['quote', 'a'], ['lambda', ['v'], ['+', 'v', 1]], ['lambda', [], 0]],
+                    ['hash-table-update!', 'h', ['quote', 'a'], ['lambda', ['v'], ['+', 'v', 1]]],
+                    ['hash-table-ref', 'h', ['quote', 'a']]]])
+            ),
+            Number(2)
+        )
+
+
+class TestVector(unittest.TestCase):
+    def test_literal(self):
+        self.assertEqual(
+            evaluate(parse('#(1 "a" (2 3))')),
+            Vector([Number(1), String('a'), l([2, 3])])
+        )
+
+    def test_set_and_ref(self):
+        self.assertEqual(
+            evaluate(
+                parse('(let ((v (make-vector 3 0))) (begin (vector-set! v 1 (quote x)) (vector->list v)))')
+            ),
+            l([0, 'x', 0])
+        )
+
+    def test_out_of_range(self):
+        for expression in ('(vector-ref (vector 1 2) -1)', '(vector-ref (vector 1 2) 2)',
+                           '(vector-set! (vector 1 2) -1 0)', '(vector-ref (vector 1 (quote a)) -1)'):
+            with self.assertRaises(IndexError):
+                evaluate(parse(expression))
+
+
+@unittest.skipUnless(numpy, 'numpy is not installed')
+class TestNumericArray(unittest.TestCase):
+    def test_elementwise(self):
+        self.assertEqual(
+            evaluate(
+                parse('(array->list (array+ (list->array (list 1 2 3)) (vector->array #(10 20 30)) 1))')
+            ),
+            l([12, 23, 34])
+        )
+
+    def test_slice_sum(self):
+        self.assertEqual(
+            evaluate(parse('(array-sum (array-slice (list->array (list 1 2 3 4)) 1 3))')),
+            Number(5)
+        )